@@ -5,6 +5,7 @@ Init file that organizes the base level imports
 
 from pkg_resources import DistributionNotFound, get_distribution
 
+from .engine import *
 from .messaging import *
 from .misc import *
 from .ml_wrapper import MLWrapper
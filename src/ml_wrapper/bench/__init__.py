@@ -0,0 +1,5 @@
+"""
+The bench module provides benchmarks and synthetic payloads to measure the ML Wrapper
+"""
+
+from .payloads import analyse_result_payload, sensor_update_payload
@@ -0,0 +1,6 @@
+"""
+Runs the pipeline benchmark with python -m ml_wrapper.bench
+"""
+from .pipeline import main
+
+main()
@@ -0,0 +1,201 @@
+"""
+This module provides an in-process stand-in of an MQTT broker. The InProcessClient offers the
+surface of the paho Client, which the ML Wrapper uses, so a tool and a load generator can
+exchange messages within one process without a broker installed.
+
+Like a real broker, every client has a bounded queue of messages to deliver, which is worked off
+by its own thread like the network thread of paho. Messages arriving at a full queue are
+dropped and counted, so the saturation point of a tool becomes visible.
+"""
+import itertools
+import queue
+import threading
+from typing import Dict, List, Optional, Union
+
+import paho.mqtt.client as mqtt
+from paho.mqtt.properties import Properties
+
+
+class InProcessBroker:
+    """Routes published messages to the subscribed clients and keeps retained messages"""
+
+    def __init__(self, max_queued: int = 1000):
+        """
+        Constructor of the InProcessBroker
+        @param max_queued: maximum number of messages queued for a client
+        """
+        assert max_queued >= 1, "The broker has to queue at least one message"
+        self.max_queued = max_queued
+        self._clients: List["InProcessClient"] = []
+        self._retained: Dict[str, mqtt.MQTTMessage] = {}
+        self._lock = threading.Lock()
+        self.routed = 0
+        self.dropped = 0
+
+    def attach(self, client: "InProcessClient"):
+        """Connects a client"""
+        with self._lock:
+            if client not in self._clients:
+                self._clients.append(client)
+
+    def detach(self, client: "InProcessClient"):
+        """Disconnects a client"""
+        with self._lock:
+            if client in self._clients:
+                self._clients.remove(client)
+
+    def retained(self, subscription: str) -> List[mqtt.MQTTMessage]:
+        """Returns the retained messages matching a subscription"""
+        with self._lock:
+            return [
+                message
+                for topic, message in self._retained.items()
+                if mqtt.topic_matches_sub(subscription, topic)
+            ]
+
+    def route(self, message: mqtt.MQTTMessage):
+        """
+        Hands a published message to every client with a matching subscription
+        @param message: paho MQTTMessage
+        """
+        with self._lock:
+            if message.retain:
+                if message.payload:
+                    self._retained[message.topic] = message
+                else:
+                    self._retained.pop(message.topic, None)
+            clients = [client for client in self._clients if client.matches(message)]
+            self.routed += 1
+        for client in clients:
+            if not client.deliver(message):
+                with self._lock:
+                    self.dropped += 1
+
+
+# The stand-in mirrors the arguments of the paho Client
+# pylint: disable=unused-argument,too-many-instance-attributes
+class InProcessClient:
+    """
+    Stand-in of the paho Client, which is connected to an InProcessBroker. The callbacks
+    on_message and on_publish are called with the arguments of the paho callback API version 1.
+    """
+
+    def __init__(self, broker: InProcessBroker, userdata=None):
+        self.broker = broker
+        self.on_message = None
+        self.on_publish = None
+        self.subscriptions: Dict[str, int] = {}
+        self._userdata = userdata
+        self._queue: "queue.Queue[Optional[mqtt.MQTTMessage]]" = queue.Queue(
+            maxsize=broker.max_queued
+        )
+        self._mids = itertools.count(1)
+        self._connected = False
+        self._thread: Optional[threading.Thread] = None
+
+    def connect(self, *args, **kwargs) -> int:
+        """Connects to the broker"""
+        self.broker.attach(self)
+        self._connected = True
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def connect_async(self, *args, **kwargs):
+        """Connects to the broker"""
+        self.connect()
+
+    def disconnect(self, *args, **kwargs) -> int:
+        """Disconnects from the broker"""
+        self.broker.detach(self)
+        self._connected = False
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def is_connected(self) -> bool:
+        """Returns true while connected to the broker"""
+        return self._connected
+
+    def loop_start(self) -> int:
+        """Starts the thread delivering the received messages"""
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._loop, name="InProcessClient", daemon=True
+            )
+            self._thread.start()
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def loop_stop(self, *args) -> int:
+        """Stops the delivering thread after the queued messages"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def _loop(self):
+        while True:
+            message = self._queue.get()
+            if message is None:
+                return
+            if self.on_message is not None:
+                self.on_message(self, self._userdata, message)
+
+    def subscribe(self, topic: str, qos: int = 0, **kwargs) -> tuple:
+        """Subscribes to a topic and receives its retained messages"""
+        self.subscriptions[topic] = qos
+        for message in self.broker.retained(topic):
+            self.deliver(message)
+        return mqtt.MQTT_ERR_SUCCESS, next(self._mids)
+
+    def unsubscribe(self, topic: str, *args, **kwargs) -> tuple:
+        """Removes the subscription of a topic"""
+        self.subscriptions.pop(topic, None)
+        return mqtt.MQTT_ERR_SUCCESS, next(self._mids)
+
+    def matches(self, message: mqtt.MQTTMessage) -> bool:
+        """Returns true, if any subscription of the client matches the topic of the message"""
+        return any(
+            mqtt.topic_matches_sub(subscription, message.topic)
+            for subscription in self.subscriptions
+        )
+
+    def deliver(self, message: mqtt.MQTTMessage) -> bool:
+        """
+        Queues a message for the on_message callback
+        @return: bool, false if the queue is full and the message is dropped
+        """
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            return False
+        return True
+
+    @property
+    def queued(self) -> int:
+        """Number of received messages waiting for delivery"""
+        return self._queue.qsize()
+
+    # pylint: disable=too-many-arguments
+    def publish(
+        self,
+        topic: str,
+        payload: Union[str, bytes, None] = None,
+        qos: int = 0,
+        retain: bool = False,
+        properties: Optional[Properties] = None,
+    ) -> mqtt.MQTTMessageInfo:
+        """Publishes a message to the broker, which acknowledges it right away"""
+        mid = next(self._mids)
+        info = mqtt.MQTTMessageInfo(mid)
+        if not self._connected:
+            info.rc = mqtt.MQTT_ERR_NO_CONN
+            return info
+        message = mqtt.MQTTMessage(mid, topic.encode("utf-8"))
+        message.payload = (
+            payload.encode("utf-8") if isinstance(payload, str) else payload or b""
+        )
+        message.qos = qos
+        message.retain = retain
+        message.properties = properties
+        self.broker.route(message)
+        if self.on_publish is not None:
+            self.on_publish(self, self._userdata, mid)
+        return info
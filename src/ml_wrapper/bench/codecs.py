@@ -0,0 +1,322 @@
+"""
+This module provides micro benchmarks of the codec functions every message passes, measured
+over a matrix of sizes and column types. The times are stored relative to a calibration
+workload, so a baseline recorded on one machine can be compared on another one. Together with
+the peak of the memory allocated per call, the results are compared against a stored baseline
+to find regressions. The baseline records the packages and backends it was measured with, as the
+results are only comparable in the same environment, one baseline is stored per environment.
+
+Usage: python -m ml_wrapper.bench.codecs [--baseline codec_baseline.json] [--update]
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import jsonschema
+import numpy as np
+import pandas as pd
+
+from ..messaging import (
+    IncomingMessage,
+    OutgoingMessage,
+    VALIDATOR_REGISTRY,
+    decode_data_frame,
+    resolve_data_frame,
+    retrieve_dataframe,
+    retrieve_sensor_update_data,
+    validate_formal_single,
+    validate_trigger,
+)
+from ..misc import JSON_CODEC, ResultType, generate_mqtt_message_mock
+from .payloads import analyse_result_payload, sensor_update_payload
+
+BASELINE_FORMAT = 3
+SIZES = (100, 1000)
+COLUMN_TYPES = ("number", "rfctime", "string")
+COLUMNS = 4
+# Every repetition runs the function for at least this many seconds
+MIN_REPEAT_SECONDS = 0.005
+REPEAT = 5
+# Allocation differences below this many bytes are never a regression
+MEMORY_SLACK_BYTES = 64 * 1024
+
+
+def _out_message(rows: int, column_type: str) -> OutgoingMessage:
+    in_message = IncomingMessage(logger=logging.getLogger(__name__))
+    in_message.mqtt_message = generate_mqtt_message_mock(
+        message=JSON_CODEC.dumps(
+            sensor_update_payload(rows, COLUMNS, types=(column_type,))
+        )
+    )
+    return OutgoingMessage(
+        in_message,
+        from_="bench",
+        model_url="bench",
+        model_tag="bench",
+        temporary_keyword="temporary",
+    )
+
+
+def _cases(rows: int, column_type: str) -> Dict[str, Callable[[], object]]:
+    """Returns the benchmarked calls for one size and column type"""
+    types = (column_type,)
+    trigger = sensor_update_payload(rows, COLUMNS, types=types)
+    sensor_update = trigger["body"]["payload"]["body"]
+    analyse_result = analyse_result_payload(rows, COLUMNS, types=types)
+    results = analyse_result["body"]["payload"]["body"]["results"]
+    formal = analyse_result["body"]["payload"]
+    frame = decode_data_frame(sensor_update["columns"], sensor_update["data"])
+    out_message = _out_message(rows, column_type)
+    return {
+        "retrieve_dataframe": lambda: retrieve_dataframe(results),
+        "retrieve_sensor_update_data": lambda: retrieve_sensor_update_data(
+            sensor_update
+        ),
+        "resolve_data_frame": lambda: resolve_data_frame(frame),
+        "validate_trigger": lambda: validate_trigger(trigger),
+        "validate_formal_single": lambda: validate_formal_single(formal),
+        "set_results": lambda: out_message.set_results(
+            frame, result_type=ResultType.TIME_SERIES
+        ),
+    }
+
+
+def case_name(function: str, column_type: str, rows: int) -> str:
+    """Returns the name of a benchmark case"""
+    return "{}[{}-{}]".format(function, column_type, rows)
+
+
+def _seconds_per_call(call: Callable[[], object]) -> float:
+    """Returns the fastest time per call out of REPEAT repetitions"""
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            call()
+        if time.perf_counter() - start >= MIN_REPEAT_SECONDS:
+            break
+        loops *= 2
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        for _ in range(loops):
+            call()
+        timings.append((time.perf_counter() - start) / loops)
+    return min(timings)
+
+
+def _peak_bytes(call: Callable[[], object]) -> int:
+    """Returns the peak of the memory allocated during one call"""
+    # Starting the tracing resets the peak, tracemalloc.reset_peak requires python 3.9
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        call()
+        return tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+
+
+def calibrate() -> float:
+    """
+    Measures a fixed workload of json and numpy operations. Benchmark times are divided by it
+    to make them comparable between machines.
+    @return: float, seconds
+    """
+    values = [str(index * 0.5) for index in range(10000)]
+    text = json.dumps(values)
+
+    def workload():
+        np.asarray(json.loads(text), dtype=np.float64).astype(str).tolist()
+
+    return _seconds_per_call(workload)
+
+
+def environment() -> dict:
+    """Returns the versions and backends, which the results of the codecs depend on"""
+    return {
+        "python": ".".join(platform.python_version_tuple()[:2]),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "jsonschema": jsonschema.__version__,
+        "json_backend": JSON_CODEC.backend,
+        "validation_backend": VALIDATOR_REGISTRY.backend,
+    }
+
+
+def benchmark_codecs(
+    names: Optional[Sequence[str]] = None,
+    sizes: Sequence[int] = SIZES,
+    column_types: Sequence[str] = COLUMN_TYPES,
+) -> dict:
+    """
+    Measures the codec functions
+    @param names: optional names of the cases to measure, all cases by default
+    @param sizes: the numbers of rows
+    @param column_types: the column types out of number, rfctime and string
+    @return: dict of the environment, the calibration and the relative time and peak bytes per
+    case
+    """
+    timings = {}
+    peaks = {}
+    # The calibration is repeated between the cases and the fastest one is used, so a slow
+    # phase of the machine doesn't shift all results
+    calibrations = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for rows in sizes:
+            for column_type in column_types:
+                calibrations.append(calibrate())
+                for function, call in _cases(rows, column_type).items():
+                    name = case_name(function, column_type, rows)
+                    if names is not None and name not in names:
+                        continue
+                    call()
+                    timings[name] = _seconds_per_call(call)
+                    peaks[name] = _peak_bytes(call)
+        calibrations.append(calibrate())
+    finally:
+        if gc_enabled:
+            gc.enable()
+    calibration = min(calibrations)
+    results = {
+        name: {"relative_time": seconds / calibration, "peak_bytes": peaks[name]}
+        for name, seconds in timings.items()
+    }
+    return {
+        "environment": environment(),
+        "calibration_seconds": calibration,
+        "results": results,
+    }
+
+
+def compare(
+    current: dict,
+    baseline: dict,
+    time_tolerance: float = 0.5,
+    memory_tolerance: float = 0.25,
+) -> List[Tuple[str, str]]:
+    """
+    Compares benchmark results with a baseline. Cases missing in the baseline are skipped.
+    @param current: the result of benchmark_codecs
+    @param baseline: the stored result of benchmark_codecs
+    @param time_tolerance: fraction a case may become slower, e.g. 0.5 for 50%
+    @param memory_tolerance: fraction a case may allocate more
+    @return: list of the names and descriptions of the regressions
+    """
+    regressions = []
+    for name, result in current["results"].items():
+        reference = baseline["results"].get(name)
+        if reference is None:
+            continue
+        slower = result["relative_time"] / reference["relative_time"] - 1
+        if slower > time_tolerance:
+            regressions.append((name, "{:.0%} slower than the baseline".format(slower)))
+        allocated = result["peak_bytes"] - reference["peak_bytes"]
+        if (
+            allocated > MEMORY_SLACK_BYTES
+            and allocated > memory_tolerance * reference["peak_bytes"]
+        ):
+            regressions.append(
+                (
+                    name,
+                    "allocates {} bytes more than the baseline of {} bytes".format(
+                        allocated, reference["peak_bytes"]
+                    ),
+                )
+            )
+    return regressions
+
+
+def load_baseline(path: str, environment_: Optional[dict] = None) -> Optional[dict]:
+    """
+    Reads the baseline of an environment out of a file of stored baselines
+    @param path: path of the json file
+    @param environment_: the environment of the baseline, the running one by default
+    @return: dict or None, if no baseline of the environment is stored
+    """
+    environment_ = environment() if environment_ is None else environment_
+    for baseline in _load_baselines(path):
+        if baseline["environment"] == environment_:
+            return baseline
+    return None
+
+
+def _load_baselines(path: str) -> List[dict]:
+    with open(path, "r", encoding="utf-8") as file:
+        stored = json.load(file)
+    assert (
+        stored.get("format") == BASELINE_FORMAT
+    ), "The baseline {} has an unknown format".format(path)
+    return stored["baselines"]
+
+
+def store_baseline(results: dict, path: str):
+    """
+    Stores benchmark results as baseline of their environment. The baselines of other
+    environments in the file are kept.
+    @param results: the result of benchmark_codecs
+    @param path: path of the json file
+    """
+    baselines = [
+        baseline
+        for baseline in (_load_baselines(path) if os.path.exists(path) else [])
+        if baseline["environment"] != results["environment"]
+    ]
+    baselines.append(results)
+    baselines.sort(key=lambda baseline: json.dumps(baseline["environment"]))
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(
+            {"format": BASELINE_FORMAT, "baselines": baselines},
+            file,
+            indent=2,
+            sort_keys=True,
+        )
+        file.write("\n")
+
+
+def main():
+    """Runs the codec benchmarks, prints them as json and compares them with a baseline"""
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n", maxsplit=1)[0].strip()
+    )
+    parser.add_argument("--baseline", help="json file of the baseline")
+    parser.add_argument(
+        "--update", action="store_true", help="stores the results as baseline"
+    )
+    parser.add_argument("--time-tolerance", type=float, default=0.5)
+    parser.add_argument("--memory-tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+    results = benchmark_codecs()
+    print(json.dumps(results, indent=2, sort_keys=True))
+    if args.baseline and args.update:
+        store_baseline(results, args.baseline)
+    elif args.baseline:
+        baseline = load_baseline(args.baseline, results["environment"])
+        if baseline is None:
+            print(
+                "No baseline was measured in {}".format(results["environment"]),
+                file=sys.stderr,
+            )
+            sys.exit(0)
+        regressions = compare(
+            results,
+            baseline,
+            args.time_tolerance,
+            args.memory_tolerance,
+        )
+        for name, description in regressions:
+            print("{}: {}".format(name, description), file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
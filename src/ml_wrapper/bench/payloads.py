@@ -0,0 +1,87 @@
+"""
+This module generates synthetic trigger payloads of configurable size from the bundled json
+examples
+"""
+import copy
+import datetime
+from typing import Callable, Dict, List, Sequence
+
+from ..messaging.json_handling.json_provider import (
+    JSON_ML_ANALYSE_MULTIPLE_TIME_SERIES,
+    JSON_ML_ANALYSE_TIME_SERIES,
+    JSON_ML_DATA_EXAMPLE,
+)
+
+START_TIME = datetime.datetime(2020, 1, 20, 10, 10, tzinfo=datetime.timezone.utc)
+
+VALUE_GENERATORS: Dict[str, Callable[[int], str]] = {
+    "number": lambda row: str(row * 0.5),
+    "rfctime": lambda row: (START_TIME + datetime.timedelta(seconds=row)).isoformat(),
+    "string": lambda row: "value-{}".format(row % 100),
+}
+
+
+def _columns_and_data(rows: int, types: Sequence[str], meta: bool) -> (list, list):
+    assert all(
+        type_ in VALUE_GENERATORS for type_ in types
+    ), "Types have to be any of {}".format(list(VALUE_GENERATORS))
+    columns = []
+    data = []
+    for index, type_ in enumerate(types):
+        column = {"name": "column_{}".format(index), "type": type_}
+        if meta:
+            column["meta"] = {"unit": "", "description": "synthetic"}
+        columns.append(column)
+        data.append([VALUE_GENERATORS[type_](row) for row in range(rows)])
+    return columns, data
+
+
+def _types(columns: int, types: Sequence[str]) -> List[str]:
+    return [types[index % len(types)] for index in range(columns)]
+
+
+def sensor_update_payload(
+    rows: int, columns: int = 2, types: Sequence[str] = ("number",)
+) -> dict:
+    """
+    Creates a sensor_update trigger based on the bundled data example
+    @param rows: number of rows of the data
+    @param columns: number of columns of the data
+    @param types: column types, which are repeated over the columns
+    @return: dict
+    """
+    payload = copy.deepcopy(JSON_ML_DATA_EXAMPLE)
+    body = payload["body"]["payload"]["body"]
+    body["columns"], body["data"] = _columns_and_data(
+        rows, _types(columns, types), meta=True
+    )
+    return payload
+
+
+def analyse_result_payload(
+    rows: int, columns: int = 2, series: int = 1, types: Sequence[str] = ("number",)
+) -> dict:
+    """
+    Creates an analyse_result trigger based on the bundled time series examples. For more than
+    one series, a multiple_time_series result is created.
+    @param rows: number of rows of each series
+    @param columns: number of columns of each series
+    @param series: number of series
+    @param types: column types, which are repeated over the columns
+    @return: dict
+    """
+    column_types = _types(columns, types)
+    if series == 1:
+        payload = copy.deepcopy(JSON_ML_ANALYSE_TIME_SERIES)
+        results = payload["body"]["payload"]["body"]["results"]
+        results["columns"], results["data"] = _columns_and_data(
+            rows, column_types, meta=False
+        )
+        return payload
+    payload = copy.deepcopy(JSON_ML_ANALYSE_MULTIPLE_TIME_SERIES)
+    results = []
+    for _ in range(series):
+        columns_, data = _columns_and_data(rows, column_types, meta=False)
+        results.append({"columns": columns_, "data": data})
+    payload["body"]["payload"]["body"]["results"] = results
+    return payload
@@ -0,0 +1,251 @@
+"""
+This module benchmarks the whole pipeline of the ML Wrapper. A mocked tool, which returns the
+received data as result, is started without a broker and synthetic triggers are injected through
+the MockMqttClient one after the other. Every message passes parsing, validation, the dispatcher,
+the run, resolving, encoding and publishing like in production.
+
+The report contains the throughput, the latency percentiles, the percentiles per stage taken from
+the trace spans and the peak RSS of every scenario, together with the versions and the settings
+it was measured with, so reports of different releases can be compared.
+
+Usage: python -m ml_wrapper.bench [--rows 1000] [--columns 4] [--series 10] [--messages 200]
+"""
+import argparse
+import contextlib
+import json
+import logging
+import math
+import os
+import platform
+import resource
+import sys
+import time
+from typing import Dict, List, Sequence
+
+import numpy as np
+import pandas as pd
+
+from ..messaging import OutgoingMessage, VALIDATOR_REGISTRY
+from ..misc import JSON_CODEC, InMemorySpanExporter, ResultType, Tracer
+from ..mocks import create_mock_tool
+from ..ml_wrapper import MLWrapper
+from .payloads import analyse_result_payload, sensor_update_payload
+
+REPORT_FORMAT = 1
+SCENARIOS = ("sensor_update", "time_series", "multiple_time_series")
+
+
+class EchoTool(MLWrapper):
+    """Returns the received data as result"""
+
+    def __init__(
+        self,
+        result_type: ResultType = ResultType.TIME_SERIES,
+        outgoing_message_is_temporary: bool = True,
+    ):
+        super().__init__(
+            result_type=result_type,
+            outgoing_message_is_temporary=outgoing_message_is_temporary,
+        )
+
+    async def run(self, out_message: OutgoingMessage):
+        return out_message.in_message.retrieved_data
+
+
+# create_mock_tool changes the class it receives, which keeps EchoTool usable without mock
+EchoMock = create_mock_tool(type("EchoMock", (EchoTool,), {}))
+
+
+def _percentiles(values: Sequence[float]) -> Dict[str, float]:
+    """Returns the nearest rank percentiles and the mean of durations in milliseconds"""
+    ordered = sorted(values)
+
+    def rank(quantile: float) -> float:
+        return ordered[max(0, math.ceil(quantile * len(ordered)) - 1)] * 1e3
+
+    return {
+        "p50": rank(0.5),
+        "p99": rank(0.99),
+        "max": ordered[-1] * 1e3,
+        "mean": sum(ordered) / len(ordered) * 1e3,
+    }
+
+
+def _payload(scenario: str, rows: int, columns: int, series: int) -> dict:
+    if scenario == "sensor_update":
+        return sensor_update_payload(rows, columns)
+    if scenario == "time_series":
+        return analyse_result_payload(rows, columns)
+    return analyse_result_payload(rows, columns, series=series)
+
+
+def _peak_rss_mb() -> float:
+    # Linux reports kilobytes, macOS bytes
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (2**20 if sys.platform == "darwin" else 2**10)
+
+
+def _stages(spans: list) -> Dict[str, Dict[str, float]]:
+    durations: Dict[str, List[float]] = {}
+    for span in spans:
+        if span.parent_id is not None and span.name != "handle_message":
+            durations.setdefault(span.name, []).append(
+                (span.end_ns - span.start_ns) / 1e9
+            )
+    return {name: _percentiles(values) for name, values in durations.items()}
+
+
+def _send(tool: MLWrapper, payload: str, count: int) -> List[float]:
+    """Injects the payload count times and returns the latency of every message"""
+    latencies = []
+    for _ in range(count):
+        sent = time.perf_counter()
+        tool.client.mock_a_message(tool.client, payload)
+        latencies.append(time.perf_counter() - sent)
+        # The mock keeps every result, which would grow the memory of long runs
+        # pylint: disable=no-member
+        tool.out_messages.clear()
+        tool.results.clear()
+    return latencies
+
+
+def benchmark_scenario(
+    scenario: str,
+    rows: int = 1000,
+    columns: int = 4,
+    series: int = 10,
+    messages: int = 200,
+    warm_up: int = 5,
+) -> dict:
+    """
+    Sends synthetic triggers through a mocked tool and measures them
+    @param scenario: one of SCENARIOS
+    @param rows: number of rows of every series
+    @param columns: number of columns of every series
+    @param series: number of series of the multiple_time_series scenario
+    @param messages: number of measured messages
+    @param warm_up: number of messages sent before measuring
+    @return: dict of the results
+    """
+    assert scenario in SCENARIOS, "The scenario has to be one of {}".format(SCENARIOS)
+    assert messages >= 1, "At least one message has to be measured"
+    payload = JSON_CODEC.dumps(_payload(scenario, rows, columns, series))
+    result_type = (
+        ResultType.MULTIPLE_TIME_SERIES
+        if scenario == "multiple_time_series"
+        else ResultType.TIME_SERIES
+    )
+    with EchoMock(result_type=result_type) as tool:
+        tool.logger.setLevel(logging.WARNING)
+        exporter = InMemorySpanExporter()
+        tool.tracer = Tracer(exporter)
+        _send(tool, payload, warm_up)
+        exporter.clear()
+        started = time.perf_counter()
+        latencies = _send(tool, payload, messages)
+        duration = time.perf_counter() - started
+        spans = list(exporter.spans)
+    return {
+        "scenario": scenario,
+        "rows": rows,
+        "columns": columns,
+        "series": series if scenario == "multiple_time_series" else 1,
+        "payload_bytes": len(payload.encode("utf-8")),
+        "messages": messages,
+        "failed": sum(not span.ok for span in spans if span.parent_id is None),
+        "throughput_per_s": messages / duration,
+        "latency_ms": _percentiles(latencies),
+        "stages_ms": _stages(spans),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def environment() -> dict:
+    """Returns the versions and settings the benchmark ran with"""
+    # pylint: disable=import-outside-toplevel,cyclic-import
+    from .. import __version__
+
+    return {
+        "ml_wrapper": __version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "json_backend": JSON_CODEC.backend,
+        "validation_backend": VALIDATOR_REGISTRY.backend,
+    }
+
+
+def benchmark_pipeline(
+    scenarios: Sequence[str] = SCENARIOS,
+    rows: int = 1000,
+    columns: int = 4,
+    series: int = 10,
+    messages: int = 200,
+    warm_up: int = 5,
+) -> dict:
+    """
+    Runs the benchmark for several scenarios
+    @param scenarios: the scenarios out of SCENARIOS
+    @param rows: number of rows of every series
+    @param columns: number of columns of every series
+    @param series: number of series of the multiple_time_series scenario
+    @param messages: number of measured messages per scenario
+    @param warm_up: number of messages sent before measuring
+    @return: dict, the report
+    """
+    # The tool requires a model, which is not part of the default config
+    for key in ("URL", "TAG", "FROM"):
+        os.environ.setdefault("CONFIG_MODEL_" + key, "bench")
+    results = []
+    # The wrapper prints every result, which would dominate the measurement
+    with open(os.devnull, "w", encoding="utf-8") as devnull:
+        with contextlib.redirect_stdout(devnull):
+            for scenario in scenarios:
+                results.append(
+                    benchmark_scenario(
+                        scenario, rows, columns, series, messages, warm_up
+                    )
+                )
+    return {
+        "format": REPORT_FORMAT,
+        "environment": environment(),
+        "scenarios": results,
+    }
+
+
+def main():
+    """Runs the pipeline benchmark and prints the report as json"""
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n", maxsplit=1)[0].strip()
+    )
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--columns", type=int, default=4)
+    parser.add_argument("--series", type=int, default=10)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--warm-up", type=int, default=5)
+    parser.add_argument(
+        "--scenarios",
+        default=",".join(SCENARIOS),
+        help="comma-separated list out of {}".format(", ".join(SCENARIOS)),
+    )
+    parser.add_argument("--output", help="writes the report to this file as well")
+    args = parser.parse_args()
+    report = benchmark_pipeline(
+        [scenario.strip() for scenario in args.scenarios.split(",")],
+        rows=args.rows,
+        columns=args.columns,
+        series=args.series,
+        messages=args.messages,
+        warm_up=args.warm_up,
+    )
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,438 @@
+"""
+This module provides a load generator for soak tests. It publishes triggers to
+kosmos/analytics/<url>/<tag> at a configurable rate with jitter and bursts and consumes the
+results of kosmos/analyses/. Every trigger carries its sequence number as contract, which the
+tool uses in the topic of its result, so the lag of every result is measured and triggers
+without result are counted as dropped.
+
+The soak runner starts a tool with an InProcessBroker instead of a real broker and reports the
+rate, the lag, the drops and the memory of the process periodically as json lines, so leaks and
+saturation points can be found over hours on a laptop.
+
+Usage: python -m ml_wrapper.bench.soak [--tool package.module:Tool] [--rate 10] [--duration 60]
+"""
+import argparse
+import contextlib
+import importlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Type
+
+import numpy as np
+
+from ..misc import JSON_CODEC
+from ..ml_wrapper import MLWrapper
+from .broker import InProcessBroker, InProcessClient
+from .payloads import analyse_result_payload, sensor_update_payload
+from .pipeline import EchoTool, _peak_rss_mb, _percentiles
+
+REPORT_FORMAT = 1
+CONTRACT_PREFIX = "soak-"
+_PLACEHOLDER = "@@sequence@@"
+
+
+def _rss_mb() -> float:
+    """Returns the current resident memory of the process"""
+    try:
+        with open("/proc/self/statm", "r", encoding="utf-8") as file:
+            pages = int(file.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError):
+        # Without procfs only the peak is known
+        return _peak_rss_mb()
+
+
+def _growth_mb_per_hour(samples: List[tuple]) -> float:
+    """Returns the slope of a linear fit of the (seconds, megabytes) samples"""
+    if len(samples) < 2 or samples[-1][0] == samples[0][0]:
+        return 0.0
+    seconds, megabytes = zip(*samples)
+    return float(np.polyfit(seconds, megabytes, 1)[0] * 3600)
+
+
+# pylint: disable=too-many-instance-attributes
+class LoadGenerator:
+    """
+    The LoadGenerator publishes triggers with a client and measures the results it receives.
+    The client can be an InProcessClient or a paho Client connected to a real broker.
+
+    The triggers are sent rate times per second on average. Every interval varies randomly by
+    up to the jitter fraction. Every burst_every seconds, burst_size additional triggers are
+    sent at once. Triggers without result after result_timeout seconds are dropped.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        client,
+        topic: str,
+        payload: dict,
+        rate: float,
+        jitter: float = 0.0,
+        burst_size: int = 0,
+        burst_every: float = 0.0,
+        result_topic: str = "kosmos/analyses/#",
+        result_timeout: float = 30.0,
+        seed: Optional[int] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Constructor of the LoadGenerator. The on_message callback of the client is set.
+        @param client: InProcessClient or paho Client, which is connected
+        @param topic: topic of the triggers
+        @param payload: dict, the trigger, whose contract is replaced by a sequence number
+        @param rate: average number of triggers per second
+        @param jitter: fraction by which every interval varies, between 0 and 1
+        @param burst_size: number of triggers sent additionally in every burst
+        @param burst_every: seconds between the bursts, 0 disables bursts
+        @param result_topic: subscription of the results
+        @param result_timeout: seconds until a trigger without result is dropped
+        @param seed: seed of the jitter
+        @param clock: function returning the current time in seconds
+        """
+        assert rate > 0, "The rate has to be positive"
+        assert 0 <= jitter < 1, "The jitter has to be between 0 and 1"
+        assert burst_size >= 0 and burst_every >= 0, "Bursts cannot be negative"
+        self.client = client
+        self.topic = topic
+        self.rate = rate
+        self.jitter = jitter
+        self.burst_size = burst_size
+        self.burst_every = burst_every
+        self.result_topic = result_topic
+        self.result_timeout = result_timeout
+        self._random = random.Random(seed)
+        self._clock = clock
+        trigger = dict(payload)
+        trigger["body"] = dict(payload["body"], contract=CONTRACT_PREFIX + _PLACEHOLDER)
+        # The payload is serialised once, only the sequence number is inserted per trigger
+        self._template = JSON_CODEC.dumps(trigger).split(_PLACEHOLDER)
+        self._sequence = 0
+        self._sent: Dict[int, float] = {}
+        self._lags: List[float] = []
+        self._lag_sum = 0.0
+        self._lag_max = 0.0
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.received = 0
+        self.dropped = 0
+        self.unexpected = 0
+        self.client.on_message = self.on_message
+
+    def start(self):
+        """Subscribes to the results"""
+        self.client.subscribe(self.result_topic, 0)
+
+    def send(self):
+        """Publishes the next trigger"""
+        with self._lock:
+            self._sequence += 1
+            sequence = self._sequence
+            self._sent[sequence] = self._clock()
+            self.sent += 1
+        self.client.publish(self.topic, str(sequence).join(self._template))
+
+    # client and userdata are expected arguments of the mqtt client callback
+    # pylint: disable=unused-argument
+    def on_message(self, client, userdata, message):
+        """Callback of the client for received results"""
+        received = self._clock()
+        # The topic is <base>/<contract> or <base>/<contract>/<temporary keyword>
+        sequence = None
+        for part in message.topic.split("/"):
+            if (
+                part.startswith(CONTRACT_PREFIX)
+                and part[len(CONTRACT_PREFIX) :].isdigit()
+            ):
+                sequence = int(part[len(CONTRACT_PREFIX) :])
+        with self._lock:
+            sent = self._sent.pop(sequence, None)
+            if sent is None:
+                self.unexpected += 1
+                return
+            self.received += 1
+            self._lags.append(received - sent)
+            self._lag_sum += received - sent
+            self._lag_max = max(self._lag_max, received - sent)
+
+    def _expire(self, timeout: float):
+        deadline = self._clock() - timeout
+        with self._lock:
+            for sequence in [
+                sequence for sequence, sent in self._sent.items() if sent < deadline
+            ]:
+                del self._sent[sequence]
+                self.dropped += 1
+
+    def snapshot(self) -> dict:
+        """
+        Returns the counters and the lag of the results received since the last snapshot
+        @return: dict
+        """
+        self._expire(self.result_timeout)
+        with self._lock:
+            lags, self._lags = self._lags, []
+            return {
+                "sent": self.sent,
+                "received": self.received,
+                "dropped": self.dropped,
+                "unexpected": self.unexpected,
+                "pending": len(self._sent),
+                "lag_ms": _percentiles(lags) if lags else None,
+            }
+
+    def _interval(self) -> float:
+        return self._random.uniform(1 - self.jitter, 1 + self.jitter) / self.rate
+
+    # pylint: disable=too-many-locals
+    def run(
+        self,
+        duration: float,
+        report_interval: float = 10.0,
+        report: Callable[[dict], None] = lambda snapshot: None,
+        stop: Callable[[], bool] = lambda: False,
+    ) -> dict:
+        """
+        Sends triggers for duration seconds and waits for the outstanding results
+        @param duration: seconds to send triggers
+        @param report_interval: seconds between the snapshots handed to report
+        @param report: function receiving every snapshot extended by elapsed_s and rss_mb
+        @param stop: function returning true to stop early, e.g. on a signal
+        @return: dict, the final snapshot with the memory samples and their growth per hour
+        """
+        started = self._clock()
+        next_send = started
+        next_burst = started + self.burst_every if self.burst_size else None
+        next_report = started + report_interval
+        samples = [(0.0, _rss_mb())]
+        sent_before = 0
+
+        def take_snapshot(now: float) -> dict:
+            nonlocal sent_before
+            snapshot = self.snapshot()
+            snapshot["elapsed_s"] = now - started
+            snapshot["rate_per_s"] = (snapshot["sent"] - sent_before) / report_interval
+            snapshot["rss_mb"] = _rss_mb()
+            sent_before = snapshot["sent"]
+            samples.append((snapshot["elapsed_s"], snapshot["rss_mb"]))
+            return snapshot
+
+        now = started
+        while now - started < duration and not stop():
+            if now >= next_send:
+                self.send()
+                next_send += self._interval()
+            if next_burst is not None and now >= next_burst:
+                for _ in range(self.burst_size):
+                    self.send()
+                next_burst += self.burst_every
+            if now >= next_report:
+                report(take_snapshot(now))
+                next_report += report_interval
+            upcoming = min(
+                value
+                for value in (next_send, next_burst, next_report)
+                if value is not None
+            )
+            time.sleep(max(0.0, min(upcoming - self._clock(), 0.1)))
+            now = self._clock()
+        # The outstanding results may arrive until the result timeout
+        deadline = self._clock() + self.result_timeout
+        while self._sent and self._clock() < deadline:
+            time.sleep(0.05)
+        self._expire(0)
+        result = self.snapshot()
+        result["elapsed_s"] = self._clock() - started
+        result["lag_ms_overall"] = {
+            "mean": self._lag_sum / max(self.received, 1) * 1e3,
+            "max": self._lag_max * 1e3,
+        }
+        result["rate_per_s"] = result["sent"] / max(duration, 1e-9)
+        result["rss_mb"] = [round(megabytes, 2) for _, megabytes in samples]
+        result["rss_growth_mb_per_h"] = _growth_mb_per_hour(samples)
+        return result
+
+
+def with_broker(tool_class: Type[MLWrapper], broker: InProcessBroker) -> type:
+    """
+    Returns a subclass of the tool, which is connected to the broker. Entering the tool returns
+    after the start up instead of looping forever, so the caller can send the load.
+    @param tool_class: the class of the ML Tool
+    @param broker: InProcessBroker
+    @return: the subclass
+    """
+
+    def _init_mqtt(self: MLWrapper):
+        self.client = InProcessClient(broker)
+        self.client.connect()
+        # pylint: disable=protected-access
+        self.client.on_message = self._react_to_message
+
+    # pylint: disable=unused-argument
+    def loop_forever(self: MLWrapper):
+        pass
+
+    return type(
+        tool_class.__name__,
+        (tool_class,),
+        {"_init_mqtt": _init_mqtt, "loop_forever": loop_forever},
+    )
+
+
+# pylint: disable=too-many-arguments,too-many-locals
+def soak(
+    tool_class: Type[MLWrapper] = EchoTool,
+    duration: float = 60.0,
+    rate: float = 10.0,
+    jitter: float = 0.0,
+    burst_size: int = 0,
+    burst_every: float = 0.0,
+    rows: int = 100,
+    columns: int = 4,
+    scenario: str = "sensor_update",
+    max_queued: int = 1000,
+    report_interval: float = 10.0,
+    result_timeout: float = 30.0,
+    report: Callable[[dict], None] = lambda snapshot: None,
+) -> dict:
+    """
+    Runs a tool with an InProcessBroker under the load of a LoadGenerator
+    @param tool_class: the class of the ML Tool, which is created without arguments
+    @param duration: seconds to send triggers
+    @param rate: average number of triggers per second
+    @param jitter: fraction by which every interval varies
+    @param burst_size: number of triggers sent additionally in every burst
+    @param burst_every: seconds between the bursts
+    @param rows: number of rows of the triggers
+    @param columns: number of columns of the triggers
+    @param scenario: sensor_update or time_series
+    @param max_queued: maximum number of messages the broker queues per client
+    @param report_interval: seconds between the snapshots
+    @param result_timeout: seconds until a trigger without result is dropped
+    @param report: function receiving every snapshot
+    @return: dict, the report
+    """
+    assert scenario in (
+        "sensor_update",
+        "time_series",
+    ), "The scenario has to be sensor_update or time_series"
+    payload = (
+        sensor_update_payload(rows, columns)
+        if scenario == "sensor_update"
+        else analyse_result_payload(rows, columns)
+    )
+    # The tool requires a model, which is not part of the default config
+    for key in ("URL", "TAG", "FROM"):
+        os.environ.setdefault("CONFIG_MODEL_" + key, "soak")
+    broker = InProcessBroker(max_queued=max_queued)
+    # The wrapper prints every result, which would flood the output over hours
+    tool_type = with_broker(tool_class, broker)
+    # pylint: disable=not-context-manager
+    with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(
+        devnull
+    ), tool_type() as tool:
+        model = tool.config["config"]["model"]
+        client = InProcessClient(broker)
+        client.connect()
+        client.loop_start()
+        generator = LoadGenerator(
+            client,
+            "kosmos/analytics/{}/{}".format(model["url"], model["tag"]),
+            payload,
+            rate,
+            jitter=jitter,
+            burst_size=burst_size,
+            burst_every=burst_every,
+            result_timeout=result_timeout,
+        )
+        generator.start()
+        try:
+            result = generator.run(
+                duration,
+                report_interval=report_interval,
+                report=report,
+                # pylint: disable=protected-access
+                stop=lambda: tool._save_exit,
+            )
+        finally:
+            client.loop_stop()
+            client.disconnect()
+    return {
+        "format": REPORT_FORMAT,
+        "tool": tool_class.__name__,
+        "settings": {
+            "duration_s": duration,
+            "rate_per_s": rate,
+            "jitter": jitter,
+            "burst_size": burst_size,
+            "burst_every_s": burst_every,
+            "rows": rows,
+            "columns": columns,
+            "scenario": scenario,
+            "max_queued": max_queued,
+        },
+        "broker_dropped": broker.dropped,
+        "result": result,
+    }
+
+
+def _load_tool(path: str) -> Type[MLWrapper]:
+    module, _, name = path.partition(":")
+    assert name, "The tool has to be given as package.module:Class"
+    return getattr(importlib.import_module(module), name)
+
+
+def main():
+    """Runs the soak test and prints the snapshots and the report as json lines"""
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n", maxsplit=1)[0].strip()
+    )
+    parser.add_argument("--tool", help="the ML Tool as package.module:Class")
+    parser.add_argument("--duration", type=float, default=60.0)
+    parser.add_argument("--rate", type=float, default=10.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--burst-size", type=int, default=0)
+    parser.add_argument("--burst-every", type=float, default=0.0)
+    parser.add_argument("--rows", type=int, default=100)
+    parser.add_argument("--columns", type=int, default=4)
+    parser.add_argument(
+        "--scenario", choices=("sensor_update", "time_series"), default="sensor_update"
+    )
+    parser.add_argument("--max-queued", type=int, default=1000)
+    parser.add_argument("--report-interval", type=float, default=10.0)
+    parser.add_argument("--result-timeout", type=float, default=30.0)
+    parser.add_argument("--output", help="appends the json lines to this file as well")
+    args = parser.parse_args()
+    stdout = sys.stdout
+
+    def report(line: dict):
+        text = json.dumps(line)
+        print(text, file=stdout, flush=True)
+        if args.output:
+            with open(args.output, "a", encoding="utf-8") as file:
+                file.write(text + "\n")
+
+    result = soak(
+        _load_tool(args.tool) if args.tool else EchoTool,
+        duration=args.duration,
+        rate=args.rate,
+        jitter=args.jitter,
+        burst_size=args.burst_size,
+        burst_every=args.burst_every,
+        rows=args.rows,
+        columns=args.columns,
+        scenario=args.scenario,
+        max_queued=args.max_queued,
+        report_interval=args.report_interval,
+        result_timeout=args.result_timeout,
+        report=report,
+    )
+    report(result)
+
+
+if __name__ == "__main__":
+    main()
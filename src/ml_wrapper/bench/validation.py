@@ -0,0 +1,85 @@
+"""
+This module compares the validation backends on the bundled example payloads scaled up to a
+growing number of data cells.
+
+Usage: python -m ml_wrapper.bench.validation [--max-cells 100000] [--repeat 5]
+"""
+import argparse
+import json
+import statistics
+import time
+from typing import Dict, List
+
+from ..messaging.json_handling.json_provider import TRIGGER_FORMAL
+from ..messaging.json_handling.json_validator import (
+    VALIDATION_BACKENDS,
+    ValidatorRegistry,
+)
+from .payloads import analyse_result_payload, sensor_update_payload
+
+COLUMNS = 4
+
+
+def _payloads(cells: int) -> Dict[str, dict]:
+    rows = max(cells // COLUMNS, 1)
+    return {
+        "sensor_update": sensor_update_payload(rows, COLUMNS),
+        "time_series": analyse_result_payload(rows, COLUMNS),
+        "multiple_time_series": analyse_result_payload(
+            max(rows // 10, 1), COLUMNS, series=10
+        ),
+    }
+
+
+def _measure(registry: ValidatorRegistry, payload: dict, repeat: int) -> List[float]:
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        registry.validate(payload, TRIGGER_FORMAL)
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def benchmark_validation(max_cells: int = 10**5, repeat: int = 5) -> List[dict]:
+    """
+    Validates scaled trigger payloads with every backend
+    @param max_cells: the largest number of data cells, starting from 10 in steps of 10
+    @param repeat: number of validations per payload and backend
+    @return: list of result dictionaries
+    """
+    registries = {}
+    for backend in VALIDATION_BACKENDS:
+        registries[backend] = ValidatorRegistry(backend=backend)
+        registries[backend].warm_up()
+    results = []
+    cells = 10
+    while cells <= max_cells:
+        for name, payload in _payloads(cells).items():
+            for backend, registry in registries.items():
+                durations = _measure(registry, payload, repeat)
+                results.append(
+                    {
+                        "payload": name,
+                        "cells": cells,
+                        "backend": backend,
+                        "median_seconds": statistics.median(durations),
+                        "min_seconds": min(durations),
+                    }
+                )
+        cells *= 10
+    return results
+
+
+def main():
+    """Runs the validation benchmark and prints the results as json"""
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n", maxsplit=1)[0].strip()
+    )
+    parser.add_argument("--max-cells", type=int, default=10**5)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    print(json.dumps(benchmark_validation(args.max_cells, args.repeat), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+"""
+The engine module provides the logic to process incoming messages concurrently
+"""
+
+from .aggregators import (
+    Aggregator,
+    AggregatorStore,
+    RunningMax,
+    RunningMean,
+    RunningMin,
+    RunningStd,
+    RunningVariance,
+    SlidingDFT,
+)
+from .artifact_cache import ArtifactCache
+from .dispatcher import OVERFLOW_POLICIES, MessageDispatcher
+from .process_pool import ProcessMessage, ProcessPoolRunner, SharedFrame
+from .publisher import PublishPipeline
+from .result_cache import ResultCache
+from .window_store import SensorWindow, WindowStore
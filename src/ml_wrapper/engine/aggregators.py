@@ -0,0 +1,366 @@
+"""
+This module provides incremental aggregators, which update features of a sensor column with the
+new rows of every sensor update instead of recomputing them over the whole history
+"""
+import abc
+import copy
+import threading
+from collections import deque
+from typing import Any, Dict, Hashable, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from .window_store import write_mirrored
+
+
+def _valid(values: np.ndarray) -> np.ndarray:
+    """Returns the values without NaN, which are skipped like by pandas"""
+    return values[~np.isnan(values)]
+
+
+class _History:
+    """Mirrored ring buffer of the latest values of a column"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._buffer = np.zeros(2 * size)
+        self._end = 0
+        self._length = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    @property
+    def values(self) -> np.ndarray:
+        """Returns the values in the history, oldest first, as a view into the buffer"""
+        start = (self._end - self._length) % self.size
+        return self._buffer[start : start + self._length]
+
+    def preceding(self, count: int) -> np.ndarray:
+        """
+        Returns the values, which are size positions before the next count values. Positions
+        before the first value are filled with zeros.
+        @param count: number of next values, at most size
+        @return: np.ndarray
+        """
+        padding = self.size - self._length
+        return np.concatenate(
+            [np.zeros(min(count, padding)), self.values[: max(0, count - padding)]]
+        )
+
+    def push(self, values: np.ndarray) -> np.ndarray:
+        """
+        Appends values to the history
+        @param values: np.ndarray
+        @return: np.ndarray, a copy of the values that left the history, oldest first
+        """
+        overflow = max(0, self._length + len(values) - self.size)
+        evicted = np.concatenate(
+            [
+                self.values[: min(overflow, self._length)],
+                values[: max(0, overflow - self._length)],
+            ]
+        )
+        kept = values[len(values) - min(len(values), self.size) :]
+        write_mirrored(self._buffer, self.size, self._end, kept)
+        self._end = (self._end + len(kept)) % self.size
+        self._length = min(self._length + len(values), self.size)
+        return evicted
+
+
+class Aggregator(abc.ABC):
+    """
+    Base class of the incremental aggregators. An aggregator computes one feature of one column
+    and updates it with the new values of every sensor update. With a window of N, only the
+    latest N values of the column are aggregated, otherwise all values since the start.
+
+    Aggregators that accumulate rounding errors while values leave the window recompute their
+    state from the window once every N values.
+    """
+
+    # True, if the values leaving the window are required to update the feature
+    needs_history = True
+
+    def __init__(self, column: str, window: int = 0):
+        """
+        Constructor of the Aggregator
+        @param column: name of the aggregated column
+        @param window: number of latest values to aggregate, 0 aggregates all values
+        """
+        assert window >= 0, "The window of an aggregator cannot be negative"
+        self.column = column
+        self.window = window
+        self._history: Optional[_History] = (
+            _History(window) if window and self.needs_history else None
+        )
+        self._since_resync = 0
+
+    def update(self, frame: pd.DataFrame):
+        """
+        Updates the feature with the rows of a sensor update
+        @param frame: pd.DataFrame containing the column of the aggregator
+        """
+        values = frame[self.column].to_numpy(dtype=np.float64)
+        if self._history is None:
+            self._update(values, values[:0])
+            return
+        self._update(values, self._history.push(values))
+        self._since_resync += len(values)
+        if self._since_resync >= self.window:
+            self._resync(self._history.values)
+            self._since_resync = 0
+
+    @abc.abstractmethod
+    def _update(self, values: np.ndarray, evicted: np.ndarray):
+        """
+        Adds the new values to the feature and removes the evicted values from it
+        @param values: np.ndarray of the new values
+        @param evicted: np.ndarray of the values that left the window
+        """
+
+    def _resync(self, values: np.ndarray):
+        """Recomputes the feature from all values of the window"""
+
+    @property
+    @abc.abstractmethod
+    def value(self) -> Any:
+        """Returns the current value of the feature"""
+
+
+class RunningMean(Aggregator):
+    """Mean of the values, computed from a running sum. NaN values are skipped."""
+
+    def __init__(self, column: str, window: int = 0):
+        super().__init__(column, window)
+        self._count = 0
+        self._sum = 0.0
+
+    def _update(self, values: np.ndarray, evicted: np.ndarray):
+        values, evicted = _valid(values), _valid(evicted)
+        self._count += len(values) - len(evicted)
+        self._sum += values.sum() - evicted.sum()
+
+    def _resync(self, values: np.ndarray):
+        values = _valid(values)
+        self._count = len(values)
+        self._sum = values.sum()
+
+    @property
+    def value(self) -> float:
+        return self._sum / self._count if self._count else np.nan
+
+
+class RunningVariance(Aggregator):
+    """
+    Variance of the values with Welford's algorithm. The new and the evicted values of a
+    sensor update are merged in and out as one batch each, as proposed by Chan et al. NaN
+    values are skipped.
+    """
+
+    def __init__(self, column: str, window: int = 0, ddof: int = 1):
+        """
+        Constructor of the RunningVariance
+        @param column: name of the aggregated column
+        @param window: number of latest values to aggregate, 0 aggregates all values
+        @param ddof: delta degrees of freedom, 1 for the sample variance like pandas
+        """
+        super().__init__(column, window)
+        self.ddof = ddof
+        self._count = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+
+    @staticmethod
+    def _moments(values: np.ndarray):
+        mean = values.mean()
+        return len(values), mean, ((values - mean) ** 2).sum()
+
+    def _update(self, values: np.ndarray, evicted: np.ndarray):
+        values, evicted = _valid(values), _valid(evicted)
+        if len(values):
+            count, mean, m2 = self._moments(values)
+            total = self._count + count
+            delta = mean - self._mean
+            self._mean += delta * count / total
+            self._m2 += m2 + delta**2 * self._count * count / total
+            self._count = total
+        if len(evicted):
+            count, mean, m2 = self._moments(evicted)
+            rest = self._count - count
+            if rest == 0:
+                self._count, self._mean, self._m2 = 0, 0.0, 0.0
+                return
+            rest_mean = (self._count * self._mean - count * mean) / rest
+            delta = mean - rest_mean
+            self._m2 = max(0.0, self._m2 - m2 - delta**2 * rest * count / self._count)
+            self._count, self._mean = rest, rest_mean
+
+    def _resync(self, values: np.ndarray):
+        values = _valid(values)
+        self._count, self._mean, self._m2 = (
+            self._moments(values) if len(values) else (0, 0.0, 0.0)
+        )
+
+    @property
+    def value(self) -> float:
+        if self._count <= self.ddof:
+            return np.nan
+        return self._m2 / (self._count - self.ddof)
+
+
+class RunningStd(RunningVariance):
+    """Standard deviation of the values with Welford's algorithm"""
+
+    @property
+    def value(self) -> float:
+        return float(np.sqrt(super().value))
+
+
+class _RunningExtreme(Aggregator):
+    """
+    Extreme value of the window with a monotonic deque. The deque holds the positions and values
+    of the window, which can still become the extreme value. Values are dropped as soon as a
+    later value is at least as extreme, so every value is added and removed at most once.
+    """
+
+    needs_history = False
+    # ufunc returning true, if the first value is more extreme than the second one
+    _more_extreme: np.ufunc
+    # ufunc returning the more extreme value and ignoring NaN
+    _extreme: np.ufunc
+
+    def __init__(self, column: str, window: int = 0):
+        super().__init__(column, window)
+        self._deque = deque()
+        self._position = 0
+        self._value = np.nan
+
+    def _update(self, values: np.ndarray, evicted: np.ndarray):
+        positions = np.flatnonzero(~np.isnan(values))
+        valid = values[positions]
+        self._position += len(values)
+        if not self.window:
+            if len(valid):
+                self._value = self._extreme(self._extreme.reduce(valid), self._value)
+            return
+        if len(valid):
+            # Only values more extreme than all later values of the batch are kept. The last
+            # value is always kept, even if it is infinite.
+            later = self._extreme.accumulate(valid[::-1])[::-1][1:]
+            kept = np.append(self._more_extreme(valid[:-1], later), True)
+            candidates = valid[kept]
+            while self._deque and not self._more_extreme(
+                self._deque[-1][1], candidates[0]
+            ):
+                self._deque.pop()
+            start = self._position - len(values)
+            self._deque.extend(zip(positions[kept] + start, candidates))
+        while self._deque and self._deque[0][0] < self._position - self.window:
+            self._deque.popleft()
+        self._value = self._deque[0][1] if self._deque else np.nan
+
+    @property
+    def value(self) -> float:
+        return float(self._value)
+
+
+class RunningMin(_RunningExtreme):
+    """Minimum of the values with a monotonic deque"""
+
+    _more_extreme = np.less
+    _extreme = np.fmin
+
+
+class RunningMax(_RunningExtreme):
+    """Maximum of the values with a monotonic deque"""
+
+    _more_extreme = np.greater
+    _extreme = np.fmax
+
+
+class SlidingDFT(Aggregator):
+    """
+    Spectrum of the latest window values with the sliding DFT. A new value x updates every
+    bin k with X_k = (X_k + x - x_old) * exp(2j * pi * k / window), where x_old is the value
+    leaving the window. The value equals numpy.fft.rfft of the latest window values, which are
+    padded with zeros in front until the window is full.
+    """
+
+    def __init__(self, column: str, window: int, bins: Sequence[int] = None):
+        """
+        Constructor of the SlidingDFT
+        @param column: name of the aggregated column
+        @param window: number of latest values in the spectrum
+        @param bins: the frequency bins to compute, all bins of numpy.fft.rfft by default
+        """
+        assert window >= 1, "The sliding DFT needs a window"
+        super().__init__(column, window)
+        self.bins = np.arange(window // 2 + 1) if bins is None else np.asarray(bins)
+        self._twiddles = np.exp(2j * np.pi * self.bins / window)
+        self._spectrum = np.zeros(len(self.bins), dtype=complex)
+        self._preceding: Optional[np.ndarray] = None
+
+    def update(self, frame: pd.DataFrame):
+        # The values leaving the window have to be taken before they are overwritten
+        rows = len(frame)
+        self._preceding = self._history.preceding(rows) if rows < self.window else None
+        super().update(frame)
+
+    def _update(self, values: np.ndarray, evicted: np.ndarray):
+        if len(values) >= self.window:
+            # The spectrum is recomputed from the history by _resync
+            return
+        # Every difference is rotated once per following value
+        exponents = np.arange(len(values), 0, -1)
+        rotations = np.exp(2j * np.pi * np.outer(exponents, self.bins) / self.window)
+        self._spectrum = (
+            self._spectrum * self._twiddles ** len(values)
+            + (values - self._preceding) @ rotations
+        )
+
+    def _resync(self, values: np.ndarray):
+        padded = np.concatenate([np.zeros(self.window - len(values)), values])
+        self._spectrum = np.fft.fft(padded)[self.bins % self.window]
+
+    @property
+    def value(self) -> np.ndarray:
+        return self._spectrum.copy()
+
+
+class AggregatorStore:
+    """
+    The AggregatorStore keeps a copy of the registered aggregators per key, e.g. per machine
+    and sensor, and updates them with the sensor updates of the key
+    """
+
+    def __init__(self, aggregators: Dict[str, Aggregator]):
+        """
+        Constructor of the AggregatorStore
+        @param aggregators: dict of the feature names and the aggregators to copy per key
+        """
+        assert all(
+            isinstance(aggregator, Aggregator) for aggregator in aggregators.values()
+        ), "Only Aggregators can be registered"
+        self.aggregators = aggregators
+        self._states: Dict[Hashable, Dict[str, Aggregator]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def update(self, key: Hashable, frame: pd.DataFrame) -> Dict[str, Any]:
+        """
+        Updates the aggregators of the key with the rows of the frame
+        @param key: Hashable
+        @param frame: pd.DataFrame
+        @return: dict of the feature names and their current values
+        """
+        with self._lock:
+            state = self._states.get(key)
+            if state is None:
+                state = copy.deepcopy(self.aggregators)
+                self._states[key] = state
+            for aggregator in state.values():
+                aggregator.update(frame)
+            return {name: aggregator.value for name, aggregator in state.items()}
@@ -0,0 +1,111 @@
+"""
+This module provides the artifact cache, which stores the numpy arrays of a model, e.g. its
+weights or lookup tables, as files and opens them memory mapped, so all worker processes share
+one copy of them in memory
+"""
+import os
+import re
+import tempfile
+import threading
+from typing import Callable, Dict
+
+import numpy as np
+
+ARTIFACT_NAME = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+# The opened artifacts of this process by path. They are shared by all ArtifactCache objects of
+# the process, so unpickled copies of a cache don't map the files again for every message.
+_MAPPED: Dict[str, np.ndarray] = {}
+_MAPPED_LOCK = threading.Lock()
+
+
+class ArtifactCache:
+    """
+    The ArtifactCache keeps one .npy file per artifact in its directory. Artifacts are opened
+    read only with numpy.load(mmap_mode="r"). The pages of a memory mapped file are held once by
+    the page cache of the operating system, no matter how many processes map the file, so a model
+    loaded in every worker of the process pool occupies its memory only once.
+
+    Artifacts are written to a temporary file first and renamed afterwards. Like this a process
+    never opens a partially written artifact, even if several processes build it at the same time.
+
+    The cache can be pickled. Every process maps an artifact once and reuses it afterwards.
+    """
+
+    def __init__(self, directory: str):
+        """
+        Constructor of the ArtifactCache. The directory is created if it doesn't exist.
+        @param directory: directory of the artifact files
+        """
+        assert directory, "The artifact cache needs a directory"
+        self.directory = os.path.abspath(directory)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, name: str) -> str:
+        """
+        Returns the path of the artifact's file
+        @param name: name of the artifact, only letters, digits, "_", "-" and "."
+        @return: str
+        """
+        assert ARTIFACT_NAME.match(
+            name
+        ), "The artifact name {} contains invalid characters".format(name)
+        return os.path.join(self.directory, name + ".npy")
+
+    def __contains__(self, name: str) -> bool:
+        return os.path.exists(self.path(name))
+
+    def put(self, name: str, array: np.ndarray) -> np.ndarray:
+        """
+        Stores an array as artifact and replaces an existing artifact of the same name
+        @param name: name of the artifact
+        @param array: np.ndarray of a fixed size dtype
+        @return: np.ndarray, the memory mapped artifact
+        """
+        array = np.asarray(array)
+        assert (
+            not array.dtype.hasobject
+        ), "Arrays of python objects cannot be memory mapped"
+        path = self.path(name)
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                np.save(file, array, allow_pickle=False)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        with _MAPPED_LOCK:
+            _MAPPED.pop(path, None)
+        return self.get(name)
+
+    def get(self, name: str, build: Callable[[], np.ndarray] = None) -> np.ndarray:
+        """
+        Returns the memory mapped artifact. If the artifact doesn't exist, it is built with the
+        build function and stored first.
+        @param name: name of the artifact
+        @param build: optional function returning the array of the artifact
+        @return: np.ndarray, a read only view of the artifact's file
+        @raise KeyError, if the artifact doesn't exist and no build function is provided
+        """
+        path = self.path(name)
+        with _MAPPED_LOCK:
+            opened = _MAPPED.get(path)
+        if opened is not None:
+            return opened
+        if not os.path.exists(path):
+            if build is None:
+                raise KeyError("The artifact {} doesn't exist".format(name))
+            return self.put(name, build())
+        opened = np.load(path, mmap_mode="r", allow_pickle=False)
+        with _MAPPED_LOCK:
+            return _MAPPED.setdefault(path, opened)
+
+    def clear(self):
+        """Removes all artifacts from the directory"""
+        with _MAPPED_LOCK:
+            for file in os.listdir(self.directory):
+                if file.endswith(".npy"):
+                    path = os.path.join(self.directory, file)
+                    _MAPPED.pop(path, None)
+                    os.unlink(path)
@@ -0,0 +1,429 @@
+"""
+This module provides the dispatch engine, which processes incoming messages concurrently on a
+dedicated asyncio loop, so the MQTT network thread is never blocked by a running ML Tool
+"""
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from ..misc import NotInitialized
+from ..misc.prometheus import (
+    message_coalesce_counter,
+    message_drop_counter,
+    queue_wait_duration,
+)
+
+OVERFLOW_POLICIES = ("block", "drop_oldest", "drop_newest", "latest")
+
+
+# pylint: disable=too-few-public-methods
+class _Entry:
+    """
+    An item waiting in the queue together with its future, its keys, its enqueue time and the
+    future of its ingest
+    """
+
+    __slots__ = ("item", "future", "key", "coalesce_key", "enqueued", "ingested")
+
+    def __init__(
+        self, item: Any, future: Future, enqueued: float, ingested: Optional[Future]
+    ):
+        self.item = item
+        self.future = future
+        self.key = None
+        self.coalesce_key = None
+        self.enqueued = enqueued
+        self.ingested = ingested
+
+
+# pylint: disable=too-many-instance-attributes,too-many-arguments
+class MessageDispatcher:
+    """
+    The MessageDispatcher owns an asyncio loop running in its own thread. Messages are handed over
+    with submit() and wait in a bounded queue until one of max_concurrent_runs worker tasks picks
+    them up and awaits the handler coroutine for them.
+
+    The overflow_policy decides what happens, if the queue is full:
+
+    - block: submit() blocks the calling thread until a slot is free. Like this the MQTT network
+      thread stops reading from the socket instead of piling up work in memory.
+    - drop_oldest: the item waiting the longest is dropped to make room for the new one.
+    - drop_newest: the new item is dropped.
+    - latest: the new item replaces the waiting item with the same overflow_key. If there is
+      none, the item waiting the longest is dropped.
+
+    The futures of dropped items are cancelled.
+
+    With a coalesce_key, a new item replaces the waiting item with the same coalesce key, no
+    matter if the queue is full or not. Like this only the latest item per key is processed, if
+    the handler cannot keep up. Items with the coalesce key None are never replaced. The
+    futures of replaced items are cancelled as well.
+
+    With a batch_handler and a batch_size above 1, every worker collects up to batch_size items
+    within batch_delay seconds after the first one. The collected items are grouped by
+    batch_key and the batch_handler is awaited once per group with the list of its items.
+
+    With an ingest function, every submitted item is ingested on a dedicated thread in the order
+    of submission, also the items which are dropped or coalesced later. Like this state, which
+    depends on every item, is updated neither on the submitting thread nor out of order. The
+    handler of an item is awaited once its ingest finished. If the ingest fails, the future of
+    the item fails with its error.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Any], Awaitable[Any]],
+        logger: logging.Logger,
+        max_concurrent_runs: int = 1,
+        queue_size: int = 100,
+        loop_policy: asyncio.AbstractEventLoopPolicy = None,
+        batch_handler: Callable[[List[Any]], Awaitable[List[Any]]] = None,
+        batch_size: int = 1,
+        batch_delay: float = 0.0,
+        batch_key: Callable[[Any], Hashable] = None,
+        overflow_policy: str = "block",
+        overflow_key: Callable[[Any], Hashable] = None,
+        coalesce_key: Callable[[Any], Optional[Hashable]] = None,
+        ingest: Callable[[Any], None] = None,
+    ):
+        """
+        Constructor of the MessageDispatcher
+        @param handler: coroutine function awaited once per submitted item
+        @param logger: logging.Logger
+        @param max_concurrent_runs: number of handler coroutines running at the same time
+        @param queue_size: number of items waiting for a free worker before submit blocks
+        @param loop_policy: optional asyncio loop policy to create the dispatch loop with
+        @param batch_handler: optional coroutine function awaited with a list of items, which
+        returns one result per item
+        @param batch_size: maximum number of items in one batch
+        @param batch_delay: maximum number of seconds to wait for a batch to fill up
+        @param batch_key: function returning the group of an item, only items of the same group
+        are batched together
+        @param overflow_policy: one of OVERFLOW_POLICIES, applied if the queue is full
+        @param overflow_key: function returning the key of an item for the latest policy
+        @param coalesce_key: optional function returning the key of an item, only the latest
+        waiting item per key is kept
+        @param ingest: optional function called with every submitted item on the ingest thread
+        """
+        assert max_concurrent_runs >= 1, "max_concurrent_runs has to be at least 1"
+        assert queue_size >= 1, "queue_size has to be at least 1"
+        assert batch_size >= 1, "batch_size has to be at least 1"
+        assert batch_delay >= 0, "batch_delay cannot be negative"
+        assert (
+            overflow_policy in OVERFLOW_POLICIES
+        ), "The overflow policy has to be one of {}, but received {}".format(
+            OVERFLOW_POLICIES, overflow_policy
+        )
+        self.handler = handler
+        self.batch_handler = batch_handler
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.batch_key = batch_key or (lambda item: None)
+        self.overflow_policy = overflow_policy
+        self.overflow_key = overflow_key or (lambda item: None)
+        self.coalesce_key = coalesce_key or (lambda item: None)
+        self.ingest = ingest
+        self.logger = logger
+        self.max_concurrent_runs = max_concurrent_runs
+        self.queue_size = queue_size
+        self._loop_policy = loop_policy or asyncio.get_event_loop_policy()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers = []
+        self._waiting: Dict[Hashable, _Entry] = {}
+        self._coalescing: Dict[Hashable, _Entry] = {}
+        self.dropped = 0
+        self.coalesced = 0
+        self._thread: Optional[threading.Thread] = None
+        self._ingest_executor: Optional[ThreadPoolExecutor] = None
+        self._started = threading.Event()
+
+    @property
+    def is_running(self) -> bool:
+        """Returns true, if the dispatch loop is up and accepts messages"""
+        return (
+            self._thread is not None
+            and self._thread.is_alive()
+            and self._started.is_set()
+        )
+
+    @property
+    def is_batching(self) -> bool:
+        """Returns true, if items are processed in batches"""
+        return self.batch_handler is not None and self.batch_size > 1
+
+    def start(self):
+        """
+        Starts the dispatch loop thread and its workers. Returns as soon as messages can be
+        submitted.
+        """
+        if self.is_running:
+            return
+        self._started.clear()
+        if self.ingest is not None:
+            # A single thread keeps the items in the order of submission
+            self._ingest_executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="ml-wrapper-ingest"
+            )
+        self.loop = self._loop_policy.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._run_loop, name="ml-wrapper-dispatcher", daemon=True
+        )
+        self._thread.start()
+        self._started.wait()
+
+    def _run_loop(self):
+        """Thread target running the dispatch loop until it is stopped"""
+        asyncio.set_event_loop(self.loop)
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        worker = self._batch_worker if self.is_batching else self._worker
+        self._workers = [
+            self.loop.create_task(worker(index))
+            for index in range(self.max_concurrent_runs)
+        ]
+        self.loop.call_soon(self._started.set)
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    def _take(self, entry: _Entry) -> Tuple[Any, Future]:
+        """Unpacks an entry taken from the queue"""
+        if self._waiting.get(entry.key) is entry:
+            del self._waiting[entry.key]
+        if self._coalescing.get(entry.coalesce_key) is entry:
+            del self._coalescing[entry.coalesce_key]
+        return entry.item, entry.future
+
+    def _dequeue(self, entry: _Entry) -> Tuple[Any, Future]:
+        """Unpacks an entry taken from the queue to be processed"""
+        queue_wait_duration.observe(self.loop.time() - entry.enqueued)
+        return self._take(entry)
+
+    @staticmethod
+    async def _ingested(entry: _Entry) -> bool:
+        """
+        Waits until the item of an entry is ingested
+        @return: bool, false if the ingest failed, which fails the future of the entry
+        """
+        if entry.ingested is None:
+            return True
+        try:
+            await asyncio.wrap_future(entry.ingested)
+        # The error of the ingest belongs to the item
+        # pylint: disable=broad-except
+        except Exception as error:
+            if entry.future.set_running_or_notify_cancel():
+                entry.future.set_exception(error)
+            return False
+        return True
+
+    async def _worker(self, index: int):
+        """Takes items from the queue and awaits the handler for each of them"""
+        self.logger.debug("Dispatch worker %d started", index)
+        while True:
+            entry = await self._queue.get()
+            item, future = self._dequeue(entry)
+            try:
+                if (
+                    await self._ingested(entry)
+                    and future.set_running_or_notify_cancel()
+                ):
+                    try:
+                        future.set_result(await self.handler(item))
+                    # The worker has to survive every error of a single run
+                    # pylint: disable=broad-except
+                    except Exception as error:
+                        future.set_exception(error)
+            finally:
+                self._queue.task_done()
+
+    async def _collect(self) -> List[Tuple[Any, Future]]:
+        """Waits for the first item and collects more until the batch is full or due"""
+        entries = [await self._queue.get()]
+        batch = [self._dequeue(entries[0])]
+        deadline = self.loop.time() + self.batch_delay
+        while len(batch) < self.batch_size:
+            if self._queue.empty():
+                timeout = deadline - self.loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    entry = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            else:
+                entry = self._queue.get_nowait()
+            entries.append(entry)
+            batch.append(self._dequeue(entry))
+        # Items, whose ingest failed, are left out of the batch
+        return [
+            unpacked
+            for entry, unpacked in zip(entries, batch)
+            if await self._ingested(entry)
+        ]
+
+    async def _batch_worker(self, index: int):
+        """Takes batches from the queue and awaits the batch handler for each group"""
+        self.logger.debug("Dispatch worker %d started in batch mode", index)
+        while True:
+            batch = await self._collect()
+            try:
+                for group in self._group(batch).values():
+                    await self._run_batch(group)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _group(
+        self, batch: List[Tuple[Any, Future]]
+    ) -> Dict[Hashable, List[Tuple[Any, Future]]]:
+        """Groups the items of a batch by their key and drops cancelled items"""
+        groups = {}
+        for item, future in batch:
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                groups.setdefault(self.batch_key(item), []).append((item, future))
+            # An item without a valid key fails alone
+            # pylint: disable=broad-except
+            except Exception as error:
+                future.set_exception(error)
+        return groups
+
+    async def _run_batch(self, group: List[Tuple[Any, Future]]):
+        if not group:
+            return
+        self.logger.debug("Run a batch of %d items", len(group))
+        try:
+            results = await self.batch_handler([item for item, _ in group])
+            if len(results) != len(group):
+                raise ValueError(
+                    "The batch handler returned {} results for {} items".format(
+                        len(results), len(group)
+                    )
+                )
+        # The worker has to survive every error of a single batch
+        # pylint: disable=broad-except
+        except Exception as error:
+            for _, future in group:
+                future.set_exception(error)
+            return
+        for (_, future), result in zip(group, results):
+            future.set_result(result)
+
+    def _drop(self, future: Future):
+        """Cancels the future of a dropped item and counts it"""
+        future.cancel()
+        self.dropped += 1
+        message_drop_counter.labels(self.overflow_policy).inc()
+        self.logger.debug(
+            "Dropped an item due to the overflow policy %s", self.overflow_policy
+        )
+
+    def _drop_oldest(self):
+        """Removes the entry waiting the longest from the full queue"""
+        oldest = self._queue.get_nowait()
+        self._take(oldest)
+        self._queue.task_done()
+        self._drop(oldest.future)
+
+    def _replace(
+        self, waiting: _Entry, item: Any, future: Future, ingested: Optional[Future]
+    ) -> Future:
+        """Hands the place of a waiting entry over to a new item and returns the old future"""
+        replaced = waiting.future
+        waiting.item, waiting.future, waiting.ingested = item, future, ingested
+        waiting.enqueued = self.loop.time()
+        return replaced
+
+    async def _enqueue(self, item: Any, future: Future, ingested: Optional[Future]):
+        entry = _Entry(item, future, self.loop.time(), ingested)
+        try:
+            entry.coalesce_key = self.coalesce_key(item)
+            if self.overflow_policy == "latest":
+                entry.key = self.overflow_key(item)
+        # An item without a valid key fails alone
+        # pylint: disable=broad-except
+        except Exception as error:
+            future.set_exception(error)
+            return
+        if entry.coalesce_key in self._coalescing:
+            self._replace(
+                self._coalescing[entry.coalesce_key], item, future, ingested
+            ).cancel()
+            self.coalesced += 1
+            message_coalesce_counter.inc()
+            return
+        if self.overflow_policy != "block" and self._queue.full():
+            if self.overflow_policy == "drop_newest":
+                self._drop(future)
+                return
+            if self.overflow_policy == "latest" and entry.key in self._waiting:
+                self._drop(
+                    self._replace(self._waiting[entry.key], item, future, ingested)
+                )
+                return
+            self._drop_oldest()
+        if self.overflow_policy == "latest":
+            self._waiting[entry.key] = entry
+        if entry.coalesce_key is not None:
+            self._coalescing[entry.coalesce_key] = entry
+        await self._queue.put(entry)
+
+    def submit(self, item: Any) -> Future:
+        """
+        Hands an item to the dispatch loop. Blocks while the queue is full.
+        @param item: the item the handler is awaited with
+        @return: concurrent.futures.Future resolving to the handler's result
+        """
+        if not self.is_running:
+            raise NotInitialized(
+                "The dispatcher has to be started before messages can be submitted"
+            )
+        future = Future()
+        ingested = (
+            None
+            if self._ingest_executor is None
+            else self._ingest_executor.submit(self.ingest, item)
+        )
+        asyncio.run_coroutine_threadsafe(
+            self._enqueue(item, future, ingested), self.loop
+        ).result()
+        return future
+
+    async def _drain(self):
+        await self._queue.join()
+
+    def stop(self, drain: bool = True, timeout: float = None):
+        """
+        Stops the dispatch loop.
+        @param drain: if true, waits for all queued and running items to finish first
+        @param timeout: maximum number of seconds to wait for draining
+        """
+        if not self.is_running:
+            return
+        if drain:
+            try:
+                asyncio.run_coroutine_threadsafe(self._drain(), self.loop).result(
+                    timeout=timeout
+                )
+            # Shutting down must not fail because of an unfinished run
+            # pylint: disable=broad-except
+            except Exception as error:
+                self.logger.warning(
+                    "Dispatcher stopped before draining: %s", error.__class__.__name__
+                )
+        self.loop.call_soon_threadsafe(self._shutdown)
+        self._thread.join()
+        if self._ingest_executor is not None:
+            self._ingest_executor.shutdown(wait=True)
+            self._ingest_executor = None
+        self._started.clear()
+
+    def _shutdown(self):
+        for worker in self._workers:
+            worker.cancel()
+        self.loop.call_soon(self.loop.stop)
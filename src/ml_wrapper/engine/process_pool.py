@@ -0,0 +1,240 @@
+"""
+This module provides the process pool execution mode. CPU bound ML Tools can run their
+synchronous run_sync hook in worker processes, while the numeric columns of the DataFrames are
+handed over through shared memory instead of being pickled.
+"""
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Callable, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from ..messaging import IncomingMessage
+from .artifact_cache import ArtifactCache
+from ..misc import NotInitialized
+
+# numpy kinds that can be placed in shared memory as plain bytes
+SHAREABLE_KINDS = "biufcmM"
+# The tool runs the mqtt, dispatcher and server threads, whose locks a forked worker would
+# inherit in whatever state they are, so the workers are started as fresh interpreters
+START_METHOD = "spawn"
+
+
+class SharedFrame:
+    """
+    Picklable handle of a DataFrame. Columns of a plain numpy dtype are copied into one shared
+    memory block, all other columns and the index are pickled as usual.
+    """
+
+    def __init__(self, dataframe: pd.DataFrame):
+        """
+        Copies the shareable columns of the dataframe into a new shared memory block.
+        The creator of the SharedFrame is responsible to call release() afterwards.
+        @param dataframe: pd.DataFrame
+        """
+        assert isinstance(
+            dataframe, pd.DataFrame
+        ), "Only dataframes can be shared with a SharedFrame"
+        self.index = dataframe.index
+        self.column_names = list(dataframe.columns)
+        self.layout: List[Tuple[int, str, int, int]] = []
+        self.pickled = {}
+        arrays = []
+        offset = 0
+        for position in range(len(self.column_names)):
+            column = dataframe.iloc[:, position]
+            if (
+                isinstance(column.dtype, np.dtype)
+                and column.dtype.kind in SHAREABLE_KINDS
+            ):
+                array = np.ascontiguousarray(column.to_numpy())
+                self.layout.append((position, array.dtype.str, offset, len(array)))
+                arrays.append((offset, array))
+                offset += array.nbytes
+            else:
+                self.pickled[position] = column.to_numpy()
+        self._block: Optional[shared_memory.SharedMemory] = None
+        self.block_name = None
+        if offset > 0:
+            self._block = shared_memory.SharedMemory(create=True, size=offset)
+            self.block_name = self._block.name
+            for start, array in arrays:
+                self._block.buf[start : start + array.nbytes] = array.view(np.uint8)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_block"] = None
+        return state
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Rebuilds the DataFrame from the shared memory block. The columns are copied out of the
+        block once, so the creator can release it as soon as the run returns, even if the result
+        still references the data. This saves the pickling, but it is no zero-copy handover.
+        @return: pd.DataFrame
+        """
+        columns = dict(self.pickled)
+        if self.block_name is not None:
+            block = shared_memory.SharedMemory(name=self.block_name)
+            try:
+                for position, dtype, offset, length in self.layout:
+                    columns[position] = np.ndarray(
+                        (length,),
+                        dtype=np.dtype(dtype),
+                        buffer=block.buf,
+                        offset=offset,
+                    ).copy()
+            finally:
+                block.close()
+        dataframe = pd.DataFrame(
+            {position: columns[position] for position in range(len(self.column_names))},
+            index=self.index,
+        )
+        dataframe.columns = self.column_names
+        return dataframe
+
+    def release(self):
+        """Frees the shared memory block. Has to be called by the creator only."""
+        if self._block is not None:
+            self._block.close()
+            self._block.unlink()
+            self._block = None
+
+
+# pylint: disable=too-many-instance-attributes,too-few-public-methods
+class ProcessMessage:
+    """
+    This class carries the fields of an IncomingMessage that are relevant for the run_sync hook
+    into a worker process
+    """
+
+    def __init__(self, in_message: IncomingMessage):
+        """
+        Collects the fields from the given IncomingMessage
+        @param in_message: IncomingMessage
+        """
+        self.mid = str(in_message.mid)
+        self.contract = in_message.contract
+        self.machine = in_message.machine
+        self.sensor = in_message.sensor
+        self.model = in_message.model
+        self.message_type = in_message.message_type
+        self.analyses_message_type = in_message.analyses_message_type
+        self.timestamp = in_message.timestamp
+        self.metadata = in_message.metadata
+        self.column_meta = in_message.column_meta
+        self.columns = in_message.columns
+        self.retrieved_data = in_message.retrieved_data
+        self.window = in_message.window
+        self.features = in_message.features
+        self.custom_information_field = in_message.custom_information_field
+        # Set by the ProcessPoolRunner, if the artifact cache is enabled
+        self.artifact_cache: Optional[ArtifactCache] = None
+
+    def share(self) -> List[SharedFrame]:
+        """
+        Replaces the retrieved DataFrames by SharedFrames before shipping to a worker process
+        @return: list of the created SharedFrames, which have to be released after the run
+        """
+        if isinstance(self.retrieved_data, pd.DataFrame):
+            self.retrieved_data = SharedFrame(self.retrieved_data)
+            return [self.retrieved_data]
+        if isinstance(self.retrieved_data, list):
+            self.retrieved_data = [
+                SharedFrame(data) if isinstance(data, pd.DataFrame) else data
+                for data in self.retrieved_data
+            ]
+            return [
+                data for data in self.retrieved_data if isinstance(data, SharedFrame)
+            ]
+        return []
+
+    def unshare(self):
+        """Turns the SharedFrames back into DataFrames inside the worker process"""
+        if isinstance(self.retrieved_data, SharedFrame):
+            self.retrieved_data = self.retrieved_data.to_frame()
+        elif isinstance(self.retrieved_data, list):
+            self.retrieved_data = [
+                data.to_frame() if isinstance(data, SharedFrame) else data
+                for data in self.retrieved_data
+            ]
+
+
+def _execute_in_worker(
+    function: Callable[[ProcessMessage], Any], message: ProcessMessage
+) -> Union[pd.DataFrame, List[pd.DataFrame], dict]:
+    """Entry point of the worker process"""
+    message.unshare()
+    return function(message)
+
+
+class ProcessPoolRunner:
+    """
+    The ProcessPoolRunner runs a synchronous function for IncomingMessages in a pool of worker
+    processes
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        logger: logging.Logger,
+        artifact_cache: ArtifactCache = None,
+    ):
+        """
+        Constructor of the ProcessPoolRunner
+        @param workers: number of worker processes
+        @param logger: logging.Logger
+        @param artifact_cache: optional ArtifactCache handed to the function with every message
+        """
+        assert workers >= 1, "The process pool needs at least one worker"
+        self.workers = workers
+        self.logger = logger
+        self.artifact_cache = artifact_cache
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def start(self):
+        """Starts the worker processes"""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context(START_METHOD),
+            )
+
+    def stop(self):
+        """Waits for running functions and shuts the worker processes down"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    async def run(
+        self,
+        function: Callable[[ProcessMessage], Any],
+        in_message: IncomingMessage,
+    ) -> Union[pd.DataFrame, List[pd.DataFrame], dict]:
+        """
+        Runs the function with the ProcessMessage of in_message in a worker process
+        @param function: picklable function, e.g. a staticmethod of the ML Tool
+        @param in_message: IncomingMessage
+        @return: the result of the function
+        """
+        if self._executor is None:
+            raise NotInitialized("The process pool has to be started first")
+        message = ProcessMessage(in_message)
+        message.artifact_cache = self.artifact_cache
+        shared = message.share()
+        self.logger.debug(
+            "Run %s in process pool with %d shared frames",
+            in_message.id_ref,
+            len(shared),
+        )
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, _execute_in_worker, function, message
+            )
+        finally:
+            for frame in shared:
+                frame.release()
@@ -0,0 +1,324 @@
+"""
+This module provides the publish pipeline, which hands outgoing messages to the mqtt client and
+tracks them until the broker acknowledged them
+"""
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, NamedTuple, Optional, Union
+
+import paho.mqtt.client as mqtt
+from paho.mqtt.properties import Properties
+
+from ..misc import PublishFailed
+from ..misc.prometheus import (
+    publish_duration,
+    publish_failure_counter,
+    publish_inflight,
+)
+
+
+class _Pending(NamedTuple):
+    future: Future
+    topic: str
+    started: float
+
+
+# pylint: disable=too-many-instance-attributes
+class PublishPipeline:
+    """
+    The PublishPipeline publishes messages with the mqtt client and returns a future per
+    message, which resolves to the mid of the message as soon as the client reports it as
+    published. For QoS 0 this is the case once the message is written to the socket, for QoS 1
+    and 2 once the broker acknowledged it.
+
+    At most max_pending messages are published but not acknowledged at the same time. Further
+    messages wait for a free slot, so a slow broker slows down the ML Tool instead of piling up
+    results in memory. The client itself still limits the messages on the wire with its
+    max_inflight_messages setting and queues the others.
+
+    Messages that wait longer than timeout seconds for a slot or for their acknowledgement fail
+    with PublishFailed. The acknowledgement deadlines are checked whenever a message is submitted
+    or acknowledged, so the pipeline recovers, even if the thread of the mqtt client, which
+    handles the acknowledgements, is blocked by a full ingest queue itself.
+
+    Acknowledgements of unknown mids are dropped, e.g. of messages published directly with the
+    client or of messages, which already expired. Only while a message is handed to the client,
+    acknowledgements are kept, as the client may report the message as published before it
+    returned its mid.
+    """
+
+    def __init__(
+        self,
+        client: mqtt.Client,
+        logger: logging.Logger,
+        max_pending: int = 100,
+        timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Constructor of the PublishPipeline. The on_publish method has to be registered as
+        on_publish callback of the client.
+        @param client: mqtt.Client
+        @param logger: logging.Logger
+        @param max_pending: maximum number of published messages, which are not acknowledged
+        @param timeout: number of seconds a message may wait for a slot or its acknowledgement
+        @param clock: function returning the current time in seconds
+        """
+        assert (
+            max_pending >= 1
+        ), "The publish pipeline needs room for at least one message"
+        assert timeout > 0, "The publish timeout has to be positive"
+        self.client = client
+        self.logger = logger
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._clock = clock
+        self._pending: Dict[int, _Pending] = {}
+        # Acknowledgements of unknown mids, which arrived while messages were handed to the
+        # client, by their sequence number. _sending holds the sequence number at the start of
+        # every publish in progress, so only the acknowledgements after it count for a message.
+        self._acknowledged: Dict[int, int] = {}
+        self._acks = 0
+        self._sending: List[int] = []
+        self._reserved = 0
+        self._condition = threading.Condition()
+        self._closed = False
+        self.published = 0
+        self.failed = 0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def on_publish(self, *args):
+        """
+        Callback of the mqtt client for published messages. It accepts the arguments of both
+        callback API versions, which start with client, userdata and mid.
+        """
+        mid = args[2]
+        with self._condition:
+            pending = self._pending.pop(mid, None)
+            if pending is not None:
+                self._complete(pending.future, mid, pending.started)
+            elif self._sending:
+                self._acks += 1
+                self._acknowledged[mid] = self._acks
+            self._expire()
+
+    def _update(self):
+        """Wakes up waiting publishers and updates the gauge. Requires the lock."""
+        publish_inflight.set(len(self._pending))
+        self._condition.notify_all()
+
+    def _complete(self, future: Future, mid: Optional[int], started: float):
+        self.published += 1
+        publish_duration.observe(self._clock() - started)
+        if not future.done():
+            future.set_result(mid)
+
+    def _fail(self, future: Future, topic: str, reason: str, message: str):
+        self.failed += 1
+        publish_failure_counter.labels(reason).inc()
+        self.logger.error("Publishing to %s failed: %s", topic, message)
+        if not future.done():
+            future.set_exception(PublishFailed(message))
+
+    def _forget(self, mark: int):
+        """
+        Ends a publish in progress and drops the acknowledgements, which no other publish in
+        progress can be waiting for. Requires the lock.
+        @param mark: sequence number of the acknowledgements at the start of the publish
+        """
+        self._sending.remove(mark)
+        if not self._sending:
+            self._acknowledged.clear()
+            return
+        oldest = min(self._sending)
+        for mid in [mid for mid, ack in self._acknowledged.items() if ack <= oldest]:
+            del self._acknowledged[mid]
+
+    def _expire(self):
+        """Fails the messages waiting too long for their acknowledgement. Requires the lock."""
+        deadline = self._clock() - self.timeout
+        for mid in [
+            mid for mid, item in self._pending.items() if item.started < deadline
+        ]:
+            pending = self._pending.pop(mid)
+            self._fail(
+                pending.future,
+                pending.topic,
+                "timeout",
+                "The message {} was not acknowledged within {}s".format(
+                    mid, self.timeout
+                ),
+            )
+        self._update()
+
+    def _reserve(self, timeout: Optional[float]) -> bool:
+        """
+        Reserves a slot for a message
+        @param timeout: seconds to wait for a free slot, None reserves a slot beyond the limit
+        @return: bool, false if no slot is free in time or the pipeline is closed
+        """
+        with self._condition:
+            self._expire()
+            if timeout is not None:
+                deadline = self._clock() + timeout
+                while (
+                    not self._closed
+                    and len(self._pending) + self._reserved >= self.max_pending
+                ):
+                    self._expire()
+                    remaining = deadline - self._clock()
+                    if len(self._pending) + self._reserved < self.max_pending:
+                        break
+                    if remaining <= 0:
+                        return False
+                    self._condition.wait(remaining)
+            if self._closed:
+                return False
+            self._reserved += 1
+            return True
+
+    def _refuse(self, future: Future, topic: str):
+        if self._closed:
+            self._fail(future, topic, "closed", "The publish pipeline is closed")
+        else:
+            self._fail(
+                future,
+                topic,
+                "backpressure",
+                "No slot became free within {}s".format(self.timeout),
+            )
+
+    # Every error of the client has to fail the future instead of the caller
+    # pylint: disable=broad-except
+    def _send(
+        self,
+        future: Future,
+        topic: str,
+        payload: Union[str, bytes],
+        options: dict,
+    ) -> Future:
+        """Publishes the message in a reserved slot"""
+        started = self._clock()
+        with self._condition:
+            mark = self._acks
+            self._sending.append(mark)
+        try:
+            info = self.client.publish(topic, payload=payload, **options)
+        except Exception as error:
+            with self._condition:
+                self._forget(mark)
+                self._reserved -= 1
+                self._update()
+            self._fail(future, topic, "error", str(error))
+            return future
+        with self._condition:
+            early = info is not None and self._acknowledged.get(info.mid, mark) > mark
+            self._forget(mark)
+            self._reserved -= 1
+            if info is None:
+                # Clients without delivery tracking publish right away
+                self._complete(future, None, started)
+            elif info.rc != mqtt.MQTT_ERR_SUCCESS and not (
+                info.rc == mqtt.MQTT_ERR_NO_CONN and options["qos"] > 0
+            ):
+                # Without a connection, only messages of QoS 1 and 2 are kept for a retry
+                self._fail(future, topic, "error", mqtt.error_string(info.rc))
+            elif early:
+                self._complete(future, info.mid, started)
+            else:
+                self._pending[info.mid] = _Pending(future, topic, started)
+            self._update()
+        return future
+
+    def submit(
+        self,
+        topic: str,
+        payload: Union[str, bytes],
+        qos: int = 0,
+        retain: bool = False,
+        wait: bool = True,
+        properties: Optional[Properties] = None,
+    ) -> Future:
+        """
+        Publishes a message. Blocks while max_pending messages are not acknowledged.
+        @param topic: str
+        @param payload: str or the bytes of an encoded payload
+        @param qos: quality of service of the message
+        @param retain: if true, the broker retains the message for new subscribers
+        @param wait: if false, the message is published without waiting for a slot. This is
+        required on the thread of the mqtt client, which handles the acknowledgements.
+        @param properties: optional MQTT v5 properties of the message
+        @return: concurrent.futures.Future resolving to the mid of the message
+        """
+        future = Future()
+        future.set_running_or_notify_cancel()
+        if not self._reserve(self.timeout if wait else None):
+            self._refuse(future, topic)
+            return future
+        return self._send(
+            future, topic, payload, self._options(qos, retain, properties)
+        )
+
+    async def publish(
+        self,
+        topic: str,
+        payload: Union[str, bytes],
+        qos: int = 0,
+        retain: bool = False,
+        properties: Optional[Properties] = None,
+    ) -> Future:
+        """
+        Publishes a message like submit. While no slot is free, the waiting is done in the
+        default executor of the running loop, so other coroutines of the loop keep running.
+        @param topic: str
+        @param payload: str or the bytes of an encoded payload
+        @param qos: quality of service of the message
+        @param retain: if true, the broker retains the message for new subscribers
+        @param properties: optional MQTT v5 properties of the message
+        @return: concurrent.futures.Future resolving to the mid of the message
+        """
+        future = Future()
+        future.set_running_or_notify_cancel()
+        if not self._reserve(0) and not (
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._reserve, self.timeout
+            )
+        ):
+            self._refuse(future, topic)
+            return future
+        return self._send(
+            future, topic, payload, self._options(qos, retain, properties)
+        )
+
+    @staticmethod
+    def _options(qos: int, retain: bool, properties: Optional[Properties]) -> dict:
+        options = {"qos": qos, "retain": retain}
+        # Clients connected with MQTT 3.1.1 don't accept properties
+        if properties is not None:
+            options["properties"] = properties
+        return options
+
+    def close(self, timeout: float = 0.0):
+        """
+        Closes the pipeline. Messages, which are not acknowledged within timeout seconds, fail.
+        @param timeout: seconds to wait for the pending messages
+        """
+        with self._condition:
+            deadline = self._clock() + timeout
+            while self._pending and self._clock() < deadline:
+                self._condition.wait(deadline - self._clock())
+            self._closed = True
+            pending, self._pending = self._pending, {}
+            for mid, item in pending.items():
+                self._fail(
+                    item.future,
+                    item.topic,
+                    "closed",
+                    "The message {} was not acknowledged before closing".format(mid),
+                )
+            self._update()
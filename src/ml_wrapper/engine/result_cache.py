@@ -0,0 +1,122 @@
+"""
+This module provides the result cache, which keeps the published result bodies of the ML Tool,
+so identical triggers are answered without running the tool again
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, NamedTuple, Optional
+
+from ..misc import JSON_CODEC
+from ..misc.prometheus import result_cache_hits, result_cache_misses
+
+
+class _CachedResult(NamedTuple):
+    body: dict
+    size: int
+    expires: float
+
+
+class ResultCache:
+    """
+    The ResultCache maps the content hash of a trigger payload to the body of the published
+    result. It evicts the least recently used results, if it holds more than max_entries
+    results or more than max_bytes bytes of serialised payloads. Results older than ttl seconds
+    are not returned anymore.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl: float = 0.0,
+        max_bytes: int = 0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Constructor of the ResultCache
+        @param max_entries: maximum number of cached results
+        @param ttl: number of seconds a result stays valid, 0 keeps results until evicted
+        @param max_bytes: maximum size of all cached results, 0 disables the limit
+        @param clock: function returning the current time in seconds
+        """
+        assert max_entries >= 1, "The result cache needs room for at least one result"
+        assert ttl >= 0, "The ttl of the result cache cannot be negative"
+        assert max_bytes >= 0, "The byte limit of the result cache cannot be negative"
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._results: "OrderedDict[str, _CachedResult]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+    @staticmethod
+    def key(body: dict, *parts: str) -> str:
+        """
+        Calculates the key of a trigger payload body. The body is serialised with sorted keys,
+        so the order of its fields does not matter.
+        @param body: dict, the body of the trigger payload
+        @param parts: further strings the result depends on, e.g. the model url and tag
+        @return: str
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        for part in parts:
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        digest.update(JSON_CODEC.dumps_bytes(body, sort_keys=True))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        Returns the cached body for the key or None, if there is no valid result
+        @param key: str
+        @return: dict or None
+        """
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None and cached.expires < self._clock():
+                self._remove(key)
+                cached = None
+            if cached is None:
+                self.misses += 1
+                result_cache_misses.inc()
+                return None
+            self._results.move_to_end(key)
+            self.hits += 1
+            result_cache_hits.inc()
+            return cached.body
+
+    def put(self, key: str, body: dict, size: int):
+        """
+        Stores a result body. Results larger than max_bytes are not stored.
+        @param key: str
+        @param body: dict, the body of the published result
+        @param size: the size of the serialised result in bytes
+        """
+        if self.max_bytes and size > self.max_bytes:
+            return
+        expires = self._clock() + self.ttl if self.ttl else float("inf")
+        with self._lock:
+            if key in self._results:
+                self._remove(key)
+            self._results[key] = _CachedResult(body, size, expires)
+            self.nbytes += size
+            while len(self._results) > self.max_entries or (
+                self.max_bytes and self.nbytes > self.max_bytes
+            ):
+                self._remove(next(iter(self._results)))
+
+    def _remove(self, key: str):
+        self.nbytes -= self._results.pop(key).size
+
+    def clear(self):
+        """Removes all cached results"""
+        with self._lock:
+            self._results.clear()
+            self.nbytes = 0
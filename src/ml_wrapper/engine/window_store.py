@@ -0,0 +1,210 @@
+"""
+This module provides the window store, which keeps the latest rows of the sensor updates per
+machine and sensor in ring buffers, so tools can access a sliding window of a sensor without
+concatenating DataFrames themselves
+"""
+import threading
+from typing import Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+def write_mirrored(buffer: np.ndarray, capacity: int, end: int, values: np.ndarray):
+    """
+    Writes values into both halves of a mirrored ring buffer of 2 * capacity elements
+    @param buffer: np.ndarray
+    @param capacity: number of values the ring buffer holds
+    @param end: position in the first half behind the last value written before
+    @param values: np.ndarray of at most capacity values
+    """
+    first = min(len(values), capacity - end)
+    for offset in (0, capacity):
+        buffer[offset + end : offset + end + first] = values[:first]
+        buffer[offset : offset + len(values) - first] = values[first:]
+
+
+class SensorWindow:
+    """
+    The SensorWindow keeps the latest rows of one sensor in preallocated numpy columns. Every
+    column is a mirrored ring buffer of twice the capacity, in which each row is written twice.
+    Like this the rows of the window are always one contiguous slice and view() returns a
+    DataFrame without copying them.
+
+    Rows are evicted if the window holds more than max_rows rows, or if they are more than
+    seconds older than the latest row of the time column. The capacity grows as needed.
+    """
+
+    def __init__(
+        self,
+        max_rows: int = 0,
+        seconds: float = 0.0,
+        time_column: Optional[str] = None,
+        capacity: int = 1024,
+    ):
+        """
+        Constructor of the SensorWindow
+        @param max_rows: maximum number of rows in the window, 0 disables the limit
+        @param seconds: maximum age of rows relative to the latest row, 0 disables the limit
+        @param time_column: name of the time column, defaults to the first datetime column
+        @param capacity: number of rows the buffers are allocated for at first
+        """
+        assert max_rows >= 0, "max_rows cannot be negative"
+        assert seconds >= 0, "seconds cannot be negative"
+        assert max_rows or seconds, "The window needs a row or a time limit"
+        assert capacity >= 1, "The capacity has to be at least 1"
+        self.max_rows = max_rows
+        self.seconds = seconds
+        self.time_column = time_column
+        self.capacity = min(capacity, max_rows) if max_rows else capacity
+        self._layout: List[Tuple[str, np.dtype]] = []
+        self._buffers: Dict[str, np.ndarray] = {}
+        self._end = 0
+        self._length = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    @property
+    def columns(self) -> List[str]:
+        """Returns the column names of the window"""
+        return [name for name, _ in self._layout]
+
+    def _allocate(self, capacity: int):
+        """Moves the rows of the window into new buffers of the given capacity"""
+        length = min(self._length, capacity)
+        start = (self._end - length) % self.capacity
+        buffers = {}
+        for name, dtype in self._layout:
+            buffer = np.empty(2 * capacity, dtype=dtype)
+            rows = self._buffers[name][start : start + length]
+            buffer[:length] = rows
+            buffer[capacity : capacity + length] = rows
+            buffers[name] = buffer
+        self._buffers = buffers
+        self.capacity = capacity
+        self._end = length % capacity
+        self._length = length
+
+    def _reset(self, frame: pd.DataFrame):
+        """Starts an empty window with the columns of the frame"""
+        self._layout = list(zip(map(str, frame.columns), frame.dtypes))
+        self._buffers = {
+            name: np.empty(2 * self.capacity, dtype=dtype)
+            for name, dtype in self._layout
+        }
+        self._end = 0
+        self._length = 0
+        if self.seconds and self.time_column is None:
+            self.time_column = next(
+                (name for name, dtype in self._layout if dtype.kind == "M"), None
+            )
+        assert not self.seconds or self.time_column in self.columns, (
+            "A window limited by time requires a datetime column, but the columns "
+            "are {}".format(self.columns)
+        )
+
+    def append(self, frame: pd.DataFrame):
+        """
+        Appends the rows of the frame and evicts the rows outside of the window. If the columns
+        of the frame differ from the window's columns, the window starts over.
+        @param frame: pd.DataFrame
+        """
+        assert isinstance(frame, pd.DataFrame), "Only DataFrames can be appended"
+        if list(zip(map(str, frame.columns), frame.dtypes)) != self._layout:
+            self._reset(frame)
+        if self.max_rows and len(frame) > self.max_rows:
+            frame = frame.iloc[-self.max_rows :]
+        required = self._length + len(frame)
+        if required > self.capacity and (
+            not self.max_rows or self.capacity < self.max_rows
+        ):
+            capacity = self.capacity
+            while capacity < required:
+                capacity *= 2
+            self._allocate(min(capacity, self.max_rows) if self.max_rows else capacity)
+        for position, (name, _) in enumerate(self._layout):
+            write_mirrored(
+                self._buffers[name],
+                self.capacity,
+                self._end,
+                frame.iloc[:, position].to_numpy(),
+            )
+        self._end = (self._end + len(frame)) % self.capacity
+        self._length = min(required, self.capacity)
+        if self.seconds and self._length:
+            times = self._rows(self.time_column)
+            cutoff = times[-1] - np.timedelta64(int(self.seconds * 1e9), "ns")
+            self._length -= int(np.searchsorted(times, cutoff, side="left"))
+
+    def _rows(self, name: str) -> np.ndarray:
+        """Returns the rows of one column as a view into its buffer"""
+        start = (self._end - self._length) % self.capacity
+        return self._buffers[name][start : start + self._length]
+
+    def view(self) -> pd.DataFrame:
+        """
+        Returns the rows of the window as DataFrame. The DataFrame shares the memory with the
+        window and is only valid until the next rows are appended.
+        @return: pd.DataFrame
+        """
+        return pd.DataFrame(
+            {name: self._rows(name) for name, _ in self._layout}, copy=False
+        )
+
+
+class WindowStore:
+    """
+    The WindowStore keeps one SensorWindow per key, e.g. per machine and sensor
+    """
+
+    def __init__(
+        self, max_rows: int = 0, seconds: float = 0.0, time_column: str = None
+    ):
+        """
+        Constructor of the WindowStore
+        @param max_rows: maximum number of rows per window, 0 disables the limit
+        @param seconds: maximum age of the rows per window, 0 disables the limit
+        @param time_column: name of the time column, defaults to the first datetime column
+        """
+        assert max_rows or seconds, "The windows need a row or a time limit"
+        self.max_rows = max_rows
+        self.seconds = seconds
+        self.time_column = time_column
+        self._windows: Dict[Hashable, SensorWindow] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._windows)
+
+    def get(self, key: Hashable) -> Optional[SensorWindow]:
+        """
+        Returns the window of the key, if there is one
+        @param key: Hashable
+        @return: SensorWindow or None
+        """
+        return self._windows.get(key)
+
+    def append(
+        self, key: Hashable, frame: pd.DataFrame, copy: bool = True
+    ) -> pd.DataFrame:
+        """
+        Appends the rows of the frame to the window of the key
+        @param key: Hashable
+        @param frame: pd.DataFrame
+        @param copy: if false, the view of the window is returned, which is overwritten by the
+        next append and may only be used by the thread appending to the store
+        @return: pd.DataFrame, the window after appending
+        """
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None:
+                window = SensorWindow(
+                    max_rows=self.max_rows,
+                    seconds=self.seconds,
+                    time_column=self.time_column,
+                )
+                self._windows[key] = window
+            window.append(frame)
+            view = window.view()
+            return view.copy() if copy else view
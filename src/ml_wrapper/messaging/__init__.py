@@ -2,6 +2,13 @@
 The messaging module provides functionality and logic around messages and jsons
 """
 
+from .content_encoding import (
+    CONTENT_ENCODINGS,
+    MAX_DECOMPRESSED_SIZE,
+    PayloadEncoder,
+    available_encodings,
+    decode_payload,
+)
 from .json_handling import *
 from .message_type import MessageType
 from .messaging import IncomingMessage, OutgoingMessage
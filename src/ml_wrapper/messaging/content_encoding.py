@@ -0,0 +1,176 @@
+"""
+This module provides the content encodings of the payloads. Results can be published as
+compressed json, which is announced with the content type and a content-encoding user property
+of MQTT v5. Compressed payloads are recognised by their magic number, too, so tools connected
+with MQTT 3.1.1, which has no properties, can read them as well.
+
+Received payloads are decompressed chunk by chunk and rejected as soon as they exceed a maximum
+size, so a small compressed payload cannot expand to gigabytes on the ingest path.
+"""
+import gzip
+import zlib
+from typing import Iterator, Optional, Union
+
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CONTENT_TYPE = "application/json"
+ENCODING_PROPERTY = "content-encoding"
+IDENTITY = "identity"
+CONTENT_ENCODINGS = (IDENTITY, "gzip", "zstd")
+_MAGIC_NUMBERS = ((b"\x1f\x8b", "gzip"), (b"\x28\xb5\x2f\xfd", "zstd"))
+MAX_DECOMPRESSED_SIZE = 256 * 1024 * 1024
+_CHUNK_SIZE = 1024 * 1024
+
+
+def available_encodings() -> tuple:
+    """Returns the content encodings, which can be used with the installed packages"""
+    return tuple(
+        encoding
+        for encoding in CONTENT_ENCODINGS
+        if encoding != "zstd" or zstandard is not None
+    )
+
+
+def encoding_of(payload: bytes, properties: Optional[Properties] = None) -> str:
+    """
+    Returns the content encoding of a received payload. The content-encoding user property is
+    used if the message has one, otherwise the encoding is detected by the magic number.
+    @param payload: bytes
+    @param properties: the MQTT v5 properties of the message
+    @return: str, one of CONTENT_ENCODINGS
+    """
+    for name, value in getattr(properties, "UserProperty", None) or []:
+        if name == ENCODING_PROPERTY:
+            return value
+    if isinstance(payload, (bytes, bytearray, memoryview)):
+        for magic, encoding in _MAGIC_NUMBERS:
+            if bytes(payload[: len(magic)]) == magic:
+                return encoding
+    return IDENTITY
+
+
+def _gzip_chunks(payload: bytes) -> Iterator[bytes]:
+    data = bytes(payload)
+    # Like gzip.decompress, concatenated members are decompressed one after the other
+    while data:
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        while not decompressor.eof:
+            chunk = decompressor.decompress(data, _CHUNK_SIZE)
+            data = decompressor.unconsumed_tail
+            if not chunk and not data and not decompressor.eof:
+                raise ValueError("The gzip payload ends before the end of its stream")
+            yield chunk
+        data = decompressor.unused_data
+
+
+def _zstd_chunks(payload: bytes) -> Iterator[bytes]:
+    with zstandard.ZstdDecompressor().stream_reader(payload) as reader:
+        chunk = reader.read(_CHUNK_SIZE)
+        while chunk:
+            yield chunk
+            chunk = reader.read(_CHUNK_SIZE)
+
+
+def decode_payload(
+    payload: Union[str, bytes],
+    properties: Optional[Properties] = None,
+    max_size: int = MAX_DECOMPRESSED_SIZE,
+) -> Union[str, bytes]:
+    """
+    Decompresses a received payload
+    @param payload: the payload of the mqtt message
+    @param properties: the MQTT v5 properties of the message
+    @param max_size: maximum number of bytes of the decompressed payload
+    @return: the json payload as str or bytes
+    @raise ValueError, if the encoding is unknown or not installed or the decompressed payload
+    exceeds max_size
+    """
+    encoding = encoding_of(payload, properties)
+    if encoding == IDENTITY:
+        return payload
+    if encoding == "gzip":
+        chunks = _gzip_chunks(payload)
+    elif encoding == "zstd" and zstandard is not None:
+        chunks = _zstd_chunks(payload)
+    else:
+        raise ValueError(
+            "The content encoding {} is not one of {}".format(
+                encoding, available_encodings()
+            )
+        )
+    decompressed = []
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        if size > max_size:
+            raise ValueError(
+                "The {} payload of {} bytes decompresses to more than {} bytes".format(
+                    encoding, len(payload), max_size
+                )
+            )
+        decompressed.append(chunk)
+    return b"".join(decompressed)
+
+
+class PayloadEncoder:
+    """
+    The PayloadEncoder compresses the json payloads of at least threshold bytes with the
+    configured encoding. Smaller payloads are published as they are, because the compression
+    would cost more time than it saves on the wire.
+    """
+
+    def __init__(self, encoding: str = IDENTITY, threshold: int = 0, level: int = -1):
+        """
+        Constructor of the PayloadEncoder
+        @param encoding: one of CONTENT_ENCODINGS
+        @param threshold: minimum size of a payload in bytes to compress it
+        @param level: compression level, -1 uses the default of the encoding
+        """
+        assert (
+            encoding in available_encodings()
+        ), "The content encoding has to be one of {}, but received {}".format(
+            available_encodings(), encoding
+        )
+        assert threshold >= 0, "The compression threshold cannot be negative"
+        self.encoding = encoding
+        self.threshold = threshold
+        self.level = level
+        self._zstd = (
+            zstandard.ZstdCompressor(level=3 if level < 0 else level)
+            if encoding == "zstd"
+            else None
+        )
+
+    def encode(self, payload: str) -> Union[str, bytes]:
+        """
+        Compresses the payload, if it is large enough
+        @param payload: json string
+        @return: the json string or the compressed bytes
+        """
+        if self.encoding == IDENTITY or len(payload) < self.threshold:
+            return payload
+        data = payload.encode("utf-8")
+        if self._zstd is not None:
+            return self._zstd.compress(data)
+        # The fixed mtime keeps the output of equal payloads equal
+        return gzip.compress(
+            data, compresslevel=6 if self.level < 0 else self.level, mtime=0
+        )
+
+    def properties(self, payload: Union[str, bytes]) -> Properties:
+        """
+        Returns the MQTT v5 properties announcing the content of an encoded payload
+        @param payload: the result of encode
+        @return: Properties
+        """
+        properties = Properties(PacketTypes.PUBLISH)
+        properties.ContentType = CONTENT_TYPE
+        if isinstance(payload, bytes):
+            properties.UserProperty = (ENCODING_PROPERTY, self.encoding)
+        return properties
@@ -3,5 +3,14 @@ This module provides functionality for various json tasks
 """
 
 from .convert_data import *
+from .frame_fan_out import (
+    FAN_OUT_BACKENDS,
+    FRAME_FAN_OUT,
+    FrameFanOut,
+    decode_data_frames,
+    encode_data_frames,
+)
 from .json_provider import *
 from .json_validator import *
+from .schema_compiler import CompiledSchema, SchemaNotCompilable
+from .stream_decoder import StreamDecoder, insert_columns, stream_decode
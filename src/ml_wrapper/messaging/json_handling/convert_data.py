@@ -2,13 +2,103 @@
 Utility Module to convert data to and from json-usable format.
 """
 import re
+import uuid
+import warnings
 from collections import defaultdict
-from typing import List
+from typing import Any, List, Tuple
+
+import numpy as np
 import pandas as pd
 
+from ml_wrapper.misc import JSON_CODEC
+
 JSON_TYPES = {"number": "float64", "string": "str", "rfctime": "datetime64"}
 
 
+def _parse_numbers(values: list) -> np.ndarray:
+    return np.array(values, dtype=np.float64)
+
+
+def _parse_datetimes(values: list) -> np.ndarray:
+    """
+    Parses RFC3339 strings into naive UTC datetime64 values. numpy parses the common case of
+    UTC times in bulk, all other offsets are converted by pandas.
+    """
+    try:
+        with warnings.catch_warnings():
+            # numpy only warns about time zones it cannot handle
+            warnings.simplefilter("error")
+            return np.array(
+                [
+                    value[:-1]
+                    if value[-1:] == "Z"
+                    else value[:-6]
+                    if value[-6:] == "+00:00"
+                    else value
+                    for value in values
+                ],
+                dtype="datetime64[ns]",
+            )
+    except (TypeError, ValueError, DeprecationWarning):
+        return (
+            pd.to_datetime(pd.Series(values, dtype=object), utc=True)
+            .dt.tz_localize(None)
+            .to_numpy()
+        )
+
+
+def _parse_strings(values: list) -> np.ndarray:
+    return pd.Series(values, dtype=object).astype(str).to_numpy()
+
+
+COLUMN_PARSERS = {
+    "number": _parse_numbers,
+    "rfctime": _parse_datetimes,
+    "string": _parse_strings,
+}
+
+
+def parse_column(column: dict, values: list) -> np.ndarray:
+    """
+    Parses the values of one column according to the type of its specification
+    @param column: dict, the column specification with name and type
+    @param values: list of the column values
+    @return: np.ndarray
+    """
+    if isinstance(values, np.ndarray):
+        return values
+    return COLUMN_PARSERS.get(column.get("type"), _parse_strings)(values)
+
+
+def decode_data_frame(columns: List[dict], data: List[list]) -> pd.DataFrame:
+    """
+    Builds a DataFrame from the column major data of a payload. Every column is parsed directly
+    into a typed numpy array, so neither a transposed copy nor a conversion from strings of the
+    whole frame is needed. Like a transposition, longer columns are cut to the shortest one.
+    Columns which are numpy arrays already are taken as they are.
+    @param columns: list of the column specifications with name and type
+    @param data: list of the column values
+    @return: pd.DataFrame
+    """
+    if len(columns) != len(data):
+        raise ValueError(
+            "{} columns passed, passed data had {} columns".format(
+                len(columns), len(data)
+            )
+        )
+    rows = min((len(values) for values in data), default=0)
+    dataframe = pd.DataFrame(
+        {
+            position: parse_column(
+                column, values if len(values) == rows else values[:rows]
+            )
+            for position, (column, values) in enumerate(zip(columns, data))
+        }
+    )
+    dataframe.columns = [column.get("name") for column in columns]
+    return dataframe
+
+
 def retrieve_dataframe(results: dict) -> (pd.DataFrame, List[dict], List[dict]):
     """
     Convert the data contained in the results section of
@@ -19,18 +109,27 @@ def retrieve_dataframe(results: dict) -> (pd.DataFrame, List[dict], List[dict]):
     :returns columns: Specification about column types and names
     :returns data: Data from payload in list-representation
     """
-    data = results.get("data")
-    data = list(map(list, zip(*data)))  # transpose data
-
     columns = results.get("columns")
-    column_names = [col.get("name") for col in columns]
-    column_types = {col.get("name"): JSON_TYPES.get(col.get("type")) for col in columns}
-
-    dataframe = pd.DataFrame(data=data, columns=column_names)
-    dataframe = dataframe.astype(dtype=column_types)
+    dataframe = decode_data_frame(columns, results.get("data"))
+    data = list(map(list, zip(*results.get("data"))))  # transpose data
     return dataframe, columns, data
 
 
+def retrieve_column_meta(columns: List[dict]) -> dict:
+    """
+    Collects the meta information of the columns of a data-formal.json payload
+    :param columns: Specification about column types, names and meta information
+    :return column_meta: dict of the meta information by column name
+    """
+    column_meta = defaultdict(
+        lambda: {"unit": None, "description": None, "future": None}
+    )
+    for col in columns:
+        for meta, val in col.get("meta").items():
+            column_meta[col.get("name")][meta] = val
+    return dict(column_meta)
+
+
 def retrieve_sensor_update_data(payload: dict):
     """
     This method retrieves the data of a data-formal.json payload
@@ -41,22 +140,11 @@ def retrieve_sensor_update_data(payload: dict):
     :return metadata: List of dictionary containing metadata about the data and data acquisition
     :return timestamp: Timestamp of the incoming message
     """
-    data = payload.get("data")
-    data = list(map(list, zip(*data)))  # transpose data
-
     columns = payload.get("columns")
-    column_names = [col.get("name") for col in columns]
-    column_types = {col.get("name"): JSON_TYPES.get(col.get("type")) for col in columns}
-    column_meta = defaultdict(
-        lambda: {"unit": None, "description": None, "future": None}
-    )
-    for col in columns:
-        for meta, val in col.get("meta").items():
-            column_meta[col.get("name")][meta] = val
-    column_meta = dict(column_meta)
+    column_meta = retrieve_column_meta(columns)
 
-    dataframe = pd.DataFrame(data=data, columns=column_names)
-    dataframe = dataframe.astype(dtype=column_types)
+    dataframe = decode_data_frame(columns, payload.get("data"))
+    data = list(map(list, zip(*payload.get("data"))))  # transpose data
 
     metadata = payload.get("meta")
     return dataframe, columns, data, metadata, column_meta
@@ -91,3 +179,212 @@ def resolve_data_frame(dataframe: pd.DataFrame) -> (list, list):
         column[col_dict_i]["type"] = type_
 
     return column, data_accumulator
+
+
+# numpy kinds whose string representation is written without json escaping
+FORMATTED_KINDS = "biuf"
+_QUOTE, _COMMA = ord('"'), ord(",")
+
+
+# pylint: disable=too-few-public-methods
+class RawJson:
+    """
+    An already serialised json value within a json dictionary. It is written to the payload as
+    it is, while the schema validation sees the small stand_in value instead.
+    """
+
+    __slots__ = ("text", "stand_in")
+
+    def __init__(self, text: str, stand_in: Any = None):
+        """
+        Constructor of RawJson
+        @param text: str, the serialised json value
+        @param stand_in: value which has the same schema relevant shape as the json value
+        """
+        self.text = text
+        self.stand_in = stand_in
+
+    def loads(self) -> Any:
+        """
+        Parses the serialised json value
+        @return: the json value
+        """
+        return JSON_CODEC.loads(self.text)
+
+
+def _json_type(dtype) -> str:
+    type_ = str(dtype)
+    if re.findall("(int.*)|(float.*)", type_):
+        return "number"
+    if re.findall("(datetime.*)", type_):
+        return "rfctime"
+    return "string"
+
+
+def _join_fixed_width(values: np.ndarray) -> str:
+    """
+    Writes a fixed width bytes array as json array of strings. Every value is placed between
+    quotes in a byte matrix, the padding is masked out afterwards.
+    The values must neither contain null bytes nor characters that need json escaping.
+    """
+    if len(values) == 0:
+        return "[]"
+    width = values.dtype.itemsize
+    buffer = np.zeros((len(values), width + 3), dtype=np.uint8)
+    buffer[:, 0] = _QUOTE
+    buffer[:, 1 : width + 1] = values.view(np.uint8).reshape(len(values), width)
+    buffer[:, width + 1] = _QUOTE
+    buffer[:, width + 2] = _COMMA
+    return "[" + buffer[buffer != 0][:-1].tobytes().decode("ascii") + "]"
+
+
+def _put_digits(matrix: np.ndarray, column: int, numbers: np.ndarray, width: int):
+    for digit in range(width):
+        matrix[:, column + width - 1 - digit] = ord("0") + numbers // 10**digit % 10
+
+
+def _format_datetimes(values: np.ndarray) -> np.ndarray:
+    """
+    Formats naive UTC datetime64 values as RFC3339 strings. The digits are written into a byte
+    matrix with integer arithmetic, which is considerably faster than np.datetime_as_string.
+    The fraction of seconds gets the fewest digits that keep every value exact.
+    """
+    values = values.astype("datetime64[ns]")
+    not_a_time = np.isnat(values)
+    ticks = values.view(np.int64)[~not_a_time]
+    digits = next(
+        digits for digits in (0, 3, 6, 9) if not np.any(ticks % 10 ** (9 - digits))
+    )
+    months = values.astype("datetime64[M]")
+    days = values.astype("datetime64[D]")
+    nanoseconds = (values - days).astype(np.int64)
+    seconds = nanoseconds // 10**9
+    width = len("YYYY-MM-DDTHH:MM:SSZ") + (digits + 1 if digits else 0)
+    matrix = np.empty((len(values), width), dtype=np.uint8)
+    _put_digits(matrix, 0, months.astype(np.int64) // 12 + 1970, 4)
+    _put_digits(matrix, 5, months.astype(np.int64) % 12 + 1, 2)
+    _put_digits(matrix, 8, (days - months).astype(np.int64) + 1, 2)
+    _put_digits(matrix, 11, seconds // 3600, 2)
+    _put_digits(matrix, 14, seconds // 60 % 60, 2)
+    _put_digits(matrix, 17, seconds % 60, 2)
+    matrix[:, [4, 7]] = ord("-")
+    matrix[:, 10] = ord("T")
+    matrix[:, [13, 16]] = ord(":")
+    if digits:
+        matrix[:, 19] = ord(".")
+        _put_digits(matrix, 20, nanoseconds % 10**9 // 10 ** (9 - digits), digits)
+    matrix[:, -1] = ord("Z")
+    formatted = matrix.view("S{}".format(width)).ravel()
+    formatted[not_a_time] = b"NaT"
+    return formatted
+
+
+def encode_column(column: pd.Series) -> Tuple[str, str]:
+    """
+    Encodes one column as json array of strings with a formatter fitting its dtype.
+    Numbers are formatted by numpy, datetimes are written as RFC3339 in UTC, all other values
+    are turned into strings and serialised by the json codec.
+    @param column: pd.Series
+    @return: the json type of the column and the serialised json array
+    """
+    dtype = column.dtype
+    if isinstance(dtype, np.dtype) and dtype.kind in FORMATTED_KINDS:
+        return _json_type(dtype), _join_fixed_width(column.to_numpy().astype("S"))
+    if isinstance(dtype, np.dtype) and dtype.kind == "M":
+        return "rfctime", _join_fixed_width(_format_datetimes(column.to_numpy()))
+    if isinstance(dtype, pd.DatetimeTZDtype):
+        values = column.dt.tz_convert("UTC").dt.tz_localize(None).to_numpy()
+        return "rfctime", _join_fixed_width(_format_datetimes(values))
+    return _json_type(dtype), JSON_CODEC.dumps(column.astype(str).tolist())
+
+
+def encode_data_frame(dataframe: pd.DataFrame) -> (list, RawJson):
+    """
+    Turns a dataframe into the columns list and the serialised data of a json payload.
+    Unlike resolve_data_frame, the data is encoded column by column without building python
+    lists of strings.
+    @param dataframe: pd.DataFrame
+    @return: columns list and the data as RawJson
+    """
+    assert isinstance(
+        dataframe, pd.DataFrame
+    ), "Only dataframes are allowed in function encode_data_frame"
+    columns = []
+    fragments = []
+    for position, name in enumerate(dataframe.columns):
+        type_, fragment = encode_column(dataframe.iloc[:, position])
+        columns.append({"name": name, "type": type_})
+        fragments.append(fragment)
+    data = RawJson("[" + ",".join(fragments) + "]", [[] for _ in fragments])
+    return columns, data
+
+
+def _raw_json_children(value) -> List[Tuple[Any, Any]]:
+    if isinstance(value, dict):
+        return list(value.items())
+    if isinstance(value, list):
+        return [
+            (key, child)
+            for key, child in enumerate(value)
+            if isinstance(child, (dict, RawJson))
+        ]
+    return []
+
+
+def materialize_raw_json(value) -> Any:
+    """
+    Replaces every RawJson in the dictionaries and lists of value by its parsed json value.
+    Lists are only searched for dictionaries, so data arrays are not iterated cell by cell.
+    @param value: dict or list
+    @return: the same value, changed in place
+    """
+    for key, child in _raw_json_children(value):
+        if isinstance(child, RawJson):
+            value[key] = child.loads()
+        else:
+            materialize_raw_json(child)
+    return value
+
+
+def raw_json_stand_in(value) -> Any:
+    """
+    Returns value with every RawJson replaced by its stand in value. Only the containers on the
+    way to a RawJson are copied.
+    @param value: dict or list
+    @return: value or a partial copy of it
+    """
+    if isinstance(value, RawJson):
+        return value.stand_in
+    copy = None
+    for key, child in _raw_json_children(value):
+        replaced = raw_json_stand_in(child)
+        if replaced is not child:
+            if copy is None:
+                copy = dict(value) if isinstance(value, dict) else list(value)
+            copy[key] = replaced
+    return value if copy is None else copy
+
+
+def dumps_with_raw_json(value) -> str:
+    """
+    Serialises value with the json codec and writes the contained RawJson values as they are
+    @param value: json value
+    @return: str
+    """
+    fragments = []
+    # json always escapes the null character, so a payload string cannot look like the token
+    nonce = uuid.uuid4().hex
+
+    def _default(obj):
+        if isinstance(obj, RawJson):
+            fragments.append(obj.text)
+            return "\x00{}-{}".format(nonce, len(fragments) - 1)
+        raise TypeError(
+            "Object of type {} is not JSON serializable".format(type(obj).__name__)
+        )
+
+    serialised = JSON_CODEC.dumps(value, default=_default)
+    if not fragments:
+        return serialised
+    pattern = re.compile(r'"\\u0000' + nonce + r'-(\d+)"')
+    return pattern.sub(lambda match: fragments[int(match.group(1))], serialised)
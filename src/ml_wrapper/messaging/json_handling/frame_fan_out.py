@@ -0,0 +1,133 @@
+"""
+This module provides the fan out of the sub frames of multiple_time_series payloads. Results
+with many series are decoded and encoded frame by frame in a pool of workers instead of one
+after the other.
+"""
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from .convert_data import RawJson, decode_data_frame, encode_data_frame
+
+FAN_OUT_BACKENDS = ("thread", "process")
+# The tool runs the mqtt, dispatcher and server threads, whose locks a forked worker would
+# inherit in whatever state they are, so the process backend starts fresh interpreters
+START_METHOD = "spawn"
+
+
+class FrameFanOut:
+    """
+    The FrameFanOut maps a function over the sub frames of a message. If the frames of a
+    message have at least threshold cells in total, they are handed to a pool of workers,
+    otherwise they are processed one after the other. The results are always returned in the
+    order of the frames.
+
+    With the thread backend the workers share the memory of the frames, which pays off as far
+    as numpy and pandas release the GIL. With the process backend the frames are pickled to the
+    worker processes, so all cores are used at the cost of copying the frames.
+    """
+
+    def __init__(self, threshold: int = 0, workers: int = 0, backend: str = "thread"):
+        """
+        Constructor of the FrameFanOut
+        @param threshold: minimum number of cells of a message to fan out, 0 disables it
+        @param workers: number of workers, 0 uses one worker per cpu
+        @param backend: one of FAN_OUT_BACKENDS
+        """
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self.threshold = 0
+        self.workers = 1
+        self.backend = "thread"
+        self.configure(threshold, workers, backend)
+
+    def configure(self, threshold: int, workers: int = 0, backend: str = "thread"):
+        """
+        Sets up the fan out. A running pool is shut down, if the workers or the backend change.
+        @param threshold: minimum number of cells of a message to fan out, 0 disables it
+        @param workers: number of workers, 0 uses one worker per cpu
+        @param backend: one of FAN_OUT_BACKENDS
+        """
+        assert threshold >= 0, "The fan out threshold cannot be negative"
+        assert workers >= 0, "The number of fan out workers cannot be negative"
+        assert (
+            backend in FAN_OUT_BACKENDS
+        ), "The fan out backend has to be one of {}, but received {}".format(
+            FAN_OUT_BACKENDS, backend
+        )
+        workers = workers or os.cpu_count() or 1
+        if (workers, backend) != (self.workers, self.backend):
+            self.shutdown()
+        self.threshold = threshold
+        self.workers = workers
+        self.backend = backend
+
+    @property
+    def is_enabled(self) -> bool:
+        """Returns true, if large messages are fanned out"""
+        return self.threshold > 0
+
+    def _pool(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                if self.backend == "thread":
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers)
+                else:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context(START_METHOD),
+                    )
+            return self._executor
+
+    def map(self, function: Callable, items: Sequence, cells: int) -> List[Any]:
+        """
+        Applies the function to every item
+        @param function: picklable function of one item
+        @param items: the items, e.g. the frames of a message
+        @param cells: total number of cells of the items
+        @return: list of the results in the order of the items
+        """
+        if not self.is_enabled or cells < self.threshold or len(items) < 2:
+            return [function(item) for item in items]
+        # Every worker receives one chunk, which keeps the overhead of the process backend low
+        chunksize = math.ceil(len(items) / self.workers)
+        return list(self._pool().map(function, items, chunksize=chunksize))
+
+    def shutdown(self):
+        """Shuts the workers down. They are started again on the next fan out."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+
+FRAME_FAN_OUT = FrameFanOut()
+
+
+def _decode_section(section: Tuple[List[dict], list]) -> pd.DataFrame:
+    return decode_data_frame(*section)
+
+
+def decode_data_frames(sections: List[Tuple[List[dict], list]]) -> List[pd.DataFrame]:
+    """
+    Decodes the columns and data of several payload sections with the FRAME_FAN_OUT
+    @param sections: list of tuples of the column specifications and the column values
+    @return: list of pd.DataFrame in the order of the sections
+    """
+    cells = sum(len(values) for _, data in sections for values in data)
+    return FRAME_FAN_OUT.map(_decode_section, sections, cells)
+
+
+def encode_data_frames(frames: List[pd.DataFrame]) -> List[Tuple[list, RawJson]]:
+    """
+    Encodes several dataframes with encode_data_frame and the FRAME_FAN_OUT
+    @param frames: list of pd.DataFrame
+    @return: list of the columns and the data of every frame in the order of the frames
+    """
+    cells = sum(frame.size for frame in frames)
+    return FRAME_FAN_OUT.map(encode_data_frame, frames, cells)
@@ -1,21 +1,229 @@
 """
 This class provides validation functions
 """
-import json
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 
-from typing import Union
+from typing import Dict, Optional, Tuple, Union
 
 import jsonschema
 from jsonschema import ValidationError
 
-from ml_wrapper.misc import NonSchemaConformJsonPayload
+from ml_wrapper.misc import JSON_CODEC, NonSchemaConformJsonPayload
+from ml_wrapper.misc.prometheus import validation_duration, validator_cache_hits
 from ..message_type import MessageType
 
-from .json_provider import TRIGGER_FORMAL, ANALYSES_FORMAL, DATA_FORMAL, SCHEMA_STORE
+from .json_provider import (
+    ANALYSES_FORMAL,
+    DATA_FORMAL,
+    FORMAL_REPLACES,
+    SCHEMA_STORE,
+    TRIGGER_FORMAL,
+)
+from .schema_compiler import CompiledSchema, SchemaNotCompilable
+
+VALIDATION_BACKENDS = ("jsonschema", "compiled")
+# Number of validators of unregistered schemas, which are kept for reuse
+MAX_UNREGISTERED_SCHEMAS = 32
+
+# The referenced formal schemas are already loaded. Providing them to the resolvers avoids
+# reading the files again when a $ref is resolved.
+REFERENCED_SCHEMAS = {
+    FORMAL_REPLACES["file:analysis/formal.json"]: ANALYSES_FORMAL,
+    FORMAL_REPLACES["file:data/formal.json"]: DATA_FORMAL,
+    FORMAL_REPLACES["file:ml-trigger/formal.json"]: TRIGGER_FORMAL,
+}
 
 
 def _resolver(schema):
-    return jsonschema.RefResolver.from_schema(schema, store=SCHEMA_STORE)
+    return jsonschema.RefResolver.from_schema(
+        schema, store={**SCHEMA_STORE, **REFERENCED_SCHEMAS}
+    )
+
+
+# pylint: disable=too-many-instance-attributes
+class _CachedValidator:
+    """The validators of one schema together with their statistics"""
+
+    def __init__(self, name: str, schema: dict, label: Optional[str] = None):
+        self.name = name
+        # The label of the metrics, which shouldn't grow with every unregistered schema
+        self.label = label or name
+        self.schema = schema
+        self.validator = jsonschema.Draft7Validator(
+            schema=schema, resolver=_resolver(schema)
+        )
+        # The resolver keeps a scope stack while validating and cannot be shared between threads
+        self.lock = threading.Lock()
+        self._compiled: Optional[CompiledSchema] = None
+        self.compilable = True
+        self.hits = 0
+        self.validations = 0
+        self.seconds = 0.0
+
+    @property
+    def compiled(self) -> Optional[CompiledSchema]:
+        """Returns the compiled schema or None, if the schema cannot be compiled"""
+        if self._compiled is None and self.compilable:
+            try:
+                self._compiled = CompiledSchema(self.schema, store=REFERENCED_SCHEMAS)
+            except SchemaNotCompilable:
+                self.compilable = False
+        return self._compiled
+
+    @property
+    def is_compiled(self) -> bool:
+        """Returns true, if the schema has been compiled already"""
+        return self._compiled is not None
+
+    def validate(self, json_object: dict, backend: str) -> None:
+        """Validates with the compiled schema if requested and possible"""
+        if backend == "compiled" and self.compiled is not None:
+            self.compiled(json_object)
+            return
+        with self.lock:
+            self.validator.validate(json_object)
+
+
+class ValidatorRegistry:
+    """
+    The ValidatorRegistry builds one validator per schema and reuses it for every following
+    validation. Registered schemas are identified by the object they are passed as, which the
+    registry keeps a reference to. Unregistered schemas are identified by their content and the
+    validators of the MAX_UNREGISTERED_SCHEMAS most recently used ones are kept.
+
+    The backend decides how the validation is executed. With "jsonschema" the Draft7Validator
+    of jsonschema is used, with "compiled" the schema is compiled into a python function.
+    Schemas that cannot be compiled are still validated with jsonschema.
+    """
+
+    def __init__(self, backend: str = "jsonschema"):
+        self._validators: Dict[int, _CachedValidator] = {}
+        self._unregistered: "OrderedDict[str, _CachedValidator]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._backend = None
+        self.backend = backend
+        self.register("trigger", TRIGGER_FORMAL)
+        self.register("analyses", ANALYSES_FORMAL)
+        self.register("data", DATA_FORMAL)
+
+    @property
+    def backend(self) -> str:
+        """Returns the validation backend"""
+        return self._backend
+
+    @backend.setter
+    def backend(self, new_value: str):
+        """
+        Sets the validation backend
+        @param new_value: str, one of VALIDATION_BACKENDS
+        """
+        assert (
+            new_value in VALIDATION_BACKENDS
+        ), "The validation backend has to be one of {}, but received {}".format(
+            VALIDATION_BACKENDS, new_value
+        )
+        self._backend = new_value
+
+    def register(self, name: str, schema: dict) -> None:
+        """
+        Registers a schema under the given name, which is used to label its metrics.
+        Registering the same schema again keeps the existing validator.
+        @param name: str
+        @param schema: dict
+        """
+        assert isinstance(schema, dict), "I can only register schemas as dictionaries"
+        with self._lock:
+            if id(schema) not in self._validators:
+                self._validators[id(schema)] = _CachedValidator(name, schema)
+
+    def _get(self, schema: dict) -> _CachedValidator:
+        cached = self._validators.get(id(schema))
+        if cached is None:
+            cached, created = self._get_unregistered(schema)
+            if created:
+                return cached
+        cached.hits += 1
+        validator_cache_hits.labels(cached.label).inc()
+        return cached
+
+    @staticmethod
+    def _content_key(schema: dict) -> str:
+        return hashlib.sha256(
+            JSON_CODEC.dumps_bytes(schema, sort_keys=True)
+        ).hexdigest()
+
+    def _get_unregistered(self, schema: dict) -> Tuple[_CachedValidator, bool]:
+        """
+        Returns the validator of an unregistered schema with the same content or creates it
+        @return: the validator and true, if it has been created
+        """
+        key = self._content_key(schema)
+        with self._lock:
+            cached = self._unregistered.get(key)
+            if cached is not None:
+                self._unregistered.move_to_end(key)
+                return cached, False
+            # The copy keeps the validator valid, even if the caller changes the schema
+            cached = _CachedValidator(
+                "schema-{}".format(key[:12]),
+                copy.deepcopy(schema),
+                label="unregistered",
+            )
+            self._unregistered[key] = cached
+            while len(self._unregistered) > MAX_UNREGISTERED_SCHEMAS:
+                self._unregistered.popitem(last=False)
+        return cached, True
+
+    def validate(self, json_object: dict, schema: dict) -> None:
+        """
+        Validates a json dictionary against the schema with the cached validator
+        @param json_object: dict
+        @param schema: dict
+        @raise ValidationError
+        """
+        cached = self._get(schema)
+        start = time.perf_counter()
+        try:
+            cached.validate(json_object, self.backend)
+        finally:
+            duration = time.perf_counter() - start
+            cached.validations += 1
+            cached.seconds += duration
+            validation_duration.labels(cached.label).observe(duration)
+
+    def warm_up(self) -> None:
+        """
+        Resolves the references of all registered schemas ahead of the first validation and
+        compiles them, if the compiled backend is used
+        """
+        for cached in list(self._validators.values()):
+            with cached.lock:
+                for reference in REFERENCED_SCHEMAS:
+                    cached.validator.resolver.resolve(reference)
+            if self.backend == "compiled":
+                _ = cached.compiled
+
+    def statistics(self) -> Dict[str, dict]:
+        """
+        Returns the hits and validation times of all registered schemas
+        @return: dict
+        """
+        return {
+            cached.name: {
+                "hits": cached.hits,
+                "validations": cached.validations,
+                "seconds": cached.seconds,
+                "compiled": cached.is_compiled,
+            }
+            for cached in [*self._validators.values(), *self._unregistered.values()]
+        }
+
+
+VALIDATOR_REGISTRY = ValidatorRegistry()
 
 
 def validate_formal_single(
@@ -31,11 +239,9 @@ def validate_formal_single(
         json_object, (str, dict)
     ), "I can only validate json objects as dictionaries or json strings"
     json_object = (
-        json_object if isinstance(json_object, dict) else json.loads(json_object)
+        json_object if isinstance(json_object, dict) else JSON_CODEC.loads(json_object)
     )
-    resolver = _resolver(against)
-    validator = jsonschema.Draft7Validator(schema=against, resolver=resolver)
-    validator.validate(json_object)
+    VALIDATOR_REGISTRY.validate(json_object, against)
 
 
 def validate_formal(json_object: Union[str, dict]) -> Union[None, MessageType]:
@@ -46,6 +252,9 @@ def validate_formal(json_object: Union[str, dict]) -> Union[None, MessageType]:
     """
     validation_type_result = None
     validation_error = []
+    json_object = (
+        json_object if isinstance(json_object, dict) else JSON_CODEC.loads(json_object)
+    )
     try:
         validate_formal_single(json_object, ANALYSES_FORMAL)
         validation_type_result = MessageType.ANALYSES_RESULT
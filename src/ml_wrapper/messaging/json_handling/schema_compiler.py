@@ -0,0 +1,400 @@
+"""
+This module compiles json schemas into python validation functions.
+
+The generated code checks the same draft 7 keywords as the jsonschema validators, but without
+walking the schema on every validation. Only the keywords used by the KOSMOS specifications and a
+few simple ones are supported. Schemas using other keywords raise SchemaNotCompilable and have to
+be validated with jsonschema instead.
+"""
+import re
+from typing import Callable, Dict, List, Tuple
+from urllib.parse import unquote, urldefrag, urljoin
+
+from jsonschema import ValidationError
+
+# Keywords without influence on the validation result
+ANNOTATIONS = {
+    "$schema",
+    "$id",
+    "$comment",
+    "title",
+    "description",
+    "default",
+    "examples",
+    "definitions",
+    "format",
+    "readOnly",
+    "writeOnly",
+}
+
+TYPE_CHECKS = {
+    "object": "isinstance({0}, dict)",
+    "array": "isinstance({0}, list)",
+    "string": "isinstance({0}, str)",
+    "number": "(isinstance({0}, (int, float)) and not isinstance({0}, bool))",
+    "integer": "((isinstance({0}, int) and not isinstance({0}, bool)) "
+    "or (isinstance({0}, float) and {0}.is_integer()))",
+    "boolean": "isinstance({0}, bool)",
+    "null": "{0} is None",
+}
+
+SUPPORTED = ANNOTATIONS | {
+    "$ref",
+    "type",
+    "enum",
+    "const",
+    "required",
+    "properties",
+    "additionalProperties",
+    "minProperties",
+    "maxProperties",
+    "items",
+    "minItems",
+    "maxItems",
+    "minLength",
+    "maxLength",
+    "pattern",
+    "minimum",
+    "maximum",
+    "exclusiveMinimum",
+    "exclusiveMaximum",
+    "allOf",
+    "anyOf",
+    "oneOf",
+    "not",
+    "if",
+    "then",
+    "else",
+}
+
+
+class SchemaNotCompilable(Exception):
+    """
+    Represents the error of a json schema that uses keywords the compiler does not support
+    """
+
+
+def _unbool(value):
+    """Distinguishes booleans from the numbers 0 and 1 like jsonschema does"""
+    if isinstance(value, bool):
+        return ("bool", value)
+    return value
+
+
+def _in_enum(value, enum) -> bool:
+    return any(_unbool(value) == _unbool(option) for option in enum)
+
+
+def _is_valid(function: Callable, value) -> bool:
+    try:
+        function(value)
+    except ValidationError:
+        return False
+    return True
+
+
+class _Compiler:
+    """Generates the source code of one validation function per schema and reference"""
+
+    def __init__(self, schema: dict, store: Dict[str, dict]):
+        self.root = schema
+        self.store = store
+        self.functions: Dict[Tuple[str, str], str] = {}
+        self.constants: Dict[str, object] = {}
+        self.lines: List[str] = []
+        self._counter = 0
+
+    def _name(self, prefix: str) -> str:
+        self._counter += 1
+        return "{}_{}".format(prefix, self._counter)
+
+    def _constant(self, value) -> str:
+        name = self._name("_const")
+        self.constants[name] = value
+        return name
+
+    def _document(self, url: str) -> dict:
+        if url == "":
+            return self.root
+        if url not in self.store:
+            raise SchemaNotCompilable("The reference {} cannot be resolved".format(url))
+        return self.store[url]
+
+    def _resolve(self, base: str, reference: str) -> Tuple[str, str, object]:
+        url, fragment = urldefrag(urljoin(base, reference))
+        node = self._document(url)
+        for part in [part for part in fragment.split("/") if part]:
+            part = unquote(part).replace("~1", "/").replace("~0", "~")
+            try:
+                node = node[int(part)] if isinstance(node, list) else node[part]
+            except (KeyError, IndexError, ValueError) as error:
+                raise SchemaNotCompilable(
+                    "The reference {} cannot be resolved".format(reference)
+                ) from error
+        return url, fragment, node
+
+    def function(self, schema, base: str, pointer: str) -> str:
+        """Returns the name of the function validating the schema and generates it once"""
+        key = (base, pointer)
+        if key in self.functions:
+            return self.functions[key]
+        name = self._name("_validate")
+        self.functions[key] = name
+        body = self.emit(schema, "data", base, 1)
+        self.lines += ["def {}(data):".format(name)] + body + ["    return None", ""]
+        return name
+
+    def _raise(self, indent: int, message: str, *values: str) -> List[str]:
+        return [
+            "{}raise ValidationError({!r} % ({},))".format(
+                "    " * indent, message, ", ".join(values)
+            )
+        ]
+
+    def _sub_function(self, schema, base: str) -> str:
+        return self.function(schema, base, "anonymous-{}".format(self._counter + 1))
+
+    # pylint: disable=too-many-branches,too-many-statements,too-many-locals
+    def emit(self, schema, var: str, base: str, indent: int) -> List[str]:
+        """Returns the code lines validating the variable var against the schema"""
+        pad = "    " * indent
+        if schema is True or schema == {}:
+            return []
+        if schema is False:
+            return self._raise(indent, "False schema does not allow %r", var)
+        if not isinstance(schema, dict):
+            raise SchemaNotCompilable("Schemas have to be objects or booleans")
+        unknown = set(schema) - SUPPORTED
+        if unknown:
+            raise SchemaNotCompilable(
+                "The keywords {} are not supported".format(sorted(unknown))
+            )
+        if "$id" in schema and schema["$id"]:
+            base = urljoin(base, schema["$id"])
+        lines = []
+        if "$ref" in schema:
+            url, fragment, node = self._resolve(base, schema["$ref"])
+            return [
+                "{}{}({})".format(pad, self.function(node, url, "#" + fragment), var)
+            ]
+        if "type" in schema:
+            types = (
+                schema["type"] if isinstance(schema["type"], list) else [schema["type"]]
+            )
+            if any(type_ not in TYPE_CHECKS for type_ in types):
+                raise SchemaNotCompilable("Unknown type in {}".format(types))
+            check = " or ".join(TYPE_CHECKS[type_].format(var) for type_ in types)
+            lines += ["{}if not ({}):".format(pad, check)]
+            lines += self._raise(
+                indent + 1,
+                "%r is not of type %s",
+                var,
+                repr(", ".join(map(repr, types))),
+            )
+        if "enum" in schema:
+            enum = schema["enum"]
+            constant = self._constant(list(enum))
+            if all(isinstance(option, str) for option in enum):
+                lines += [
+                    "{0}if not isinstance({1}, str) or {1} not in {2}:".format(
+                        pad, var, self._constant(frozenset(enum))
+                    )
+                ]
+            else:
+                lines += ["{}if not _in_enum({}, {}):".format(pad, var, constant)]
+            lines += self._raise(indent + 1, "%r is not one of %r", var, constant)
+        if "const" in schema:
+            constant = self._constant([schema["const"]])
+            lines += ["{}if not _in_enum({}, {}):".format(pad, var, constant)]
+            lines += self._raise(indent + 1, "%r was expected", constant + "[0]")
+        lines += self._emit_object(schema, var, base, indent)
+        lines += self._emit_array(schema, var, base, indent)
+        lines += self._emit_string(schema, var, indent)
+        lines += self._emit_number(schema, var, indent)
+        for subschema in schema.get("allOf", []):
+            lines += self.emit(subschema, var, base, indent)
+        if "anyOf" in schema:
+            names = [self._sub_function(sub, base) for sub in schema["anyOf"]]
+            lines += [
+                "{}if not ({}):".format(
+                    pad,
+                    " or ".join("_is_valid({}, {})".format(n, var) for n in names),
+                )
+            ]
+            lines += self._raise(
+                indent + 1, "%r is not valid under any of the given schemas", var
+            )
+        if "oneOf" in schema:
+            names = [self._sub_function(sub, base) for sub in schema["oneOf"]]
+            count = self._name("valid")
+            lines += [
+                "{}{} = sum(_is_valid(function, {}) for function in ({},))".format(
+                    pad, count, var, ", ".join(names)
+                ),
+                "{}if {} == 0:".format(pad, count),
+            ]
+            lines += self._raise(
+                indent + 1, "%r is not valid under any of the given schemas", var
+            )
+            lines += ["{}if {} > 1:".format(pad, count)]
+            lines += self._raise(indent + 1, "%r is valid under each of %s", var, count)
+        if "not" in schema:
+            name = self._sub_function(schema["not"], base)
+            lines += ["{}if _is_valid({}, {}):".format(pad, name, var)]
+            lines += self._raise(indent + 1, "%r is not allowed", var)
+        if "if" in schema:
+            name = self._sub_function(schema["if"], base)
+            then = self.emit(schema.get("then", True), var, base, indent + 1)
+            else_ = self.emit(schema.get("else", True), var, base, indent + 1)
+            lines += ["{}if _is_valid({}, {}):".format(pad, name, var)]
+            lines += then or ["{}    pass".format(pad)]
+            if else_:
+                lines += ["{}else:".format(pad)] + else_
+        return lines
+
+    def _emit_object(self, schema, var: str, base: str, indent: int) -> List[str]:
+        pad = "    " * indent
+        lines = []
+        for key in schema.get("required", []):
+            lines += ["{}if {!r} not in {}:".format(pad, key, var)]
+            lines += self._raise(indent + 1, "%r is a required property", repr(key))
+        for key, subschema in schema.get("properties", {}).items():
+            child = self._name("value")
+            body = self.emit(subschema, child, base, indent + 1)
+            if body:
+                lines += [
+                    "{}if {!r} in {}:".format(pad, key, var),
+                    "{}    {} = {}[{!r}]".format(pad, child, var, key),
+                ] + body
+        additional = schema.get("additionalProperties", True)
+        if additional is not True:
+            known = self._constant(frozenset(schema.get("properties", {})))
+            extra = self._name("extra")
+            lines += [
+                "{}{} = [key for key in {} if key not in {}]".format(
+                    pad, extra, var, known
+                )
+            ]
+            if additional is False:
+                lines += ["{}if {}:".format(pad, extra)]
+                lines += self._raise(
+                    indent + 1,
+                    "Additional properties are not allowed (%s were unexpected)",
+                    "', '.join(map(repr, {}))".format(extra),
+                )
+            else:
+                child = self._name("value")
+                lines += ["{}for {} in {}:".format(pad, child, extra)]
+                lines += self.emit(
+                    additional, "{}[{}]".format(var, child), base, indent + 1
+                ) or ["{}    pass".format(pad)]
+        if "minProperties" in schema:
+            lines += ["{}if len({}) < {}:".format(pad, var, schema["minProperties"])]
+            lines += self._raise(indent + 1, "%r does not have enough properties", var)
+        if "maxProperties" in schema:
+            lines += ["{}if len({}) > {}:".format(pad, var, schema["maxProperties"])]
+            lines += self._raise(indent + 1, "%r has too many properties", var)
+        return self._guard(lines, "object", var, indent)
+
+    def _emit_array(self, schema, var: str, base: str, indent: int) -> List[str]:
+        pad = "    " * indent
+        lines = []
+        if "minItems" in schema:
+            lines += ["{}if len({}) < {}:".format(pad, var, schema["minItems"])]
+            lines += self._raise(indent + 1, "%r is too short", var)
+        if "maxItems" in schema:
+            lines += ["{}if len({}) > {}:".format(pad, var, schema["maxItems"])]
+            lines += self._raise(indent + 1, "%r is too long", var)
+        items = schema.get("items", True)
+        if isinstance(items, list):
+            for index, subschema in enumerate(items):
+                child = self._name("item")
+                body = self.emit(subschema, child, base, indent + 1)
+                if body:
+                    lines += [
+                        "{}if len({}) > {}:".format(pad, var, index),
+                        "{}    {} = {}[{}]".format(pad, child, var, index),
+                    ] + body
+        else:
+            child = self._name("item")
+            body = self.emit(items, child, base, indent + 1)
+            if body:
+                lines += ["{}for {} in {}:".format(pad, child, var)] + body
+        return self._guard(lines, "array", var, indent)
+
+    def _emit_string(self, schema, var: str, indent: int) -> List[str]:
+        pad = "    " * indent
+        lines = []
+        if "minLength" in schema:
+            lines += ["{}if len({}) < {}:".format(pad, var, schema["minLength"])]
+            lines += self._raise(indent + 1, "%r is too short", var)
+        if "maxLength" in schema:
+            lines += ["{}if len({}) > {}:".format(pad, var, schema["maxLength"])]
+            lines += self._raise(indent + 1, "%r is too long", var)
+        if "pattern" in schema:
+            pattern = self._constant(re.compile(schema["pattern"]))
+            lines += ["{}if not {}.search({}):".format(pad, pattern, var)]
+            lines += self._raise(
+                indent + 1, "%r does not match %r", var, pattern + ".pattern"
+            )
+        return self._guard(lines, "string", var, indent)
+
+    def _emit_number(self, schema, var: str, indent: int) -> List[str]:
+        pad = "    " * indent
+        lines = []
+        for keyword, operator, message in [
+            ("minimum", "<", "%r is less than the minimum of %r"),
+            ("maximum", ">", "%r is greater than the maximum of %r"),
+            ("exclusiveMinimum", "<=", "%r is less than or equal to the minimum of %r"),
+            (
+                "exclusiveMaximum",
+                ">=",
+                "%r is greater than or equal to the maximum of %r",
+            ),
+        ]:
+            if keyword in schema:
+                limit = self._constant(schema[keyword])
+                lines += ["{}if {} {} {}:".format(pad, var, operator, limit)]
+                lines += self._raise(indent + 1, message, var, limit)
+        return self._guard(lines, "number", var, indent)
+
+    @staticmethod
+    def _guard(lines: List[str], type_: str, var: str, indent: int) -> List[str]:
+        """Applies the type specific keywords only to instances of that type"""
+        if not lines:
+            return []
+        return ["{}if {}:".format("    " * indent, TYPE_CHECKS[type_].format(var))] + [
+            "    " + line for line in lines
+        ]
+
+
+# pylint: disable=too-few-public-methods
+class CompiledSchema:
+    """
+    A json schema compiled into a python function. Calling the object validates a json
+    dictionary and raises a jsonschema.ValidationError for invalid instances.
+    """
+
+    def __init__(self, schema: dict, store: Dict[str, dict] = None):
+        """
+        Generates and compiles the validation code of the schema
+        @param schema: dict
+        @param store: dict of schema documents by their url to resolve references with
+        @raise SchemaNotCompilable
+        """
+        compiler = _Compiler(schema, store or {})
+        entry = compiler.function(schema, "", "#")
+        self.source = "\n".join(compiler.lines)
+        namespace = {
+            "ValidationError": ValidationError,
+            "_in_enum": _in_enum,
+            "_is_valid": _is_valid,
+            **compiler.constants,
+        }
+        # The generated code only consists of the checks emitted by the compiler above
+        # pylint: disable=exec-used
+        exec(compile(self.source, "<compiled json schema>", "exec"), namespace)
+        self._validate = namespace[entry]
+
+    def __call__(self, json_object: dict) -> None:
+        self._validate(json_object)
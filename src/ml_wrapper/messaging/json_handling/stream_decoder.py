@@ -0,0 +1,199 @@
+"""
+This module provides a streaming decoder for large MQTT payloads. It walks the json text once
+and parses the data columns of a payload straight into numpy arrays, without building the
+python lists of the data section first.
+"""
+import json
+import re
+from json.decoder import JSONDecodeError, scanstring
+from typing import Dict, List, Tuple, Union
+
+import numpy as np
+
+from ml_wrapper.misc import NonSchemaConformJsonPayload
+from .convert_data import parse_column
+
+# Paths of the objects, whose data field holds column data. None stands for any list index.
+DATA_PARENTS = (
+    ("body", "payload", "body"),
+    ("body", "payload", "body", "results"),
+    ("body", "payload", "body", "results", None),
+)
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_DECODER = json.JSONDecoder()
+
+
+def _matches(path: tuple, pattern: tuple) -> bool:
+    return len(path) == len(pattern) and all(
+        expected is None or key == expected for key, expected in zip(path, pattern)
+    )
+
+
+def _is_data_parent(path: tuple) -> bool:
+    return any(_matches(path, pattern) for pattern in DATA_PARENTS)
+
+
+def _leads_to_data(path: tuple) -> bool:
+    return any(_matches(path, pattern[: len(path)]) for pattern in DATA_PARENTS)
+
+
+# pylint: disable=too-few-public-methods
+class StreamDecoder:
+    """
+    The StreamDecoder parses an ml trigger payload. Objects on the way to a data section are
+    parsed field by field, every other value is decoded at once by the json decoder.
+    The data sections are checked against the schema while they are read: they have to be
+    arrays of arrays of strings. The columns are read one after the other and every column is
+    parsed into a numpy array right away, if its type is known by then. So only the strings of
+    one column are held at a time.
+
+    In the returned payload the data sections are replaced by small stand ins of the same
+    shape, so the payload can be validated as usual. The streamed columns are returned by
+    their path and can be put back with insert_columns.
+    """
+
+    def __init__(self, text: Union[str, bytes]):
+        """
+        Constructor of the StreamDecoder
+        @param text: str or utf-8 encoded bytes of the json payload
+        """
+        self.text = text if isinstance(text, str) else text.decode("utf-8")
+        self.columns: Dict[tuple, List[Union[np.ndarray, list]]] = {}
+
+    def decode(self) -> Tuple[dict, Dict[tuple, list]]:
+        """
+        Decodes the payload
+        @return: the payload with stand ins and the streamed columns by path
+        @raise JSONDecodeError, NonSchemaConformJsonPayload
+        """
+        value, end = self._value(self._skip(0), ())
+        if self._skip(end) != len(self.text):
+            raise JSONDecodeError("Extra data", self.text, end)
+        return value, self.columns
+
+    def _skip(self, position: int) -> int:
+        return _WHITESPACE.match(self.text, position).end()
+
+    def _expect(self, position: int, character: str, message: str):
+        if self.text[position : position + 1] != character:
+            raise JSONDecodeError(message, self.text, position)
+
+    def _value(self, position: int, path: tuple):
+        character = self.text[position : position + 1]
+        if character == "{" and _leads_to_data(path):
+            return self._object(position, path)
+        if character == "[" and _leads_to_data(path + (None,)):
+            return self._array(position, path)
+        return _DECODER.raw_decode(self.text, position)
+
+    def _object(self, position: int, path: tuple) -> Tuple[dict, int]:
+        result = {}
+        position = self._skip(position + 1)
+        if self.text[position : position + 1] == "}":
+            return result, position + 1
+        while True:
+            self._expect(
+                position, '"', "Expecting property name enclosed in double quotes"
+            )
+            key, position = scanstring(self.text, position + 1)
+            position = self._skip(position)
+            self._expect(position, ":", "Expecting ':' delimiter")
+            position = self._skip(position + 1)
+            if (
+                key == "data"
+                and _is_data_parent(path)
+                and self.text[position : position + 1] == "["
+            ):
+                columns, position = self._data(position, path, result.get("columns"))
+                self.columns[path] = columns
+                result[key] = [[""] if len(values) else [] for values in columns]
+            else:
+                result[key], position = self._value(position, path + (key,))
+            position = self._skip(position)
+            if self.text[position : position + 1] == "}":
+                return result, position + 1
+            self._expect(position, ",", "Expecting ',' delimiter")
+            position = self._skip(position + 1)
+
+    def _array(self, position: int, path: tuple) -> Tuple[list, int]:
+        result = []
+        position = self._skip(position + 1)
+        if self.text[position : position + 1] == "]":
+            return result, position + 1
+        while True:
+            value, position = self._value(position, path + (len(result),))
+            result.append(value)
+            position = self._skip(position)
+            if self.text[position : position + 1] == "]":
+                return result, position + 1
+            self._expect(position, ",", "Expecting ',' delimiter")
+            position = self._skip(position + 1)
+
+    def _data(self, position: int, path: tuple, specification) -> Tuple[list, int]:
+        """Reads the columns of a data section and parses them, if their type is known"""
+        columns = []
+        position = self._skip(position + 1)
+        if self.text[position : position + 1] == "]":
+            return columns, position + 1
+        while True:
+            self._check_column_start(position, path)
+            values, position = self._strings(position, path, len(columns))
+            if isinstance(specification, list) and len(columns) < len(specification):
+                try:
+                    values = parse_column(specification[len(columns)], values)
+                except (TypeError, ValueError):
+                    # The column is kept as strings and fails when it is decoded
+                    pass
+            columns.append(values)
+            position = self._skip(position)
+            if self.text[position : position + 1] == "]":
+                return columns, position + 1
+            self._expect(position, ",", "Expecting ',' delimiter")
+            position = self._skip(position + 1)
+
+    def _strings(self, position: int, path: tuple, column: int) -> Tuple[list, int]:
+        """Reads one column at once, which has to be an array of strings"""
+        values, position = _DECODER.raw_decode(self.text, position)
+        if not all(isinstance(value, str) for value in values):
+            raise NonSchemaConformJsonPayload(
+                "The data of {} has to consist of strings in column {}".format(
+                    "/".join(str(key) for key in path), column
+                )
+            )
+        return values, position
+
+    def _check_column_start(self, position: int, path: tuple):
+        if self.text[position : position + 1] != "[":
+            raise NonSchemaConformJsonPayload(
+                "The data of {} has to consist of an array of columns, but found {} at "
+                "position {}".format(
+                    "/".join(str(key) for key in path),
+                    self.text[position : position + 20],
+                    position,
+                )
+            )
+
+
+def insert_columns(payload: dict, columns: Dict[tuple, list]) -> dict:
+    """
+    Replaces the stand ins of the payload by the streamed columns
+    @param payload: dict as returned by StreamDecoder.decode
+    @param columns: the streamed columns by path
+    @return: the payload, changed in place
+    """
+    for path, values in columns.items():
+        section = payload
+        for key in path:
+            section = section[key]
+        section["data"] = values
+    return payload
+
+
+def stream_decode(text: Union[str, bytes]) -> Tuple[dict, Dict[tuple, list]]:
+    """
+    Decodes a payload with the StreamDecoder
+    @param text: str or utf-8 encoded bytes of the json payload
+    @return: the payload with stand ins and the streamed columns by path
+    """
+    return StreamDecoder(text).decode()
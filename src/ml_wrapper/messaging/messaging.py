@@ -2,12 +2,13 @@
 This provides a Messaging object which logic is used to pass on information between the stages of
 the ML Wrapper Tool
 """
+import copy
 import datetime
 import inspect
-import json
 import logging
 import re
 import uuid
+from concurrent.futures import Future
 from datetime import timezone
 from json.decoder import JSONDecodeError
 from typing import Union, Optional, Dict
@@ -16,6 +17,7 @@ import pandas as pd
 from jsonschema import ValidationError
 from paho.mqtt.client import MQTTMessage
 
+from .content_encoding import MAX_DECOMPRESSED_SIZE, decode_payload
 from .message_type import MessageType
 from ..misc import ResultType
 from .json_handling import (
@@ -24,17 +26,27 @@ from .json_handling import (
 )
 from ..misc import find_result_type
 from .json_handling import (
-    retrieve_sensor_update_data,
-    retrieve_dataframe,
-    resolve_data_frame,
+    decode_data_frames,
+    retrieve_column_meta,
+    encode_data_frame,
+    encode_data_frames,
+    dumps_with_raw_json,
+    insert_columns,
+    stream_decode,
+    raw_json_stand_in,
 )
 from ..misc import (
+    JSON_CODEC,
     NotInitialized,
     NonSchemaConformJsonPayload,
     NotYetRetrieved,
     InvalidType,
     EmptyResult,
     InvalidTopic,
+    SpanContext,
+    StageTimer,
+    new_span_id,
+    new_trace_id,
 )
 
 
@@ -45,7 +57,19 @@ class IncomingMessage:
     ML Wrapper
     """
 
-    def __init__(self, logger: logging.Logger):
+    def __init__(
+        self,
+        logger: logging.Logger,
+        stream_threshold: int = 0,
+        max_decompressed_size: int = MAX_DECOMPRESSED_SIZE,
+    ):
+        """
+        Constructor of the IncomingMessage
+        @param logger: logging.Logger
+        @param stream_threshold: payloads of at least this many bytes are read with the
+        StreamDecoder, 0 disables streaming
+        @param max_decompressed_size: maximum number of bytes of a decompressed payload
+        """
         self._id = uuid.uuid4()
         self._model = None
         self._tag = None
@@ -58,6 +82,11 @@ class IncomingMessage:
         self._message_type = None
         self._message_data_type = None
         self._retrieved_data = None
+        self._window = None
+        self._features = None
+        self._raw_sections = None
+        self._streamed = False
+        self._source = None
         self._columns = None
         self._data = None
         self._column_meta = None
@@ -68,6 +97,14 @@ class IncomingMessage:
         )
         self.custom_information_field = None
         self.logger = logger
+        self.stream_threshold = stream_threshold
+        self.max_decompressed_size = max_decompressed_size
+        # Measures the stages of the message from now on
+        self.timer = StageTimer()
+        # The span of the sending tool, if the message carried a traceparent
+        self.trace_parent: Optional[SpanContext] = None
+        self._span_id = new_span_id()
+        self._trace_id = None
 
     @property
     def column_meta(self):
@@ -102,6 +139,18 @@ class IncomingMessage:
         """The id in a sentence"""
         return "Message id {}".format(self.mid)
 
+    @property
+    def span_context(self) -> SpanContext:
+        """
+        The trace context of handling this message. It continues the trace of the sending tool
+        or starts a new trace.
+        """
+        if self.trace_parent is not None:
+            return SpanContext(self.trace_parent.trace_id, self._span_id)
+        if self._trace_id is None:
+            self._trace_id = new_trace_id()
+        return SpanContext(self._trace_id, self._span_id)
+
     @property
     def received(self):
         """The timestamp, when the Message was received"""
@@ -117,6 +166,11 @@ class IncomingMessage:
         """The model of the triggering message"""
         return self._model
 
+    @property
+    def tag(self):
+        """The model tag of the triggering message"""
+        return self._tag
+
     @property
     def machine(self):
         """The machine of the triggering message"""
@@ -134,9 +188,73 @@ class IncomingMessage:
 
     @property
     def retrieved_data(self):
-        """Returns the retrieved data from the message"""
+        """
+        Returns the retrieved data from the message. The data of the payload is decoded into
+        DataFrames on the first access. The payload itself is left unchanged, as the key of the
+        result cache is calculated from it. The frames of a multiple_time_series result are
+        decoded by the FRAME_FAN_OUT.
+        """
+        if self._retrieved_data is None and self._raw_sections is not None:
+            with self.timer.stage("decode_frames"):
+                frames = decode_data_frames(
+                    [
+                        (section.get("columns"), section.get("data"))
+                        for section in self._raw_sections
+                    ]
+                )
+            self._retrieved_data = (
+                frames
+                if self.analyses_message_type == ResultType.MULTIPLE_TIME_SERIES
+                else frames[0]
+            )
         return self._retrieved_data
 
+    @property
+    def window(self) -> Optional[pd.DataFrame]:
+        """
+        Returns the sliding window of the machine and sensor of a sensor update, which includes
+        the retrieved data of this message. It is None, if the window store of the ML Wrapper is
+        disabled or the message is no sensor update. If the ML Tool runs without the dispatcher,
+        the window shares its memory with the window store and is only valid until the next
+        message of the same sensor is received, otherwise it is a copy.
+        """
+        return self._window
+
+    @window.setter
+    def window(self, new_value: pd.DataFrame):
+        """
+        Sets the protected property for window
+        :@param new_value: pd.DataFrame
+        """
+        assert isinstance(
+            new_value, pd.DataFrame
+        ), "The value to be set has to be of type DataFrame, but received {}".format(
+            type(new_value)
+        )
+        self._window = new_value
+
+    @property
+    def features(self) -> Optional[dict]:
+        """
+        Returns the features of the machine and sensor of a sensor update, which the aggregators
+        of the ML Tool computed including the retrieved data of this message. It is None, if
+        the ML Tool has no aggregators or the message is no sensor update.
+        """
+        return self._features
+
+    @features.setter
+    def features(self, new_value: dict):
+        """
+        Sets the protected property for features
+        :@param new_value: dict
+        """
+        assert isinstance(
+            new_value, dict
+        ), "The value to be set has to be of type dict, but received {}".format(
+            type(new_value)
+        )
+        self._features = new_value
+
     @property
     def columns(self):
         """Returns the columns field from the message"""
@@ -144,7 +262,23 @@ class IncomingMessage:
 
     @property
     def data(self):
-        """Returns the data field from the message"""
+        """
+        Returns the data field from the message in row representation. It is built from the
+        strings of the payload on the first access. The data of a streamed payload was parsed
+        into columns without keeping its strings, so it is parsed again from the json text.
+        """
+        if self._data is None and self._raw_sections is not None:
+            sections = self._raw_sections
+            if self._streamed:
+                body = JSON_CODEC.loads(self._source)["body"]["payload"]["body"]
+                results = body.get("results", body)
+                sections = results if isinstance(results, list) else [results]
+            rows = [list(map(list, zip(*section.get("data")))) for section in sections]
+            self._data = (
+                rows
+                if self.analyses_message_type == ResultType.MULTIPLE_TIME_SERIES
+                else rows[0]
+            )
         return self._data
 
     @property
@@ -159,14 +293,14 @@ class IncomingMessage:
 
     def _retrieve(self):
         """
-        Convert the data contained in an MQTT message payload
-        to a usable format for ML applications.
+        Reads the fields of an MQTT message payload. The data itself is decoded to a usable
+        format for ML applications when retrieved_data is accessed first.
         """
         self.check_initialized()
         metadata = None
         retrieved_data = None
+        raw_sections = None
         columns = None
-        data = None
         msg = self.payload["body"]
         timestamp = msg.get("timestamp")
         if self._message_type is MessageType.ANALYSES_RESULT:
@@ -175,49 +309,40 @@ class IncomingMessage:
             except KeyError as error:
                 raise InvalidType(error) from error
             self.analyses_message_type = analyses_msg_type
-            if analyses_msg_type == ResultType.TIME_SERIES:
-                results = msg.get("results")
-                if results is None:
-                    raise EmptyResult("The result of a message cannot be empty")
-                retrieved_data, columns, data = retrieve_dataframe(results)
-            elif analyses_msg_type == ResultType.TEXT:
-                results = msg.get("results")
-                if results is None:
-                    raise EmptyResult("The result of a message cannot be empty")
-                retrieved_data = results
-            elif analyses_msg_type == ResultType.MULTIPLE_TIME_SERIES:
-                results = msg.get("results")
-                if results is None:
-                    raise EmptyResult("The result of a message cannot be empty")
-                columns = []
-                retrieved_data = []
-                data = []
-                for result in results:
-                    data_frame_, columns_, data_ = retrieve_dataframe(result)
-                    columns.append(columns_)
-                    retrieved_data.append(data_frame_)
-                    data.append(data_)
-            else:
+            if analyses_msg_type not in (
+                ResultType.TIME_SERIES,
+                ResultType.TEXT,
+                ResultType.MULTIPLE_TIME_SERIES,
+            ):
                 raise InvalidType(
                     "This message type {} has not been implemented".format(
                         analyses_msg_type
                     )
                 )
+            results = msg.get("results")
+            if results is None:
+                raise EmptyResult("The result of a message cannot be empty")
+            if analyses_msg_type == ResultType.TIME_SERIES:
+                raw_sections = [results]
+                columns = results.get("columns")
+            elif analyses_msg_type == ResultType.TEXT:
+                retrieved_data = results
+            else:
+                raw_sections = results
+                columns = [result.get("columns") for result in results]
         elif self._message_type is MessageType.SENSOR_UPDATE:
-            (
-                retrieved_data,
-                columns,
-                data,
-                metadata,
-                self.column_meta,
-            ) = retrieve_sensor_update_data(msg)
+            raw_sections = [msg]
+            columns = msg.get("columns")
+            metadata = msg.get("meta")
+            self.column_meta = retrieve_column_meta(columns)
         else:
             raise NotImplementedError(
                 "The type {} is not yet implemented".format(self._message_type)
             )
         self._retrieved_data = retrieved_data
+        self._raw_sections = raw_sections
         self._columns = columns
-        self._data = data
+        self._data = None
         self._metadata = metadata
         self._timestamp = timestamp
 
@@ -231,8 +356,8 @@ class IncomingMessage:
             field is not None
             for field in [
                 self._retrieved_data,
+                self._raw_sections,
                 self._columns,
-                self._data,
             ]
         )
 
@@ -310,7 +435,8 @@ class IncomingMessage:
         )
         self._mqtt_message = new_value
         self._initialize_with_message()
-        self._retrieve()
+        with self.timer.stage("retrieve"):
+            self._retrieve()
         self.logger.debug("Exit setter of mqtt_message")
 
     @mqtt_message.deleter
@@ -323,7 +449,13 @@ class IncomingMessage:
         assert (
             self._mqtt_message is not None
         ), "MQTT Message needs to be set prior to this method"
-        self.payload = self.mqtt_message.payload
+        properties = getattr(self.mqtt_message, "properties", None)
+        self.trace_parent = SpanContext.from_properties(properties)
+        with self.timer.stage("decompress"):
+            payload = decode_payload(
+                self.mqtt_message.payload, properties, self.max_decompressed_size
+            )
+        self.payload = payload
         self.topic = self.mqtt_message.topic
         self.logger.debug("Exit initialize with message")
 
@@ -339,8 +471,13 @@ class IncomingMessage:
         :param new_value: json string
         """
         self.logger.debug("Enter setter of payload")
+        columns = {}
         try:
-            payload = json.loads(new_value)
+            with self.timer.stage("parse"):
+                if self.stream_threshold and len(new_value) >= self.stream_threshold:
+                    payload, columns = stream_decode(new_value)
+                else:
+                    payload = JSON_CODEC.loads(new_value)
         except JSONDecodeError as error:
             raise error from error
         type_ = None
@@ -362,10 +499,15 @@ class IncomingMessage:
                 )
             ) from error
         try:
-            validate_trigger(payload)
+            with self.timer.stage("validate"):
+                validate_trigger(payload)
             # validate_formal(payload["payload"])
         except NonSchemaConformJsonPayload as error:
             raise error from error
+        self._streamed = bool(columns)
+        # The json text of a streamed payload is kept to read the data strings on demand
+        self._source = new_value if self._streamed else None
+        insert_columns(payload, columns)
         self._machine = payload["body"].get("machine")
         self._sensor = payload["body"].get("sensor")
         self._contract = payload["body"].get("contract")
@@ -428,7 +570,9 @@ class OutgoingMessage:
         is_temporary: bool = True,
         temporary_keyword: str = None,
     ):
-        self._body: Optional[str] = None
+        self._body: Optional[dict] = None
+        self._body_string: Optional[str] = None
+        self._payload: Optional[str] = None
         self.in_message = in_message
         self._base_topic = base_topic
         self.is_temporary = is_temporary
@@ -445,6 +589,8 @@ class OutgoingMessage:
         self.from_ = from_
         self.model_url = model_url
         self.model_tag = model_tag
+        # Resolves to the mid of the message, once the broker acknowledged the publish
+        self.delivery: Optional[Future] = None
 
     @property
     def topic(self) -> str:
@@ -464,10 +610,12 @@ class OutgoingMessage:
     @property
     def payload_as_json_dict(self) -> dict:
         """
-        Returns the calculated payload string as a json dictionary
+        Returns the payload as a json dictionary
         @return: dict
         """
-        return json.loads(self.payload)
+        dict_ = self._make_payload_dict(self.body_as_json_dict)
+        dict_["signature"] = self._sign_body()
+        return dict_
 
     @staticmethod
     def _sign_body():
@@ -479,44 +627,68 @@ class OutgoingMessage:
 
     @property
     def payload(self) -> str:
-        """Returns the resulting payload as string"""
-        dict_ = self._make_payload_dict(self.body_as_json_dict)
-        dict_["signature"] = self._sign_body()
-        return json.dumps(dict_)
+        """
+        Returns the resulting payload as string. The body is serialised only once and the
+        payload is cached until a new body is set.
+        """
+        if self._payload is None:
+            payload = self._make_payload_dict(self._checked_body)
+            payload["signature"] = self._sign_body()
+            self._payload = dumps_with_raw_json(payload)
+        return self._payload
 
     @property
     def body(self) -> str:
-        """Returns the protected property for payload"""
+        """Returns the protected property for payload as json string"""
+        if self._body_string is None:
+            self._body_string = dumps_with_raw_json(self._checked_body)
+        return self._body_string
+
+    @property
+    def raw_body(self) -> Dict:
+        """Returns the body, in which the data encoded by set_results is kept serialised"""
+        return self._checked_body
+
+    @property
+    def _checked_body(self) -> Dict:
+        """Returns the body, which may still contain serialised RawJson data"""
+        self.check_initialized()
+        return self._body
+
+    def check_initialized(self):
+        """
+        Checks whether the body has been set
+        @raise NotInitialized
+        """
         if self._body is None:
             raise NotInitialized(
                 "The body of the outgoing message has to be set. "
                 "You can either use the set_results method or set the "
                 "field body directly."
             )
-        return self._body
 
     @property
     def body_as_json_dict(self) -> Dict:
-        """Returns the message field body as dictionary"""
-        return json.loads(self.body)
+        """
+        Returns a copy of the message field body as dictionary. Changes need to be set with the
+        body setter to be validated and published.
+        """
+        return JSON_CODEC.loads(self.body)
 
     @body.setter
     def body(self, new_value: Union[str, dict]):
         """
         Sets the protected property for payload
-        :@param new_value: str
+        :@param new_value: str or dict
         """
         assert isinstance(
             new_value, (str, dict)
         ), "The value to be set has to be of type str or dict, but received {}".format(
             type(new_value)
         )
-        if isinstance(new_value, dict):
-            new_value = json.dumps(new_value)
+        body = JSON_CODEC.loads(new_value) if isinstance(new_value, str) else new_value
         try:
-            validate_formal_single(
-                json.dumps(self._make_payload_dict(json.loads(new_value)))
-            )
+            validate_formal_single(self._make_payload_dict(raw_json_stand_in(body)))
         except ValidationError as error:
             raise NonSchemaConformJsonPayload(
                 "This payload cannot be set as outgoing message. "
@@ -525,12 +697,16 @@ class OutgoingMessage:
                     new_value, error.message
                 )
             ) from error
-        self._body = new_value
+        self._body = body
+        self._body_string = new_value if isinstance(new_value, str) else None
+        self._payload = None
 
     @body.deleter
     def body(self):
         """Deletes the protected property for payload"""
-        del self._body
+        self._body = None
+        self._body_string = None
+        self._payload = None
 
     def set_results(
         self, result: Union[pd.DataFrame, list, dict], result_type: ResultType = None
@@ -565,18 +741,13 @@ class OutgoingMessage:
             url=self.model_url,
             tag=self.model_tag,
         )
-        resolved["calculated"] = dict(
-            message=dict(
-                machine=self.in_message.machine, sensor=self.in_message.sensor
-            ),
-            received=self.in_message.received,
-        )
+        resolved["calculated"] = self._calculated()
 
         if result_type == ResultType.TIME_SERIES:
             assert isinstance(
                 result, pd.DataFrame
             ), "The {} type can only be set with a DataFrame object".format(result_type)
-            columns, data = resolve_data_frame(result)
+            columns, data = encode_data_frame(result)
             resolved["results"] = dict(data=data, columns=columns)
         elif result_type == ResultType.MULTIPLE_TIME_SERIES:
             assert isinstance(result, list) and all(
@@ -584,10 +755,10 @@ class OutgoingMessage:
             ), "The {} type can only be set with a list of DataFrame objects".format(
                 result_type
             )
-            resolved["results"] = []
-            for res in result:
-                columns, data = resolve_data_frame(res)
-                resolved["results"].append(dict(columns=columns, data=data))
+            resolved["results"] = [
+                dict(columns=columns, data=data)
+                for columns, data in encode_data_frames(result)
+            ]
         elif result_type == ResultType.TEXT:
             assert isinstance(
                 result, dict
@@ -599,7 +770,31 @@ class OutgoingMessage:
             resolved["results"] = result
         else:
             raise ValueError("ResultType {} is not recognized".format(result_type))
-        resolved["timestamp"] = (
-            datetime.datetime.utcnow().astimezone(timezone.utc).isoformat(sep="T")
-        )
+        resolved["timestamp"] = self._now()
         self.body = resolved
+
+    def _calculated(self) -> dict:
+        """Returns the calculated field of the body for the IncomingMessage"""
+        return dict(
+            message=dict(
+                machine=self.in_message.machine, sensor=self.in_message.sensor
+            ),
+            received=self.in_message.received,
+        )
+
+    @staticmethod
+    def _now() -> str:
+        return datetime.datetime.utcnow().astimezone(timezone.utc).isoformat(sep="T")
+
+    def reuse_body(self, body: dict):
+        """
+        Sets the body of a previously published result for this message. The calculated field
+        and the timestamp are renewed, the results are kept. The message gets a copy of the
+        body, so the body can be reused for further messages.
+        @param body: dict
+        """
+        self.body = {
+            **copy.deepcopy(body),
+            "calculated": self._calculated(),
+            "timestamp": self._now(),
+        }
@@ -1,10 +1,10 @@
 """
 This module provides the logic to create Status messages
 """
-import json
 import logging
 
 from paho.mqtt.client import Client
+from ml_wrapper.misc import JSON_CODEC
 from ml_wrapper.misc.prometheus import error_counter, state as prometheus_state
 
 from .state_enum import ToolState
@@ -21,9 +21,19 @@ class StateMessage:
         client: Client,
         logger: logging.Logger,
         from_: str = "",
+        publisher=None,
     ):
+        """
+        Constructor of the StateMessage
+        @param topic: the status topic
+        @param client: the mqtt client
+        @param logger: logging.Logger
+        @param from_: the sender id of the tool
+        @param publisher: optional PublishPipeline to publish and track the state messages with
+        """
         self._state: ToolState = None
         self.kwargs = {}
+        self.publisher = publisher
 
         # assert isinstance(client, Client), "I can only accept paho Client"
         self.client = client
@@ -54,7 +64,7 @@ class StateMessage:
             **message,
             **{key: value for key, value in self.kwargs if isinstance(value, str)},
         }
-        return json.dumps(message)
+        return JSON_CODEC.dumps(message)
 
     def can_publish(self) -> bool:
         """
@@ -71,6 +81,13 @@ class StateMessage:
         This message publishes the state to the given topic
         """
         if self.can_publish():
+            if self.publisher is not None:
+                # The state is also published from the thread of the mqtt client, which must
+                # not wait for acknowledgements
+                self.publisher.submit(
+                    self.topic, payload=self._get_message(), qos=0, wait=False
+                )
+                return
             self.client.publish(self.topic, payload=self._get_message(), qos=0)
             return
         self.logger.warning("I couldn't publish the state message!")
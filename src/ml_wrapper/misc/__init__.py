@@ -4,7 +4,21 @@ This module provides various definitions and functionality to support the ml wra
 
 from .exceptions import *
 from .helper import find_result_type, generate_mqtt_message_mock, topic_splitter
+from .json_codec import JSON_BACKENDS, JSON_CODEC, JsonCodec
 from .log_level import LOG_LEVEL
 from .result_type import ResultType
 from .prometheus import *
+from .stage_timer import UNKNOWN_TYPE, StageTimer
+from .tracing import (
+    SPAN_EXPORTERS,
+    TRACEPARENT,
+    FileSpanExporter,
+    InMemorySpanExporter,
+    Span,
+    SpanContext,
+    SpanExporter,
+    Tracer,
+    new_span_id,
+    new_trace_id,
+)
 from .exception_handler import handle_exception
@@ -50,3 +50,9 @@ class ConfigNotValid(Exception):
     """
     This exception describes the error of a wrongly configured config file.
     """
+
+
+class PublishFailed(Exception):
+    """
+    Represents the error case that an outgoing message was not delivered to the broker
+    """
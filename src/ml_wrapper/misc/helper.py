@@ -64,7 +64,8 @@ def generate_mqtt_message_mock(
     @param message: str
     @return: MQTTMessage
     """
-    msg = MQTTMessage
-    msg.topic = topic
+    # An instance is created, as setting the fields on the class would replace paho's
+    # descriptors for all following messages
+    msg = MQTTMessage(topic=topic.encode("utf-8") if isinstance(topic, str) else topic)
     msg.payload = message
     return msg
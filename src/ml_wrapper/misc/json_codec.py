@@ -0,0 +1,142 @@
+"""
+This module provides the json codec used for all payloads of the ml wrapper. If orjson is
+installed, it is used for parsing and serialising, otherwise the json module of the standard
+library.
+"""
+import datetime
+import json
+from typing import Any, Callable, Optional, Union
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_BACKENDS = ("auto", "orjson", "json")
+
+
+def _to_json_type(value: Any) -> Any:
+    """Converts numpy and datetime values, which json cannot serialise itself"""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    raise TypeError(
+        "Object of type {} is not JSON serializable".format(type(value).__name__)
+    )
+
+
+def _chain(default: Optional[Callable[[Any], Any]]) -> Callable[[Any], Any]:
+    if default is None:
+        return _to_json_type
+
+    def _default(value):
+        try:
+            return default(value)
+        except TypeError:
+            return _to_json_type(value)
+
+    return _default
+
+
+class JsonCodec:
+    """
+    The JsonCodec parses and serialises json with the selected backend. With "auto" orjson is
+    used if it is installed. Both backends serialise numpy arrays, numpy scalars and datetime
+    objects, the latter in ISO 8601 format. The output is compact with both backends.
+    """
+
+    def __init__(self, backend: str = "auto"):
+        self._backend = None
+        self.backend = backend
+
+    @property
+    def backend(self) -> str:
+        """Returns the backend in use, either orjson or json"""
+        return self._backend
+
+    @backend.setter
+    def backend(self, new_value: str):
+        """
+        Sets the json backend
+        @param new_value: str, one of JSON_BACKENDS
+        """
+        assert (
+            new_value in JSON_BACKENDS
+        ), "The json backend has to be one of {}, but received {}".format(
+            JSON_BACKENDS, new_value
+        )
+        if new_value == "auto":
+            new_value = "json" if orjson is None else "orjson"
+        assert (
+            new_value != "orjson" or orjson is not None
+        ), "The json backend orjson is requested, but orjson is not installed"
+        self._backend = new_value
+
+    def loads(self, value: Union[str, bytes, bytearray]) -> Any:
+        """
+        Parses a json string
+        @param value: str or utf-8 encoded bytes
+        @return: the json value
+        @raise json.JSONDecodeError, TypeError for other types than str or bytes
+        """
+        if self._backend == "orjson":
+            if not isinstance(value, (str, bytes, bytearray)):
+                raise TypeError(
+                    "The JSON object must be str, bytes or bytearray, not {}".format(
+                        type(value).__name__
+                    )
+                )
+            return orjson.loads(value)
+        return json.loads(value)
+
+    def dumps_bytes(
+        self,
+        value: Any,
+        default: Optional[Callable[[Any], Any]] = None,
+        sort_keys: bool = False,
+    ) -> bytes:
+        """
+        Serialises a value into utf-8 encoded json
+        @param value: the json value
+        @param default: optional function converting values json cannot serialise
+        @param sort_keys: if true, the keys of all objects are sorted
+        @return: bytes
+        """
+        if self._backend == "orjson":
+            option = orjson.OPT_SERIALIZE_NUMPY
+            if sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+            return orjson.dumps(value, default=_chain(default), option=option)
+        return self.dumps(value, default=default, sort_keys=sort_keys).encode("utf-8")
+
+    def dumps(
+        self,
+        value: Any,
+        default: Optional[Callable[[Any], Any]] = None,
+        sort_keys: bool = False,
+    ) -> str:
+        """
+        Serialises a value into a json string
+        @param value: the json value
+        @param default: optional function converting values json cannot serialise
+        @param sort_keys: if true, the keys of all objects are sorted
+        @return: str
+        """
+        if self._backend == "orjson":
+            return self.dumps_bytes(value, default=default, sort_keys=sort_keys).decode(
+                "utf-8"
+            )
+        return json.dumps(
+            value,
+            default=_chain(default),
+            separators=(",", ":"),
+            sort_keys=sort_keys,
+        )
+
+
+JSON_CODEC = JsonCodec()
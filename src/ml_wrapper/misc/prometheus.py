@@ -5,6 +5,8 @@ This module handles the prometheus metrics
 from prometheus_client import (
     Counter,
     Enum,
+    Gauge,
+    Histogram,
 )
 
 
@@ -20,3 +22,93 @@ message_issue_counter = Counter(
     "message_issues",
     "Counts the incoming messages with an schema validation error or retrieval error",
 )
+
+message_drop_counter = Counter(
+    "dropped_messages",
+    "Counts the incoming messages dropped by the overflow policy of the ingest queue",
+    ["policy"],
+)
+
+message_coalesce_counter = Counter(
+    "coalesced_messages",
+    "Counts the incoming messages replaced by a newer message of the same contract, machine "
+    "and sensor before they were processed",
+)
+
+validator_cache_hits = Counter(
+    "validator_cache_hits",
+    "Counts the validations that reused the cached validator of a json schema",
+    ["schema"],
+)
+
+validation_duration = Histogram(
+    "validation_duration_seconds",
+    "Time spent validating json objects against a json schema",
+    ["schema"],
+)
+
+result_cache_hits = Counter(
+    "result_cache_hits",
+    "Counts the incoming messages answered with a cached result",
+)
+
+result_cache_misses = Counter(
+    "result_cache_misses",
+    "Counts the incoming messages without a cached result",
+)
+
+publish_duration = Histogram(
+    "publish_duration_seconds",
+    "Time from handing an outgoing message to the mqtt client until the broker acknowledged it",
+)
+
+publish_inflight = Gauge(
+    "inflight_publishes",
+    "Number of outgoing messages handed to the mqtt client, which are not acknowledged yet",
+)
+
+publish_failure_counter = Counter(
+    "failed_publishes",
+    "Counts the outgoing messages, which were not delivered to the broker",
+    ["reason"],
+)
+
+stage_duration = Histogram(
+    "stage_duration_seconds",
+    "Time a message spent in one stage of the ML Wrapper, e.g. parse, validate, run or publish",
+    ["stage", "message_type", "result_type"],
+)
+
+end_to_end_duration = Histogram(
+    "end_to_end_duration_seconds",
+    "Time from receiving a message until its result was handed to the mqtt client",
+    ["message_type", "result_type"],
+)
+
+queue_wait_duration = Histogram(
+    "queue_wait_seconds",
+    "Time received messages waited in the ingest queue for a free run",
+)
+
+payload_size = Histogram(
+    "payload_size_bytes",
+    "Size of the received and the published payloads as sent on the wire",
+    ["direction"],
+    buckets=(
+        2**8,
+        2**10,
+        2**12,
+        2**14,
+        2**16,
+        2**18,
+        2**20,
+        2**22,
+        2**24,
+        2**26,
+    ),
+)
+
+runs_inflight = Gauge(
+    "inflight_runs",
+    "Number of received messages, which are processed by the ML Tool at the moment",
+)
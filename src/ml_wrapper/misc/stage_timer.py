@@ -0,0 +1,78 @@
+"""
+This module provides the stage timer, which measures the time a message spends in the stages of
+the ML Wrapper and reports it to prometheus
+"""
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from .prometheus import end_to_end_duration, stage_duration
+
+UNKNOWN_TYPE = "unknown"
+
+
+class StageTimer:
+    """
+    The StageTimer sums up the seconds a message spends per stage. The durations are reported
+    when the message is done, because the message type and the result type labelling them are
+    only known after the payload has been parsed.
+
+    Every measured stage is kept as interval of wall clock nanoseconds as well, which the Tracer
+    turns into spans.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.perf_counter):
+        """
+        Constructor of the StageTimer. The end to end latency is measured from its creation.
+        @param clock: function returning the current time in seconds
+        """
+        self._clock = clock
+        self.started = clock()
+        self.started_ns = time.time_ns()
+        self.durations: Dict[str, float] = {}
+        self.intervals: List[Tuple[str, int, int]] = []
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Measures the duration of the with block as the stage of the given name. The durations of
+        repeated stages are summed up.
+        @param name: name of the stage
+        """
+        started = self._clock()
+        try:
+            yield
+        finally:
+            self.add(name, self._clock() - started, started)
+
+    def add(self, name: str, seconds: float, started: Optional[float] = None):
+        """
+        Adds seconds to the duration of a stage
+        @param name: name of the stage
+        @param seconds: float
+        @param started: the time of the clock, when the stage started, defaults to now
+        """
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+        if started is None:
+            started = self._clock() - seconds
+        start_ns = self.started_ns + int((started - self.started) * 1e9)
+        self.intervals.append((name, start_ns, start_ns + int(seconds * 1e9)))
+
+    @property
+    def elapsed(self) -> float:
+        """Returns the seconds since the message was received"""
+        return self._clock() - self.started
+
+    def observe(self, message_type: str, result_type: str, completed: bool = False):
+        """
+        Reports the stage durations to prometheus and resets them and the intervals
+        @param message_type: the value of the message's MessageType
+        @param result_type: the value of the tool's ResultType
+        @param completed: if true, the end to end latency is reported as well
+        """
+        for name, seconds in self.durations.items():
+            stage_duration.labels(name, message_type, result_type).observe(seconds)
+        self.durations = {}
+        self.intervals = []
+        if completed:
+            end_to_end_duration.labels(message_type, result_type).observe(self.elapsed)
@@ -0,0 +1,251 @@
+"""
+This module provides the tracing of the messages. Every handled message produces a trace span with
+a child span per stage. The trace context travels to the next tool as W3C traceparent in the
+MQTT v5 user properties, so a chain of tools forms one trace. The spans are handed to an
+exporter, which keeps them in memory or writes them as OTLP json lines to a file.
+"""
+import abc
+import json
+import random
+import re
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+TRACEPARENT = "traceparent"
+_TRACEPARENT_FORMAT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+
+def new_trace_id() -> str:
+    """Returns a random trace id of 32 hex digits"""
+    return "{:032x}".format(random.getrandbits(128))
+
+
+def new_span_id() -> str:
+    """Returns a random span id of 16 hex digits"""
+    return "{:016x}".format(random.getrandbits(64))
+
+
+class SpanContext(NamedTuple):
+    """The ids identifying a span within its trace"""
+
+    trace_id: str
+    span_id: str
+
+    @property
+    def traceparent(self) -> str:
+        """Returns the context in the W3C traceparent format"""
+        return "00-{}-{}-01".format(self.trace_id, self.span_id)
+
+    @classmethod
+    def from_traceparent(cls, value: str) -> Optional["SpanContext"]:
+        """
+        Reads a W3C traceparent
+        @param value: str
+        @return: SpanContext or None, if the value is not a valid traceparent
+        """
+        match = _TRACEPARENT_FORMAT.match(value.strip().lower())
+        if match is None or set(match.group(1)) == {"0"}:
+            return None
+        return cls(match.group(1), match.group(2))
+
+    @classmethod
+    def from_properties(cls, properties) -> Optional["SpanContext"]:
+        """
+        Reads the traceparent of the MQTT v5 user properties of a message
+        @param properties: the properties of the message or None
+        @return: SpanContext or None, if there is no valid traceparent
+        """
+        for name, value in getattr(properties, "UserProperty", None) or []:
+            if name == TRACEPARENT:
+                return cls.from_traceparent(value)
+        return None
+
+
+class Span(NamedTuple):
+    """A finished span"""
+
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    start_ns: int
+    end_ns: int
+    attributes: Dict[str, str]
+    ok: bool = True
+
+    def to_otlp(self) -> dict:
+        """Returns the span in the json format of the OpenTelemetry protocol"""
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [
+                {"key": key, "value": {"stringValue": str(value)}}
+                for key, value in self.attributes.items()
+                if value is not None
+            ],
+            "status": {"code": 1 if self.ok else 2},
+        }
+        if self.parent_id is not None:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class SpanExporter(abc.ABC):
+    """Base class of the exporters, which receive the spans of every traced message"""
+
+    @abc.abstractmethod
+    def export(self, spans: List[Span]):
+        """
+        Exports the spans of one message
+        @param spans: list of Span, the span of the message first
+        """
+
+    def shutdown(self):
+        """Releases the resources of the exporter"""
+
+
+class InMemorySpanExporter(SpanExporter):
+    """Keeps the exported spans in a list, e.g. for tests"""
+
+    def __init__(self):
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def export(self, spans: List[Span]):
+        with self._lock:
+            self.spans.extend(spans)
+
+    def clear(self):
+        """Removes all exported spans"""
+        with self._lock:
+            self.spans = []
+
+
+class FileSpanExporter(SpanExporter):
+    """
+    Appends the spans of every message as one line of OTLP json to a file. Like this no
+    collector has to run while tracing, and the file can be sent to a collector afterwards, e.g.
+    with the otlpjsonfile receiver of the OpenTelemetry Collector.
+    """
+
+    def __init__(self, path: str, service_name: str = "ml_wrapper"):
+        """
+        Constructor of the FileSpanExporter
+        @param path: path of the file, which is appended to
+        @param service_name: the service.name of the resource of the spans
+        """
+        assert path, "The file span exporter needs a path"
+        self.path = path
+        self.service_name = service_name
+        self._lock = threading.Lock()
+        self._file = None
+
+    def export(self, spans: List[Span]):
+        line = json.dumps(
+            {
+                "resourceSpans": [
+                    {
+                        "resource": {
+                            "attributes": [
+                                {
+                                    "key": "service.name",
+                                    "value": {"stringValue": self.service_name},
+                                }
+                            ]
+                        },
+                        "scopeSpans": [
+                            {
+                                "scope": {"name": "ml_wrapper"},
+                                "spans": [span.to_otlp() for span in spans],
+                            }
+                        ],
+                    }
+                ]
+            }
+        )
+        with self._lock:
+            if self._file is None:
+                # pylint: disable=consider-using-with
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def shutdown(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+SPAN_EXPORTERS = ("memory", "file")
+
+
+class Tracer:
+    """
+    The Tracer turns the stages measured by the StageTimer of a message into spans and hands
+    them to its exporter
+    """
+
+    def __init__(self, exporter: SpanExporter):
+        """
+        Constructor of the Tracer
+        @param exporter: SpanExporter
+        """
+        assert isinstance(
+            exporter, SpanExporter
+        ), "The exporter has to be a SpanExporter"
+        self.exporter = exporter
+
+    # pylint: disable=too-many-arguments
+    def export(
+        self,
+        name: str,
+        context: SpanContext,
+        parent: Optional[SpanContext],
+        timer,
+        attributes: Dict[str, str],
+        ok: bool = True,
+    ):
+        """
+        Exports the span of a message and a child span per measured stage
+        @param name: name of the span of the message
+        @param context: SpanContext of the message
+        @param parent: SpanContext of the sending tool or None
+        @param timer: the StageTimer of the message
+        @param attributes: dict of the attributes of the message's span
+        @param ok: false, if handling the message failed
+        """
+        spans = [
+            Span(
+                name,
+                context.trace_id,
+                context.span_id,
+                None if parent is None else parent.span_id,
+                timer.started_ns,
+                time.time_ns(),
+                attributes,
+                ok,
+            )
+        ]
+        spans.extend(
+            Span(
+                stage,
+                context.trace_id,
+                new_span_id(),
+                context.span_id,
+                start_ns,
+                end_ns,
+                {},
+            )
+            for stage, start_ns, end_ns in timer.intervals
+        )
+        self.exporter.export(spans)
+
+    def shutdown(self):
+        """Shuts the exporter down"""
+        self.exporter.shutdown()
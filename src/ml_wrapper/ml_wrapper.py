@@ -3,9 +3,12 @@ Wrapper module for ML applications.
 Aims to alleviate ML engineers of extensive administrative overhead
 and configuration for MQTT messaging.
 """
+# The MLWrapper class holds all hooks of an ML Tool in one module
+# pylint: disable=too-many-lines
 
 import abc
 import asyncio
+import copy
 import logging
 import os
 import re
@@ -13,7 +16,9 @@ import signal
 import sys
 import time
 import warnings
-from typing import List, Union
+from concurrent.futures import Future
+from itertools import zip_longest
+from typing import Awaitable, Dict, List, Optional, Tuple, Union
 
 import paho.mqtt.client as mqtt
 import pandas as pd
@@ -21,25 +26,73 @@ import uvicorn
 from iniparser import Config
 from paho.mqtt.client import Client, MQTTMessage
 
-from .messaging import IncomingMessage, MessageType, OutgoingMessage
+from .engine import (
+    OVERFLOW_POLICIES,
+    ArtifactCache,
+    MessageDispatcher,
+    ProcessMessage,
+    ProcessPoolRunner,
+    PublishPipeline,
+    Aggregator,
+    AggregatorStore,
+    ResultCache,
+    WindowStore,
+)
+from .messaging import (
+    FAN_OUT_BACKENDS,
+    FRAME_FAN_OUT,
+    IncomingMessage,
+    JSON_ML_ANALYSE_MULTIPLE_TIME_SERIES,
+    JSON_ML_ANALYSE_TEXT,
+    JSON_ML_ANALYSE_TIME_SERIES,
+    JSON_ML_DATA_EXAMPLE,
+    MAX_DECOMPRESSED_SIZE,
+    MessageType,
+    OutgoingMessage,
+    PayloadEncoder,
+    VALIDATOR_REGISTRY,
+    available_encodings,
+)
 from .messaging.state_message import StateMessage, ToolState
 from .misc import (
     ConfigNotValid,
     EmptyResult,
+    FileSpanExporter,
     handle_exception,
+    InMemorySpanExporter,
     InvalidType,
+    JSON_CODEC,
     LOG_LEVEL,
     NonSchemaConformJsonPayload,
     NotInitialized,
     ResultType,
+    SPAN_EXPORTERS,
     topic_splitter,
+    TRACEPARENT,
+    Tracer,
+    UNKNOWN_TYPE,
     WrongMessageType,
 )
 from .misc.fastAPI_server import app, Server
-from .misc.prometheus import state as prometheus_state, message_issue_counter
+from .misc.prometheus import (
+    message_issue_counter,
+    payload_size,
+    runs_inflight,
+    state as prometheus_state,
+)
 
 FILE_DIR = os.path.dirname(os.path.abspath(__file__))
 
+MQTT_PROTOCOLS = {"3.1.1": mqtt.MQTTv311, "5": mqtt.MQTTv5}
+
+# The bundled example payloads the ML Tool is warmed up with by name
+WARM_UP_PAYLOADS = {
+    "sensor update": JSON_ML_DATA_EXAMPLE,
+    "time series": JSON_ML_ANALYSE_TIME_SERIES,
+    "multiple time series": JSON_ML_ANALYSE_MULTIPLE_TIME_SERIES,
+    "text": JSON_ML_ANALYSE_TEXT,
+}
+
 
 # pylint: disable=too-many-instance-attributes
 class MLWrapper(abc.ABC):
@@ -72,8 +125,22 @@ class MLWrapper(abc.ABC):
 
     In the main program, self.start() shall be used to start an
     infinite loop and react to incoming MQTT messages.
+
+    Before the tool subscribes to its topics, your model is loaded with load_model() and, if
+    model_warm_up is set in the config, warmed up with warm_up(). The tool only reports to be
+    alive afterwards.
+
+    Features, which are updated incrementally with every sensor update, are registered in the
+    aggregators field of the child class, e.g.
+    aggregators = {"mean": RunningMean("value", window=1000)}.
+    Their values per machine and sensor are provided to the run() method in
+    in_message.features.
     """
 
+    # The incremental aggregators of the ML Tool by feature name
+    aggregators: Dict[str, Aggregator] = {}
+
+    # pylint: disable=too-many-statements
     def __init__(
         self,
         result_type: ResultType = ResultType.TIME_SERIES,
@@ -156,6 +223,135 @@ class MLWrapper(abc.ABC):
         self.state_topic = self._config.get("status_topic", default="kosmos/status")
 
         self.state: StateMessage = None
+        self.stream_ingest_threshold = int(
+            self._config.get("stream_ingest_threshold", default="0")
+        )
+        self.max_decompressed_size = int(
+            self._config.get(
+                "max_decompressed_size", default=str(MAX_DECOMPRESSED_SIZE)
+            )
+        )
+        if self.max_decompressed_size < 1:
+            raise ConfigNotValid(
+                "The max_decompressed_size has to be positive, but is {}".format(
+                    self.max_decompressed_size
+                )
+            )
+        self.parallel_codec_threshold = int(
+            self._config.get("parallel_codec_threshold", default="0")
+        )
+        self.parallel_codec_workers = int(
+            self._config.get("parallel_codec_workers", default="0")
+        )
+        self.parallel_codec_backend = self._config.get(
+            "parallel_codec_backend", default="thread"
+        )
+        if self.parallel_codec_backend not in FAN_OUT_BACKENDS:
+            raise ConfigNotValid(
+                "The parallel_codec_backend has to be one of {}, but is {}".format(
+                    FAN_OUT_BACKENDS, self.parallel_codec_backend
+                )
+            )
+
+        # Dispatching of the runs
+        self.max_concurrent_runs = int(
+            self._config.get("max_concurrent_runs", default="1")
+        )
+        self.ingest_queue_size = int(
+            self._config.get("ingest_queue_size", default="100")
+        )
+        self.ingest_overflow_policy = self._config.get(
+            "ingest_overflow_policy", default="block"
+        )
+        if self.ingest_overflow_policy not in OVERFLOW_POLICIES:
+            raise ConfigNotValid(
+                "The ingest_overflow_policy has to be one of {}, but is {}".format(
+                    OVERFLOW_POLICIES, self.ingest_overflow_policy
+                )
+            )
+        self.coalesce_sensor_updates = (
+            self._config.get("coalesce_sensor_updates", default="False").lower()
+            != "false"
+        )
+        self.batch_size = int(self._config.get("batch_size", default="1"))
+        self.batch_timeout_ms = float(
+            self._config.get("batch_timeout_ms", default="20")
+        )
+        self.dispatcher: Optional[MessageDispatcher] = None
+
+        # Publishing of the results
+        self.publish_queue_size = int(
+            self._config.get("publish_queue_size", default="100")
+        )
+        self.publish_timeout_s = float(
+            self._config.get("publish_timeout_s", default="30")
+        )
+        self.result_qos = self._parse_qos(self._config.get("result_qos", default="0"))
+        self.result_topic_qos = [
+            (topic_filter, self._parse_qos(qos))
+            for topic_filter, qos in map(
+                self._split_topic_qos,
+                topic_splitter(self._config.get("result_topic_qos", default="")),
+            )
+        ]
+        self.result_retain_topics = topic_splitter(
+            self._config.get("result_retain_topics", default="")
+        )
+        self.publisher: Optional[PublishPipeline] = None
+        self.mqtt_protocol = self._config.get("mqtt", "protocol", default="3.1.1")
+        if self.mqtt_protocol not in MQTT_PROTOCOLS:
+            raise ConfigNotValid(
+                "The mqtt protocol has to be one of {}, but is {}".format(
+                    tuple(MQTT_PROTOCOLS), self.mqtt_protocol
+                )
+            )
+        result_encoding = self._config.get("result_encoding", default="identity")
+        if result_encoding not in available_encodings():
+            raise ConfigNotValid(
+                "The result_encoding has to be one of {} with the installed packages, "
+                "but is {}".format(available_encodings(), result_encoding)
+            )
+        self.payload_encoder = PayloadEncoder(
+            result_encoding,
+            threshold=int(
+                self._config.get("result_encoding_threshold", default="1024")
+            ),
+            level=int(self._config.get("result_encoding_level", default="-1")),
+        )
+        self.tracer: Optional[Tracer] = self._create_tracer()
+        self.result_cache: Optional[ResultCache] = None
+        result_cache_size = int(self._config.get("result_cache_size", default="0"))
+        if result_cache_size > 0:
+            self.result_cache = ResultCache(
+                max_entries=result_cache_size,
+                ttl=float(self._config.get("result_cache_ttl_s", default="0")),
+                max_bytes=int(
+                    self._config.get("result_cache_max_bytes", default="67108864")
+                ),
+            )
+        self.window_store: Optional[WindowStore] = None
+        window_rows = int(self._config.get("window_rows", default="0"))
+        window_seconds = float(self._config.get("window_seconds", default="0"))
+        if window_rows > 0 or window_seconds > 0:
+            self.window_store = WindowStore(
+                max_rows=window_rows, seconds=window_seconds
+            )
+        self.aggregator_store: Optional[AggregatorStore] = (
+            AggregatorStore(self.aggregators) if self.aggregators else None
+        )
+        self.process_pool_workers = int(
+            self._config.get("process_pool_workers", default="0")
+        )
+        self.process_pool: Optional[ProcessPoolRunner] = None
+
+        # Model lifecycle
+        self.model_warm_up = (
+            self._config.get("model_warm_up", default="False").lower() != "false"
+        )
+        artifact_cache_dir = self._config.get("artifact_cache_dir", default="")
+        self.artifact_cache: Optional[ArtifactCache] = (
+            ArtifactCache(artifact_cache_dir) if artifact_cache_dir else None
+        )
 
         # Miscellaneous
         self.raise_exceptions = (
@@ -184,6 +380,20 @@ class MLWrapper(abc.ABC):
         prometheus_state.state(ToolState.STARTING.value)
         self.logger.info("Prometheus running")
 
+        # Json handling
+        JSON_CODEC.backend = self._config.get("json_backend", default="auto")
+        self.logger.info("Using the json backend %s", JSON_CODEC.backend)
+        self.logger.info("Warm up json schema validators")
+        VALIDATOR_REGISTRY.backend = self._config.get(
+            "validation_backend", default="jsonschema"
+        )
+        VALIDATOR_REGISTRY.warm_up()
+        FRAME_FAN_OUT.configure(
+            threshold=self.parallel_codec_threshold,
+            workers=self.parallel_codec_workers,
+            backend=self.parallel_codec_backend,
+        )
+
         # Async loop setup
         self.logger.info("Starting async loop")
         self.async_loop = self.async_loop_policy.new_event_loop()
@@ -192,9 +402,64 @@ class MLWrapper(abc.ABC):
         self.async_loop.close = lambda: None
         self.logger.info("Asyncloop running")
 
+        # Process pool
+        if self.process_pool_workers > 0:
+            self.logger.info(
+                "Starting process pool with %d workers", self.process_pool_workers
+            )
+            self.process_pool = ProcessPoolRunner(
+                workers=self.process_pool_workers,
+                logger=self.logger,
+                artifact_cache=self.artifact_cache,
+            )
+            self.process_pool.start()
+            self.logger.info("Process pool running")
+
+        # Dispatcher
+        if self.max_concurrent_runs > 0:
+            self.logger.info(
+                "Starting dispatcher with %d concurrent runs", self.max_concurrent_runs
+            )
+            self.dispatcher = MessageDispatcher(
+                handler=self._dispatched_run,
+                logger=self.logger,
+                max_concurrent_runs=self.max_concurrent_runs,
+                queue_size=self.ingest_queue_size,
+                loop_policy=self.async_loop_policy,
+                batch_handler=self._dispatched_batch if self.batch_size > 1 else None,
+                batch_size=self.batch_size,
+                batch_delay=self.batch_timeout_ms / 1000,
+                batch_key=self._batch_key,
+                overflow_policy=self.ingest_overflow_policy,
+                overflow_key=self._overflow_key,
+                coalesce_key=self._coalesce_key
+                if self.coalesce_sensor_updates
+                else None,
+                ingest=self._ingest
+                if self.window_store is not None or self.aggregator_store is not None
+                else None,
+            )
+            self.dispatcher.start()
+            self.logger.info("Dispatcher running")
+        elif self.batch_size > 1 or self.coalesce_sensor_updates:
+            self.logger.warning(
+                "Batching and coalescing require the dispatcher. "
+                "Set max_concurrent_runs to at least 1"
+            )
+
+        # Model
+        self._start_model()
+
         # MQTT
         self.logger.info("Initialize MQTT connection")
         self._init_mqtt()
+        self.publisher = PublishPipeline(
+            client=self.client,
+            logger=self.logger,
+            max_pending=self.publish_queue_size,
+            timeout=self.publish_timeout_s,
+        )
+        self.client.on_publish = self.publisher.on_publish
         self.client.loop_start()
         self._wait_for_connection()
         self._subscribe()
@@ -203,6 +468,7 @@ class MLWrapper(abc.ABC):
             topic=self.state_topic,
             logger=self.logger,
             from_=self.config["config"]["model"]["from"],
+            publisher=self.publisher,
         )
         self.logger.info("MQTT running")
         self.state.state = ToolState.ALIVE
@@ -220,6 +486,25 @@ class MLWrapper(abc.ABC):
         # Start looping
         self.loop_forever()
 
+    def _start_model(self):
+        """Loads and warms up the model before the tool subscribes to its topics"""
+        self.logger.info("Loading the model")
+        self._run_on_tool_loop(self.load_model())
+        if self.model_warm_up:
+            self.logger.info("Warm up the model")
+            self._run_on_tool_loop(self.warm_up())
+        self.logger.info("Model ready")
+
+    def _run_on_tool_loop(self, coroutine: Awaitable):
+        """
+        Runs a coroutine on the loop the runs of the ML Tool are executed on, which is the
+        dispatcher's loop if the dispatcher is used
+        """
+        if self.dispatcher is not None:
+            asyncio.run_coroutine_threadsafe(coroutine, self.dispatcher.loop).result()
+        else:
+            self.async_loop.run_until_complete(coroutine)
+
     def _wait_for_connection(self):
         """
         This function pauses the main thread until the client is connected
@@ -237,9 +522,24 @@ class MLWrapper(abc.ABC):
         """
         self.logger.info("Tearing down all components...")
         self.state.state = ToolState.SHUTTING_DOWN
+        # Running messages are finished and their results published, while no new messages
+        # are accepted anymore
+        self.client.on_message = None
+        if self.dispatcher is not None:
+            self.logger.info("Tearing down dispatcher...")
+            self.dispatcher.stop(drain=True)
+        if self.publisher is not None:
+            self.logger.info("Waiting for %d pending publishes...", len(self.publisher))
+            self.publisher.close(timeout=self.publish_timeout_s)
         self.logger.info("Tearing down MQTT connection...")
         self.client.loop_stop()
         self.client.disconnect()
+        if self.process_pool is not None:
+            self.logger.info("Tearing down process pool...")
+            self.process_pool.stop()
+        if self.tracer is not None:
+            self.tracer.shutdown()
+        FRAME_FAN_OUT.shutdown()
         self.logger.info("Tearing down Async loop...")
         self.async_loop.close_()
         self.logger.info("Tearing down server...")
@@ -271,6 +571,28 @@ class MLWrapper(abc.ABC):
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.tear_down_components()
 
+    def _create_tracer(self) -> Optional[Tracer]:
+        """Creates the tracer with the configured exporter, if tracing is enabled"""
+        trace_exporter = self._config.get("trace_exporter", default="")
+        if not trace_exporter:
+            return None
+        if trace_exporter not in SPAN_EXPORTERS:
+            raise ConfigNotValid(
+                "The trace_exporter has to be one of {} or empty, but is {}".format(
+                    SPAN_EXPORTERS, trace_exporter
+                )
+            )
+        if trace_exporter == "memory":
+            return Tracer(InMemorySpanExporter())
+        return Tracer(
+            FileSpanExporter(
+                self._config.get("trace_file", default="traces.jsonl"),
+                service_name="{}/{}".format(
+                    self._config.get("model", "url"), self._config.get("model", "tag")
+                ),
+            )
+        )
+
     def _check_config_sanity(self):
         """Checks the sanity of the config file at creation time"""
         assert (
@@ -303,7 +625,7 @@ class MLWrapper(abc.ABC):
 
     def _init_mqtt(self):
         """Initialise the mqtt client"""
-        self.client = mqtt.Client()
+        self.client = mqtt.Client(protocol=MQTT_PROTOCOLS[self.mqtt_protocol])
         self.client.connect_async(
             self.config["config"]["mqtt"]["host"],
             port=int(self.config["config"]["mqtt"]["port"]),
@@ -385,16 +707,29 @@ class MLWrapper(abc.ABC):
     # pylint: disable=unused-argument,broad-except
     def _react_to_message(
         self, client: Client, user_data: Union[None, str], message: MQTTMessage
-    ):
-        """This method is the entry point when a message is received."""
+    ) -> Optional[Future]:
+        """
+        This method is the entry point when a message is received.
+
+        If the dispatcher is running, the run of the ML Tool is handed over to it and the future
+        of the run is returned. Otherwise the run is executed right away and None is returned.
+        """
         self.logger.debug("Message received: %s", format(str(message.payload)))
-        in_message = IncomingMessage(logger=self.logger)
+        payload_size.labels("in").observe(len(message.payload or b""))
+        in_message = IncomingMessage(
+            logger=self.logger,
+            stream_threshold=self.stream_ingest_threshold,
+            max_decompressed_size=self.max_decompressed_size,
+        )
         self.logger.debug("Message is now referenced by %s", in_message.mid)
         try:
             self.logger.debug(in_message)
             in_message.mqtt_message = message
             self._check_message_requirements(in_message)
+            if self.dispatcher is None:
+                self._update_sensor_state(in_message)
         except (EmptyResult, InvalidType, NonSchemaConformJsonPayload) as error:
+            self._observe_stages(in_message)
             self.logger.error("%s:\n%s", error.__class__.__name__, error)
             message_issue_counter.inc()
             handle_exception(
@@ -403,8 +738,9 @@ class MLWrapper(abc.ABC):
                 state=self.state,
                 raise_further=self.raise_exceptions,
             )
-            return
+            return None
         except WrongMessageType as error:
+            self._observe_stages(in_message)
             self.logger.error("%s: \n%s", WrongMessageType.__name__, error)
             handle_exception(
                 exception=error,
@@ -412,8 +748,9 @@ class MLWrapper(abc.ABC):
                 state=self.state,
                 raise_further=False,
             )
-            return
+            return None
         except Exception as error:
+            self._observe_stages(in_message)
             self.logger.error(
                 "The exception %s has to be handled!\n%s",
                 error.__class__.__name__,
@@ -425,7 +762,12 @@ class MLWrapper(abc.ABC):
                 state=self.state,
                 raise_further=self.raise_exceptions,
             )
-            return
+            return None
+        if self.dispatcher is not None:
+            self.logger.debug(
+                "Dispatch the run of the ML Tool for message %s", in_message.mid
+            )
+            return self.dispatcher.submit(in_message)
         self.logger.debug(
             "Start the async run of the ML Tool for message %s", in_message.mid
         )
@@ -433,19 +775,243 @@ class MLWrapper(abc.ABC):
         try:
             self.async_loop.run_until_complete(self._run(in_message))
         except Exception as error:
-            self.logger.error(
-                "The exception %s has to be handled!\n%s",
-                error.__class__.__name__,
-                error,
+            self._handle_run_exception(error)
+            return None
+        self.logger.debug("Finished tool for message %s", in_message.mid)
+        return None
+
+    # No exception should completely kill the dispatcher
+    # pylint: disable=broad-except
+    async def _dispatched_run(
+        self, in_message: IncomingMessage
+    ) -> Optional[OutgoingMessage]:
+        """Runs the ML Tool for one message on the dispatcher's loop"""
+        try:
+            out_message = await self._run(in_message)
+        except Exception as error:
+            self._handle_run_exception(error)
+            return None
+        self.logger.debug("Finished tool for message %s", in_message.mid)
+        return out_message
+
+    @staticmethod
+    def _overflow_key(in_message: IncomingMessage) -> tuple:
+        """The latest overflow policy keeps one waiting message per machine and sensor"""
+        return in_message.machine, in_message.sensor
+
+    @staticmethod
+    def _coalesce_key(in_message: IncomingMessage) -> Optional[tuple]:
+        """Only the latest sensor update per contract, machine and sensor is processed"""
+        if in_message.message_type != MessageType.SENSOR_UPDATE:
+            return None
+        return in_message.contract, in_message.machine, in_message.sensor
+
+    @staticmethod
+    def _batch_key(in_message: IncomingMessage) -> tuple:
+        """Messages are only batched with messages of the same model and type"""
+        # MessageType is not hashable, therefore the values of the types are used
+        return (
+            in_message.model,
+            in_message.tag,
+            getattr(in_message.message_type, "value", None),
+            getattr(in_message.analyses_message_type, "value", None),
+        )
+
+    # No exception should completely kill the dispatcher
+    # pylint: disable=broad-except
+    async def _dispatched_batch(
+        self, in_messages: List[IncomingMessage]
+    ) -> List[Optional[OutgoingMessage]]:
+        """Runs the ML Tool once for a batch of messages on the dispatcher's loop"""
+        runs_inflight.inc(len(in_messages))
+        outcomes: List[Optional[OutgoingMessage]] = []
+        try:
+            outcomes = await self._run_batch_messages(in_messages)
+            return outcomes
+        finally:
+            runs_inflight.dec(len(in_messages))
+            for in_message, out_message in zip_longest(in_messages, outcomes):
+                self._observe_stages(in_message, completed=out_message is not None)
+
+    # No exception should completely kill the dispatcher
+    # pylint: disable=broad-except
+    async def _run_batch_messages(
+        self, in_messages: List[IncomingMessage]
+    ) -> List[Optional[OutgoingMessage]]:
+        """Answers the cached messages of a batch and runs the ML Tool for the others"""
+        outcomes: List[Optional[OutgoingMessage]] = [None] * len(in_messages)
+        created = []
+        for index, in_message in enumerate(in_messages):
+            try:
+                cache_key = self._result_cache_key(in_message)
+                body = self._cached_body(cache_key)
+                if body is not None:
+                    outcomes[index] = await self._publish_cached_result(
+                        body, in_message
+                    )
+                    continue
+                created.append(
+                    (index, cache_key, await self._create_out_message(in_message))
+                )
+            except Exception as error:
+                self._handle_run_exception(error)
+        out_messages = [out_message for _, _, out_message in created]
+        if not out_messages:
+            return outcomes
+        self.logger.debug("Start ML tool for a batch of %d", len(out_messages))
+        started = time.perf_counter()
+        try:
+            if self.process_pool is not None:
+                results = await asyncio.gather(
+                    *(
+                        self.process_pool.run(type(self).run_sync, out.in_message)
+                        for out in out_messages
+                    )
+                )
+            else:
+                results = await self.run_batch(out_messages)
+            if len(results) != len(out_messages):
+                raise ValueError(
+                    "The run_batch method has to provide one result per message, but "
+                    "provided {} results for {} messages".format(
+                        len(results), len(out_messages)
+                    )
+                )
+        except Exception as error:
+            self._handle_run_exception(error)
+            return outcomes
+        # Every message of the batch waited for the run of the whole batch
+        run_duration = time.perf_counter() - started
+        for out_message in out_messages:
+            out_message.in_message.timer.add("run", run_duration, started)
+        for (index, cache_key, out_message), result in zip(created, results):
+            try:
+                outcomes[index] = await self._complete_run(result, out_message)
+                self._cache_result(cache_key, outcomes[index])
+            except Exception as error:
+                self._handle_run_exception(error)
+                continue
+            self.logger.debug(
+                "Finished tool for message %s", out_message.in_message.mid
             )
-            handle_exception(
-                exception=error,
-                logger=self.logger,
-                state=self.state,
-                raise_further=self.raise_exceptions,
+        return outcomes
+
+    def _handle_run_exception(self, error: Exception):
+        """Logs and handles an exception raised while running the ML Tool"""
+        self.logger.error(
+            "The exception %s has to be handled!\n%s",
+            error.__class__.__name__,
+            error,
+        )
+        handle_exception(
+            exception=error,
+            logger=self.logger,
+            state=self.state,
+            raise_further=self.raise_exceptions,
+        )
+
+    # Can be reimplemented by user, and can then gain self-use
+    async def load_model(self) -> None:
+        """
+        This method loads your model. It is called once while the tool starts up, before the
+        model is warmed up and before the tool subscribes to its topics. Like this no message is
+        processed before your model is ready.
+
+        If artifact_cache_dir is set in the config, self.artifact_cache stores numpy arrays as
+        memory mapped files. The worker processes of the process pool find the same cache in
+        message.artifact_cache and share the memory of its arrays instead of loading a copy
+        each, e.g.
+        ::
+
+            self.weights = self.artifact_cache.get("weights", build=load_weights)
+
+        By default nothing is loaded.
+        """
+
+    # Can be reimplemented by user, and can then gain self-use
+    async def warm_up(self) -> None:
+        """
+        This method warms up your model, if model_warm_up is set in the config. It is called
+        once while the tool starts up, after load_model and before the tool subscribes to its
+        topics.
+
+        By default the bundled example payloads, which the tool reacts to, are processed like
+        received messages with retrieve_payload_data, run or run_sync and resolve_result_data.
+        The results are not published and the sliding windows, the aggregators and the result
+        cache are left untouched.
+        """
+        for name, payload in WARM_UP_PAYLOADS.items():
+            try:
+                in_message = self._warm_up_message(payload)
+                self._check_message_requirements(in_message)
+            except WrongMessageType:
+                continue
+            self.logger.debug("Warm up with the %s example", name)
+            start = time.perf_counter()
+            try:
+                await self._warm_up_run(in_message)
+            # A failed warm up must not prevent the tool from starting
+            # pylint: disable=broad-except
+            except Exception as error:
+                self.logger.warning(
+                    "The warm up with the %s example failed: %s",
+                    name,
+                    error.__class__.__name__,
+                )
+                if self.raise_exceptions:
+                    raise
+                continue
+            self.logger.debug(
+                "Warm up with the %s example took %.3fs",
+                name,
+                time.perf_counter() - start,
             )
-            return
-        self.logger.debug("Finished tool for message %s", in_message.mid)
+
+    def _warm_up_message(self, payload: dict) -> IncomingMessage:
+        """Creates an IncomingMessage of an example payload sent to the tool's topic"""
+        topic = "kosmos/analytics/{}/{}".format(
+            self._config.get("model", "url") or "warm-up",
+            self._config.get("model", "tag") or "warm-up",
+        )
+        message = MQTTMessage(topic=topic.encode("utf-8"))
+        message.payload = JSON_CODEC.dumps_bytes(payload)
+        in_message = IncomingMessage(
+            logger=self.logger,
+            stream_threshold=self.stream_ingest_threshold,
+            max_decompressed_size=self.max_decompressed_size,
+        )
+        in_message.mqtt_message = message
+        return in_message
+
+    async def _warm_up_run(self, in_message: IncomingMessage):
+        """Runs the ML Tool for a message without publishing the result"""
+        in_message = await self.retrieve_payload_data(in_message)
+        out_message = self._new_out_message(in_message)
+        if self.process_pool is not None:
+            result = await self.process_pool.run(
+                type(self).run_sync, out_message.in_message
+            )
+        else:
+            result = await self.run(out_message)
+        out_message = await self.resolve_result_data(result, out_message)
+        # Serialises the result like before publishing
+        _ = out_message.payload
+
+    # Can be reimplemented by user, and can then gain self-use
+    # pylint: disable=unused-argument
+    def use_result_cache(self, in_message: IncomingMessage) -> bool:
+        """
+        This method decides, whether the result for the message may be taken from the result
+        cache and stored in it. It is only called if result_cache_size is set above 0.
+
+        The result cache answers messages with the same payload body with the result published
+        before, without calling retrieve_payload_data and run. Overwrite this method to exclude
+        messages from caching, e.g. if your result depends on more than the payload.
+
+        @param in_message: IncomingMessage
+        @return: bool
+        """
+        return True
 
     # Can be reimplemented by user, and can then gain self-use
     async def retrieve_payload_data(
@@ -509,10 +1075,134 @@ class MLWrapper(abc.ABC):
         Wrapper around the actual run method.
         Executes run() and passes its result to a MQTT message.
         """
+        out_message = None
+        try:
+            with runs_inflight.track_inprogress():
+                out_message = await self._run_message(in_message)
+            return out_message
+        finally:
+            self._observe_stages(in_message, completed=out_message is not None)
+
+    async def _run_message(self, in_message: IncomingMessage) -> OutgoingMessage:
+        """Answers the message from the result cache or runs the ML Tool for it"""
+        cache_key = self._result_cache_key(in_message)
+        body = self._cached_body(cache_key)
+        if body is not None:
+            return await self._publish_cached_result(body, in_message)
+        out_message = await self._create_out_message(in_message)
+        with in_message.timer.stage("run"):
+            if self.process_pool is not None:
+                result = await self.process_pool.run(
+                    type(self).run_sync, out_message.in_message
+                )
+            else:
+                result = await self.run(out_message)
+        out_message = await self._complete_run(result, out_message)
+        self._cache_result(cache_key, out_message)
+        return out_message
+
+    def _observe_stages(self, in_message: IncomingMessage, completed: bool = False):
+        """Reports the stage durations of the message to prometheus and the tracer"""
+        message_type = getattr(in_message.message_type, "value", UNKNOWN_TYPE)
+        if self.tracer is not None:
+            self.tracer.export(
+                "handle_message",
+                in_message.span_context,
+                in_message.trace_parent,
+                in_message.timer,
+                {
+                    "message.id": in_message.mid,
+                    "message.type": message_type,
+                    "result.type": self.result_type.value,
+                    "mqtt.topic": in_message.topic,
+                    "contract": in_message.contract,
+                    "machine": in_message.machine,
+                    "sensor": in_message.sensor,
+                },
+                ok=completed,
+            )
+        in_message.timer.observe(
+            message_type, self.result_type.value, completed=completed
+        )
+
+    def _result_cache_key(self, in_message: IncomingMessage) -> Optional[str]:
+        """Returns the key of the message in the result cache, or None if it is not cached"""
+        if self.result_cache is None or not self.use_result_cache(in_message):
+            return None
+        return ResultCache.key(
+            in_message.payload["body"],
+            self._config.get("model", "url"),
+            self._config.get("model", "tag"),
+        )
+
+    def _cached_body(self, cache_key: Optional[str]) -> Optional[dict]:
+        """Returns the cached result body for the key, if there is one"""
+        return None if cache_key is None else self.result_cache.get(cache_key)
+
+    def _cache_result(self, cache_key: Optional[str], out_message: OutgoingMessage):
+        """
+        Stores a copy of the body of a published result in the result cache, so later changes
+        of the published message don't change the cached result
+        """
+        if cache_key is not None and out_message is not None:
+            self.result_cache.put(
+                cache_key, copy.deepcopy(out_message.raw_body), len(out_message.payload)
+            )
+
+    async def _publish_cached_result(
+        self, body: dict, in_message: IncomingMessage
+    ) -> OutgoingMessage:
+        """Publishes a cached result body for the message without running the ML Tool"""
+        self.logger.debug("Publish the cached result for %s", in_message.id_ref)
+        out_message = self._new_out_message(in_message)
+        out_message.reuse_body(body)
+        return await self._publish_result_message(out_message)
+
+    async def _create_out_message(self, in_message: IncomingMessage) -> OutgoingMessage:
+        """Retrieves the payload data and creates the OutgoingMessage for a run"""
         self.logger.debug(in_message.id_ref)
         self.logger.debug("Start ML tool...")
-        out_message = OutgoingMessage(
-            await self.retrieve_payload_data(in_message),
+        with in_message.timer.stage("retrieve_payload_data"):
+            in_message = await self.retrieve_payload_data(in_message)
+        return self._new_out_message(in_message)
+
+    # pylint: disable=broad-except
+    def _ingest(self, in_message: IncomingMessage):
+        """
+        Updates the sensor state of a message on the ingest thread of the dispatcher. A failed
+        update is handled like a failed run and fails the dispatched run of the message.
+        """
+        try:
+            self._update_sensor_state(in_message)
+        except Exception as error:
+            self._observe_stages(in_message)
+            self._handle_run_exception(error)
+            raise
+
+    def _update_sensor_state(self, in_message: IncomingMessage):
+        """
+        Appends the data of a sensor update to the window and the aggregators of its machine
+        and sensor. This is done for every received message in the order of receipt, on the
+        ingest thread of the dispatcher if it is running, so sensor updates which are coalesced,
+        dropped or answered from the result cache are part of the window as well.
+        """
+        if in_message.message_type != MessageType.SENSOR_UPDATE:
+            return
+        key = (in_message.machine, in_message.sensor)
+        if self.window_store is not None:
+            # Runs on the dispatcher read their window while the next messages are received
+            in_message.window = self.window_store.append(
+                key, in_message.retrieved_data, copy=self.dispatcher is not None
+            )
+        if self.aggregator_store is not None:
+            in_message.features = self.aggregator_store.update(
+                key, in_message.retrieved_data
+            )
+
+    def _new_out_message(self, in_message: IncomingMessage) -> OutgoingMessage:
+        """Creates the OutgoingMessage for the message"""
+        return OutgoingMessage(
+            in_message,
             from_=self._config.get("model", "from"),
             model_tag=self._config.get("model", "tag"),
             model_url=self._config.get("model", "url"),
@@ -524,16 +1214,23 @@ class MLWrapper(abc.ABC):
                 "messaging", "temporary_keyword", default="temporary"
             ),
         )
-        result = await self.run(out_message)
+
+    async def _complete_run(
+        self,
+        result: Union[pd.DataFrame, List[pd.DataFrame], dict],
+        out_message: OutgoingMessage,
+    ) -> Optional[OutgoingMessage]:
+        """Resolves the result of a run into the OutgoingMessage and publishes it"""
         print(result)
         if not any(isinstance(result, dtype) for dtype in [pd.DataFrame, list, dict]):
             raise TypeError(
                 "The run method has to provide a DataFrame, a list of DataFrames or a dictionary"
             )
         self.logger.debug("End ML tool")
-        out_message = await self.resolve_result_data(result, out_message)
+        with out_message.in_message.timer.stage("resolve_result_data"):
+            out_message = await self.resolve_result_data(result, out_message)
         try:
-            out_message.body
+            out_message.check_initialized()
         except NotInitialized as error:
             self.logger.error(error)
             self.logger.error(
@@ -548,7 +1245,6 @@ class MLWrapper(abc.ABC):
                 raise_further=self.raise_exceptions,
             )
             return
-        print(out_message.body)
         out_message = await self._publish_result_message(out_message)
         return out_message
 
@@ -561,20 +1257,80 @@ class MLWrapper(abc.ABC):
         @return: OutgoingMessage
         """
         self.logger.debug(out_message.in_message.id_ref)
-        self.logger.debug("Publish the result to %s", out_message.topic)
-        if re.match(r"/?kosmos/analyses/[^/]+", out_message.topic) is None:
+        topic = out_message.topic
+        self.logger.debug("Publish the result to %s", topic)
+        if re.match(r"/?kosmos/analyses/[^/]+", topic) is None:
             self.logger.warning(
                 "You are using an undefined topic %s. Please consider either correcting "
                 "your publishing topic or open an issue for the ML Wrapper to include "
                 "the new topic into the logic.",
-                out_message.topic,
+                topic,
             )
-        self.client.publish(
-            topic=out_message.topic,
-            payload=out_message.payload,
-        )
+        qos, retain = self._publish_options(topic)
+        timer = out_message.in_message.timer
+        with timer.stage("encode"):
+            payload = self.payload_encoder.encode(out_message.payload)
+        payload_size.labels("out").observe(len(payload))
+        properties = None
+        if self.mqtt_protocol == "5":
+            properties = self.payload_encoder.properties(payload)
+            # The next tool continues the trace of this message
+            properties.UserProperty = (
+                TRACEPARENT,
+                out_message.in_message.span_context.traceparent,
+            )
+        # Without the dispatcher, the tool runs on the thread of the mqtt client, which handles
+        # the acknowledgements and therefore cannot wait for them
+        with timer.stage("publish"):
+            if self.dispatcher is not None:
+                out_message.delivery = await self.publisher.publish(
+                    topic, payload, qos=qos, retain=retain, properties=properties
+                )
+            else:
+                out_message.delivery = self.publisher.submit(
+                    topic,
+                    payload,
+                    qos=qos,
+                    retain=retain,
+                    wait=False,
+                    properties=properties,
+                )
         return out_message
 
+    def _publish_options(self, topic: str) -> Tuple[int, bool]:
+        """Returns the QoS and the retain flag of a result topic"""
+        qos = next(
+            (
+                qos
+                for topic_filter, qos in self.result_topic_qos
+                if mqtt.topic_matches_sub(topic_filter, topic)
+            ),
+            self.result_qos,
+        )
+        retain = any(
+            mqtt.topic_matches_sub(topic_filter, topic)
+            for topic_filter in self.result_retain_topics
+        )
+        return qos, retain
+
+    @staticmethod
+    def _parse_qos(value: str) -> int:
+        """Parses a QoS of the config"""
+        if value.strip() not in ("0", "1", "2"):
+            raise ConfigNotValid("A QoS has to be 0, 1 or 2, but is {}".format(value))
+        return int(value)
+
+    @staticmethod
+    def _split_topic_qos(entry: str) -> Tuple[str, str]:
+        """Splits an entry of result_topic_qos into the topic filter and the QoS"""
+        topic_filter, separator, qos = entry.rpartition("=")
+        if not separator or not topic_filter.strip():
+            raise ConfigNotValid(
+                "The entries of result_topic_qos have to look like <topic filter>=<qos>, "
+                "but one is {}".format(entry)
+            )
+        return topic_filter.strip(), qos
+
     @abc.abstractmethod
     async def run(
         self, out_message: OutgoingMessage
@@ -594,3 +1350,46 @@ class MLWrapper(abc.ABC):
         """
         self.logger.warning("This method needs to be implemented!")
         return NotImplementedError
+
+    async def run_batch(
+        self, out_messages: List[OutgoingMessage]
+    ) -> List[Union[pd.DataFrame, List[pd.DataFrame], dict]]:
+        """
+        The run_batch method executes your ML Logic for a batch of messages at once.
+
+        It is only used if batch_size is set to a number greater than 1 in the config. Then the
+        messages received within batch_timeout_ms are collected into batches of up to batch_size
+        messages with the same model and message type. Overwrite this method, if your model is
+        cheaper per row when it runs on many rows at once. By default the run method is called
+        for every message.
+
+        The result has to be a list with one result per OutgoingMessage in the same order. Each
+        result is of the same types as the result of the run method and is published with its
+        OutgoingMessage.
+
+        @param out_messages: list of OutgoingMessage
+        @return: list of pandas.DataFrame, List[pandas.DataFrame], or dict
+        """
+        return [await self.run(out_message) for out_message in out_messages]
+
+    @staticmethod
+    def run_sync(
+        message: ProcessMessage,
+    ) -> Union[pd.DataFrame, List[pd.DataFrame], dict]:
+        """
+        The run_sync method executes your ML Logic in a worker process of the process pool.
+
+        It is only used if process_pool_workers is set to a number greater than 0 in the config.
+        In this case run_sync replaces the run method, so CPU bound calculations can use all cores
+        of the machine. As it is executed in another process, it has to be a staticmethod and
+        cannot access the ML Tool instance. All information is provided by the ProcessMessage,
+        which carries the retrieved data and the relevant fields of the IncomingMessage.
+        The result has to be of the same types as the result of the run method.
+
+        @param message: ProcessMessage
+        @return: pandas.DataFrame, List[pandas.DataFrame], or dict
+        """
+        raise ConfigNotValid(
+            "The process pool is enabled by process_pool_workers, "
+            "but the tool doesn't implement run_sync"
+        )
@@ -6,6 +6,7 @@
 import json
 import logging
 import time
+from concurrent.futures import Future
 from typing import List, Type, Union
 from unittest.mock import Mock
 
@@ -47,7 +48,10 @@ class MockMqttClient:
         )
         # pylint falsly thinks on_message is not callable
         # pylint: disable=not-callable
-        self.on_message(client, None, msg)
+        run = self.on_message(client, None, msg)
+        # Wait for dispatched runs to make mocked messages behave synchronously
+        if isinstance(run, Future):
+            run.result()
 
     def publish(self, topic, payload, *args, **kwargs):
         """Provides a publish function"""
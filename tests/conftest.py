@@ -31,11 +31,15 @@ from ml_wrapper.mocks import create_mock_tool
 from tests.mock_ml_tools import (
     BadMLTool,
     BadTopicTool,
+    BatchTool,
     FFT,
+    LifecycleTool,
+    ProcessTool,
     RequireCertainInput,
     ResultTypeTool,
     SimpleTool,
     SlowMLTool,
+    WindowTool,
     WrongResolve,
 )
 
@@ -47,6 +51,10 @@ SlowMlToolMock = create_mock_tool(SlowMLTool)
 ResultTypeToolMock = create_mock_tool(ResultTypeTool)
 BadMlToolMock = create_mock_tool(BadMLTool)
 RequireCertainInputMock = create_mock_tool(RequireCertainInput)
+ProcessToolMock = create_mock_tool(ProcessTool)
+WindowToolMock = create_mock_tool(WindowTool)
+BatchToolMock = create_mock_tool(BatchTool)
+LifecycleToolMock = create_mock_tool(LifecycleTool)
 
 
 def _copy(dict_):
@@ -184,6 +192,19 @@ def ML_MOCK_REQUIRE_CERTAIN_INPUT(tool_patch) -> MLWrapper:
     )
 
 
+@pytest.fixture
+def ML_MOCK_PROCESS_TOOL(tool_patch, monkeypatch) -> MLWrapper:
+    monkeypatch.setenv("CONFIG_WRAPPER_PROCESS_POOL_WORKERS", "2")
+    return ProcessToolMock(outgoing_message_is_temporary=True)
+
+
+@pytest.fixture
+def ML_MOCK_BATCH_TOOL(tool_patch, monkeypatch) -> MLWrapper:
+    monkeypatch.setenv("CONFIG_WRAPPER_BATCH_SIZE", "4")
+    monkeypatch.setenv("CONFIG_WRAPPER_BATCH_TIMEOUT_MS", "500")
+    return BatchToolMock(outgoing_message_is_temporary=True)
+
+
 @pytest.fixture
 def new_incoming_message():
     return IncomingMessage(logger=logging.getLogger(__file__))
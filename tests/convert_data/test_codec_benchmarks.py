@@ -0,0 +1,108 @@
+"""
+Gates the codec functions against the stored benchmark baselines. One baseline is stored per
+environment of packages and backends. The baseline of the running environment is rewritten with
+BENCH_UPDATE_BASELINE=1, the tolerances are set with BENCH_TIME_TOLERANCE and
+BENCH_MEMORY_TOLERANCE. The gate is skipped, if no baseline of the running environment is
+stored, unless BENCH_REQUIRE_BASELINE is set like in the CI.
+"""
+import os
+
+import pytest
+
+from ml_wrapper.bench.codecs import (
+    benchmark_codecs,
+    case_name,
+    compare,
+    environment,
+    load_baseline,
+    store_baseline,
+)
+
+BASELINE = os.path.join(os.path.dirname(__file__), "codec_baseline.json")
+# Shared machines vary a lot in timing, the allocations are the strict gate
+TIME_TOLERANCE = float(os.environ.get("BENCH_TIME_TOLERANCE", "1.0"))
+MEMORY_TOLERANCE = float(os.environ.get("BENCH_MEMORY_TOLERANCE", "0.25"))
+RETRIES = 2
+
+
+def _result(relative_time, peak_bytes):
+    return {"relative_time": relative_time, "peak_bytes": peak_bytes}
+
+
+def test_compare():
+    baseline = {
+        "results": {
+            "fast": _result(1.0, 1000),
+            "slow": _result(1.0, 1000),
+            "small": _result(1.0, 1000),
+            "large": _result(1.0, 1000000),
+        }
+    }
+    current = {
+        "results": {
+            "fast": _result(1.4, 1000),
+            "slow": _result(1.6, 1000),
+            "small": _result(1.0, 60000),
+            "large": _result(1.0, 1300000),
+            "new": _result(10.0, 10**9),
+        }
+    }
+    regressions = compare(current, baseline, time_tolerance=0.5, memory_tolerance=0.25)
+    assert [name for name, _ in regressions] == ["slow", "large"]
+    assert "60% slower" in regressions[0][1]
+
+
+def test_baseline_per_environment(tmp_path):
+    path = str(tmp_path / "baseline.json")
+    results = {"environment": environment(), "results": {"case": _result(1.0, 1)}}
+    other = {
+        "environment": dict(environment(), json_backend="other"),
+        "results": {"case": _result(2.0, 2)},
+    }
+    store_baseline(other, path)
+    assert load_baseline(path) is None
+    store_baseline(results, path)
+    store_baseline(results, path)
+    assert load_baseline(path) == results
+    assert load_baseline(path, other["environment"]) == other
+
+
+def test_benchmark_codecs_subset():
+    name = case_name("resolve_data_frame", "number", 10)
+    results = benchmark_codecs(names=[name], sizes=(10,), column_types=("number",))
+    assert list(results["results"]) == [name]
+    assert results["results"][name]["relative_time"] > 0
+    assert results["results"][name]["peak_bytes"] > 0
+    assert results["calibration_seconds"] > 0
+    assert results["environment"] == environment()
+
+
+def test_codecs_against_baseline():
+    if os.environ.get("BENCH_UPDATE_BASELINE"):
+        store_baseline(benchmark_codecs(), BASELINE)
+    baseline = load_baseline(BASELINE)
+    if baseline is None:
+        message = f"No baseline was measured in {environment()}"
+        if os.environ.get("BENCH_REQUIRE_BASELINE"):
+            pytest.fail(message)
+        pytest.skip(message)
+    current = benchmark_codecs()
+    regressions = compare(current, baseline, TIME_TOLERANCE, MEMORY_TOLERANCE)
+    # A case is only a regression, if it is reproduced when measured again
+    for _ in range(RETRIES):
+        if not regressions:
+            break
+        again = benchmark_codecs(names={name for name, _ in regressions})
+        for name, result in again["results"].items():
+            current["results"][name] = {
+                "relative_time": min(
+                    result["relative_time"], current["results"][name]["relative_time"]
+                ),
+                "peak_bytes": min(
+                    result["peak_bytes"], current["results"][name]["peak_bytes"]
+                ),
+            }
+        regressions = compare(current, baseline, TIME_TOLERANCE, MEMORY_TOLERANCE)
+    assert not regressions, "\n".join(
+        f"{name}: {description}" for name, description in regressions
+    )
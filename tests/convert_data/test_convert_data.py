@@ -1,12 +1,19 @@
 """
 This module tests the conversion of the data
 """
+import json
 from os.path import dirname, join
 
 import numpy as np
 import pandas as pd
 
 from ml_wrapper.messaging.json_handling import (
+    RawJson,
+    decode_data_frame,
+    dumps_with_raw_json,
+    encode_data_frame,
+    materialize_raw_json,
+    raw_json_stand_in,
     resolve_data_frame,
     retrieve_dataframe,
     retrieve_sensor_update_data,
@@ -116,3 +123,89 @@ def test_sensor_with_metadata(json_data_example_2):
     assert "unit" in column_meta[columns[0]["name"]]
     assert "description" in column_meta[columns[0]["name"]]
     assert "future" in column_meta[columns[0]["name"]]
+
+
+def test_encode_data_frame(data):
+    data["text"] = ['a"b', "c", "d\\e", "ü", "f"]
+    data["flag"] = [True, False, True, False, True]
+    columns, encoded = encode_data_frame(data)
+    assert columns == [
+        {"name": "time", "type": "rfctime"},
+        {"name": "value", "type": "number"},
+        {"name": "float_value", "type": "number"},
+        {"name": "text", "type": "string"},
+        {"name": "flag", "type": "string"},
+    ]
+    assert encoded.stand_in == [[], [], [], [], []]
+    assert encoded.loads() == [
+        [
+            "2020-01-20T10:10:00Z",
+            "2020-01-20T10:10:02Z",
+            "2020-01-20T10:10:04Z",
+            "2020-01-20T10:10:05Z",
+            "2020-01-20T10:10:06Z",
+        ],
+        ["1", "2", "3", "4", "5"],
+        ["0.0", "0.1", "0.2", "0.3", "0.4"],
+        ['a"b', "c", "d\\e", "ü", "f"],
+        ["True", "False", "True", "False", "True"],
+    ]
+
+
+def test_encode_data_frame_round_trip():
+    dataframe = pd.DataFrame(
+        {
+            "time": pd.to_datetime(
+                ["2020-01-20T10:10:00.5", None, "2020-01-20T10:10:00.000001"]
+            ),
+            "aware": pd.to_datetime(["2020-01-20T11:10:00+01:00"] * 3),
+            "value": [1 / 3, np.nan, 1e20],
+        }
+    )
+    columns, encoded = encode_data_frame(dataframe)
+    assert encoded.loads()[0] == [
+        "2020-01-20T10:10:00.500000Z",
+        "NaT",
+        "2020-01-20T10:10:00.000001Z",
+    ]
+    assert encoded.loads()[1] == ["2020-01-20T10:10:00Z"] * 3
+    retrieved, _, _ = retrieve_dataframe({"columns": columns, "data": encoded.loads()})
+    pd.testing.assert_frame_equal(
+        retrieved,
+        dataframe.assign(
+            aware=dataframe["aware"].dt.tz_convert("UTC").dt.tz_localize(None)
+        ),
+    )
+
+
+def test_dumps_with_raw_json():
+    body = {"results": [{"data": RawJson('[["1"]]', [[]])}], "text": "\x00"}
+    assert raw_json_stand_in(body) == {"results": [{"data": [[]]}], "text": "\x00"}
+    assert isinstance(body["results"][0]["data"], RawJson)
+    assert json.loads(dumps_with_raw_json(body)) == {
+        "results": [{"data": [["1"]]}],
+        "text": "\x00",
+    }
+    assert materialize_raw_json(body) is body
+    assert body["results"][0]["data"] == [["1"]]
+
+
+def test_decode_data_frame(data):
+    columns, encoded = encode_data_frame(data)
+    rows = list(map(list, zip(*encoded.loads())))
+    expected = pd.DataFrame(rows, columns=[column["name"] for column in columns])
+    expected = expected.astype({"value": "float64", "float_value": "float64"})
+    # The times are decoded in UTC without time zone
+    expected["time"] = pd.to_datetime(expected["time"], utc=True).dt.tz_localize(None)
+    pd.testing.assert_frame_equal(decode_data_frame(columns, encoded.loads()), expected)
+    decoded = decode_data_frame(
+        [
+            {"name": "time", "type": "rfctime"},
+            {"name": "text", "type": "string"},
+            {"name": "text", "type": "number"},
+        ],
+        [["2020-10-01T10:29:55.986+01:00", "NaT"], ["a", "b"], ["1", "nan", "3"]],
+    )
+    assert decoded.dtypes.tolist() == ["datetime64[ns]", "object", "float64"]
+    assert decoded.iloc[0, 0] == pd.Timestamp("2020-10-01T09:29:55.986")
+    assert decoded.shape == (2, 3)
@@ -0,0 +1,106 @@
+"""
+Tests the incremental aggregators of the ML Wrapper
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from ml_wrapper import (
+    AggregatorStore,
+    RunningMax,
+    RunningMean,
+    RunningMin,
+    RunningStd,
+    RunningVariance,
+    SlidingDFT,
+)
+from tests.conftest import WindowToolMock
+
+BATCH_SIZES = [1, 5, 3, 17, 2, 40, 0, 9, 64, 1, 1, 30]
+
+
+def _batches(seed: int = 0, nan_every: int = 0):
+    rng = np.random.default_rng(seed)
+    for size in BATCH_SIZES:
+        values = rng.normal(size=size) * 10 + 3
+        if nan_every:
+            values[rng.integers(nan_every, size=size) == 0] = np.nan
+        yield pd.DataFrame({"value": values})
+
+
+@pytest.mark.parametrize("nan_every", [0, 4])
+@pytest.mark.parametrize("window", [0, 1, 16])
+@pytest.mark.parametrize(
+    "aggregator_type, expected",
+    [
+        (RunningMean, lambda values: values.mean()),
+        (RunningVariance, lambda values: values.var()),
+        (RunningStd, lambda values: values.std()),
+        (RunningMin, lambda values: values.min()),
+        (RunningMax, lambda values: values.max()),
+    ],
+)
+def test_aggregators_match_pandas(aggregator_type, expected, window, nan_every):
+    aggregator = aggregator_type("value", window=window)
+    history = []
+    for batch in _batches(nan_every=nan_every):
+        aggregator.update(batch)
+        history.append(batch["value"])
+        values = pd.concat(history, ignore_index=True)
+        values = values.iloc[-window:] if window else values
+        np.testing.assert_allclose(aggregator.value, expected(values), equal_nan=True)
+
+
+def test_extremes_ignore_nan():
+    minimum, maximum = RunningMin("value", window=3), RunningMax("value", window=3)
+    for values in [[np.nan, 2.0], [1.0, np.nan], [np.nan]]:
+        minimum.update(pd.DataFrame({"value": values}))
+        maximum.update(pd.DataFrame({"value": values}))
+    assert minimum.value == maximum.value == 1.0
+    minimum.update(pd.DataFrame({"value": [np.nan] * 3}))
+    assert np.isnan(minimum.value)
+
+
+@pytest.mark.parametrize("aggregator_type", [RunningMin, RunningMax])
+def test_extremes_with_infinite_values(aggregator_type):
+    aggregator = aggregator_type("value", window=3)
+    history = []
+    for values in [[1.0], [np.inf], [-np.inf, np.nan], [2.0, np.inf], [np.inf] * 3]:
+        batch = pd.Series(values, dtype=float)
+        aggregator.update(pd.DataFrame({"value": batch}))
+        history.append(batch)
+        window = pd.concat(history, ignore_index=True).iloc[-3:]
+        expected = window.min() if aggregator_type is RunningMin else window.max()
+        assert aggregator.value == expected
+
+
+@pytest.mark.parametrize("bins", [None, [1, 3]])
+def test_sliding_dft_matches_fft(bins):
+    dft = SlidingDFT("value", window=32, bins=bins)
+    history = np.zeros(32)
+    for batch in _batches():
+        dft.update(batch)
+        history = np.concatenate([history, batch["value"].to_numpy()])
+        expected = np.fft.rfft(history[-32:])
+        np.testing.assert_allclose(
+            dft.value, expected if bins is None else expected[bins], atol=1e-8
+        )
+
+
+def test_aggregator_store_keeps_state_per_key():
+    store = AggregatorStore({"mean": RunningMean("value", window=2)})
+    store.update("a", pd.DataFrame({"value": [1.0, 2.0, 3.0]}))
+    assert store.update("b", pd.DataFrame({"value": [10.0]})) == {"mean": 10.0}
+    assert store.update("a", pd.DataFrame({"value": [5.0]})) == {"mean": 4.0}
+    assert len(store) == 2
+    with pytest.raises(AssertionError):
+        AggregatorStore({"mean": np.mean})
+
+
+def test_wrapper_provides_the_features(tool_patch, json_ml_data_example):
+    with WindowToolMock(outgoing_message_is_temporary=True) as tool:
+        for _ in range(2):
+            tool.client.mock_a_message(tool.client, json_ml_data_example)
+        assert tool.window_lengths == [None, None]
+        assert tool.features == [{"mean": 15.0, "max": 15.0}] * 2
+        assert len(tool.aggregator_store) == 1
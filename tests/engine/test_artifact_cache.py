@@ -0,0 +1,64 @@
+"""
+Tests the memory mapped artifact cache
+"""
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytest
+
+from ml_wrapper import ArtifactCache
+
+
+def _sum_in_worker(cache: ArtifactCache) -> tuple:
+    weights = cache.get("weights")
+    return isinstance(weights, np.memmap), float(weights.sum())
+
+
+def test_artifact_cache_builds_once(tmp_path):
+    cache = ArtifactCache(str(tmp_path / "artifacts"))
+    calls = []
+
+    def build():
+        calls.append(1)
+        return np.arange(10, dtype=np.float32)
+
+    weights = cache.get("weights", build=build)
+    assert isinstance(weights, np.memmap)
+    assert not weights.flags.writeable
+    np.testing.assert_array_equal(weights, np.arange(10, dtype=np.float32))
+    assert cache.get("weights", build=build) is weights
+    assert ArtifactCache(cache.directory).get("weights") is weights
+    assert len(calls) == 1
+    assert "weights" in cache
+    assert sorted(path.name for path in (tmp_path / "artifacts").iterdir()) == [
+        "weights.npy"
+    ]
+
+
+def test_artifact_cache_replace_and_clear(tmp_path):
+    cache = ArtifactCache(str(tmp_path))
+    cache.put("table", np.ones((2, 3)))
+    replaced = cache.put("table", np.zeros((2, 3)))
+    np.testing.assert_array_equal(cache.get("table"), np.zeros((2, 3)))
+    assert cache.get("table") is replaced
+    cache.clear()
+    assert "table" not in cache
+    with pytest.raises(KeyError):
+        cache.get("table")
+
+
+def test_artifact_cache_rejects_invalid_artifacts(tmp_path):
+    cache = ArtifactCache(str(tmp_path))
+    with pytest.raises(AssertionError):
+        cache.put("../weights", np.ones(2))
+    with pytest.raises(AssertionError):
+        cache.put("objects", np.array([{}, []], dtype=object))
+
+
+def test_artifact_cache_in_worker_process(tmp_path):
+    cache = ArtifactCache(str(tmp_path))
+    cache.put("weights", np.arange(5, dtype=np.float64))
+    assert pickle.loads(pickle.dumps(cache)).directory == cache.directory
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        assert executor.submit(_sum_in_worker, cache).result() == (True, 10.0)
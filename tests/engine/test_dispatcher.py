@@ -0,0 +1,293 @@
+"""
+Tests the dispatch engine of the ML Wrapper
+"""
+import asyncio
+import logging
+import threading
+import time
+
+import pytest
+
+from ml_wrapper import ConfigNotValid, MessageDispatcher, NotInitialized
+from tests.conftest import FftMock, SimpleMock
+
+
+def _dispatcher(handler, **kwargs):
+    return MessageDispatcher(
+        handler=handler, logger=logging.getLogger("TEST"), **kwargs
+    )
+
+
+def test_dispatcher_runs_concurrently():
+    async def handler(item):
+        await asyncio.sleep(0.5)
+        return item * 2
+
+    dispatcher = _dispatcher(handler, max_concurrent_runs=4)
+    dispatcher.start()
+    start = time.monotonic()
+    futures = [dispatcher.submit(item) for item in range(4)]
+    assert [future.result(timeout=5) for future in futures] == [0, 2, 4, 6]
+    assert time.monotonic() - start < 1.5
+    dispatcher.stop()
+    assert not dispatcher.is_running
+
+
+def test_dispatcher_keeps_order_with_one_run():
+    finished = []
+
+    async def handler(item):
+        await asyncio.sleep(0.01 * (5 - item))
+        finished.append(item)
+
+    dispatcher = _dispatcher(handler, max_concurrent_runs=1)
+    dispatcher.start()
+    for item in range(5):
+        dispatcher.submit(item)
+    dispatcher.stop(drain=True)
+    assert finished == list(range(5))
+
+
+def test_dispatcher_passes_exceptions():
+    async def handler(item):
+        raise ValueError(item)
+
+    dispatcher = _dispatcher(handler)
+    dispatcher.start()
+    with pytest.raises(ValueError):
+        dispatcher.submit(1).result(timeout=5)
+    # The worker survives the exception
+    with pytest.raises(ValueError):
+        dispatcher.submit(2).result(timeout=5)
+    dispatcher.stop()
+
+
+def test_dispatcher_not_started():
+    async def handler(item):
+        return item
+
+    with pytest.raises(NotInitialized):
+        _dispatcher(handler).submit(1)
+
+
+def test_wrapper_runs_messages_concurrently(
+    tool_patch, monkeypatch, mqtt_time_series, mqtt_sensor
+):
+    monkeypatch.setenv("CONFIG_WRAPPER_MAX_CONCURRENT_RUNS", "2")
+    with SimpleMock(outgoing_message_is_temporary=True) as tool:
+        assert tool.dispatcher.max_concurrent_runs == 2
+        start = time.monotonic()
+        futures = [
+            tool._react_to_message(None, None, message)
+            for message in [mqtt_time_series, mqtt_sensor]
+        ]
+        for future in futures:
+            future.result(timeout=10)
+        # SimpleTool sleeps 2 seconds per run
+        assert time.monotonic() - start < 3.5
+        assert len(tool.out_messages) == 2
+
+
+def test_wrapper_runs_inline_without_dispatcher(
+    tool_patch, monkeypatch, json_ml_analyse_time_series
+):
+    monkeypatch.setenv("CONFIG_WRAPPER_MAX_CONCURRENT_RUNS", "0")
+    with FftMock(outgoing_message_is_temporary=True) as tool:
+        assert tool.dispatcher is None
+        tool.client.mock_a_message(tool.client, json_ml_analyse_time_series)
+        assert len(tool.out_messages) == 1
+
+
+def test_dispatcher_batches_by_key():
+    batches = []
+
+    async def batch_handler(items):
+        batches.append(items)
+        return [item * 2 for item in items]
+
+    dispatcher = _dispatcher(
+        None,
+        batch_handler=batch_handler,
+        batch_size=3,
+        batch_delay=0.5,
+        batch_key=lambda item: item % 2,
+    )
+    dispatcher.start()
+    futures = [dispatcher.submit(item) for item in range(7)]
+    assert [future.result(timeout=5) for future in futures] == list(range(0, 14, 2))
+    dispatcher.stop()
+    assert sorted(map(len, batches)) == [1, 1, 1, 2, 2]
+    assert all(len({item % 2 for item in batch}) == 1 for batch in batches)
+
+
+def test_dispatcher_batch_handler_errors():
+    async def batch_handler(items):
+        return items[:-1]
+
+    dispatcher = _dispatcher(None, batch_handler=batch_handler, batch_size=2)
+    dispatcher.start()
+    future = dispatcher.submit(1)
+    with pytest.raises(ValueError):
+        future.result(timeout=5)
+    dispatcher.stop()
+
+
+def test_dispatcher_batch_key_errors():
+    async def batch_handler(items):
+        return items
+
+    dispatcher = _dispatcher(
+        None, batch_handler=batch_handler, batch_size=2, batch_key=hash
+    )
+    dispatcher.start()
+    failing, passing = dispatcher.submit({}), dispatcher.submit(1)
+    with pytest.raises(TypeError):
+        failing.result(timeout=5)
+    assert passing.result(timeout=5) == 1
+    dispatcher.stop(timeout=5)
+
+
+@pytest.mark.parametrize(
+    "policy, expected",
+    [
+        ("drop_oldest", [0, 3, 5]),
+        ("drop_newest", [0, 1, 2]),
+        ("latest", [0, 5, 2]),
+    ],
+)
+def test_dispatcher_overflow_policies(policy, expected):
+    started, release = threading.Event(), threading.Event()
+    processed = []
+
+    async def handler(item):
+        started.set()
+        while not release.is_set():
+            await asyncio.sleep(0.01)
+        processed.append(item)
+        return item
+
+    dispatcher = _dispatcher(
+        handler,
+        queue_size=2,
+        overflow_policy=policy,
+        overflow_key=lambda item: item % 2,
+    )
+    dispatcher.start()
+    futures = [dispatcher.submit(0)]
+    assert started.wait(timeout=5)
+    futures += [dispatcher.submit(item) for item in [1, 2, 3, 5]]
+    release.set()
+    dispatcher.stop(timeout=5)
+    assert processed == expected
+    assert dispatcher.dropped == 2
+    results = [future.result() for future in futures if not future.cancelled()]
+    assert sorted(results) == sorted(expected)
+
+
+def test_dispatcher_coalesces_waiting_items():
+    started, release = threading.Event(), threading.Event()
+    processed = []
+
+    async def handler(item):
+        started.set()
+        while not release.is_set():
+            await asyncio.sleep(0.01)
+        processed.append(item)
+
+    dispatcher = _dispatcher(handler, coalesce_key=lambda item: item[0])
+    dispatcher.start()
+    first = dispatcher.submit(("a", 0))
+    assert started.wait(timeout=5)
+    futures = [
+        dispatcher.submit(item)
+        for item in [("a", 1), ("b", 1), ("a", 2), ("b", 2), (None, 1), (None, 2)]
+    ]
+    # A new item for a running key waits instead of replacing the run
+    assert not first.cancelled()
+    release.set()
+    dispatcher.stop(timeout=5)
+    assert processed == [("a", 0), ("a", 2), ("b", 2), (None, 1), (None, 2)]
+    assert [future.cancelled() for future in futures] == [True, True] + [False] * 4
+    assert dispatcher.coalesced == 2
+
+
+def test_dispatcher_ingests_every_item_in_order():
+    started, release = threading.Event(), threading.Event()
+    ingested, processed = [], []
+
+    def ingest(item):
+        if item == "fails":
+            raise ValueError(item)
+        ingested.append((item, threading.current_thread().name))
+
+    async def handler(item):
+        started.set()
+        while not release.is_set():
+            await asyncio.sleep(0.01)
+        # The handler runs after the item is ingested
+        assert item in [ingested_item for ingested_item, _ in ingested]
+        processed.append(item)
+
+    dispatcher = _dispatcher(handler, coalesce_key=lambda item: item[0], ingest=ingest)
+    dispatcher.start()
+    dispatcher.submit("a0")
+    assert started.wait(timeout=5)
+    futures = [dispatcher.submit(item) for item in ["a1", "a2", "fails", "b1"]]
+    release.set()
+    dispatcher.stop(timeout=5)
+    # Coalesced items are ingested as well
+    assert [item for item, _ in ingested] == ["a0", "a1", "a2", "b1"]
+    assert {name for _, name in ingested} != {threading.current_thread().name}
+    assert processed == ["a0", "a2", "b1"]
+    assert futures[0].cancelled()
+    with pytest.raises(ValueError):
+        futures[2].result(timeout=5)
+
+
+def test_dispatcher_batches_ingested_items():
+    batches = []
+
+    async def batch_handler(items):
+        batches.append(items)
+        return items
+
+    dispatcher = _dispatcher(
+        batch_handler,
+        batch_handler=batch_handler,
+        batch_size=3,
+        batch_delay=0.5,
+        ingest=lambda item: item.index("a"),
+    )
+    dispatcher.start()
+    futures = [dispatcher.submit(item) for item in ["a", "b", "ab"]]
+    dispatcher.stop(timeout=5)
+    assert batches == [["a", "ab"]]
+    with pytest.raises(ValueError):
+        futures[1].result(timeout=5)
+
+
+def test_wrapper_coalesces_sensor_updates(
+    tool_patch, monkeypatch, mqtt_time_series, mqtt_sensor
+):
+    monkeypatch.setenv("CONFIG_WRAPPER_COALESCE_SENSOR_UPDATES", "True")
+    with SimpleMock(outgoing_message_is_temporary=True) as tool:
+        futures = [
+            tool._react_to_message(None, None, message)
+            for message in [mqtt_sensor, mqtt_sensor, mqtt_time_series, mqtt_sensor]
+        ]
+        assert [future.cancelled() for future in futures] == [
+            False,
+            True,
+            False,
+            False,
+        ]
+        for future in [futures[0], futures[2], futures[3]]:
+            future.result(timeout=10)
+        assert tool.dispatcher.coalesced == 1
+        assert len(tool.out_messages) == 3
+
+
+def test_wrapper_rejects_unknown_overflow_policy(tool_patch, monkeypatch):
+    monkeypatch.setenv("CONFIG_WRAPPER_INGEST_OVERFLOW_POLICY", "drop_all")
+    with pytest.raises(ConfigNotValid):
+        SimpleMock()
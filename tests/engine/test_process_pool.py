@@ -0,0 +1,62 @@
+"""
+Tests the process pool execution mode
+"""
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from ml_wrapper import SharedFrame
+from ml_wrapper.engine import ProcessPoolRunner
+
+
+def test_shared_frame_round_trip():
+    dataframe = pd.DataFrame(
+        {
+            "float": np.linspace(0, 1, 5),
+            "int": np.arange(5),
+            "time": pd.date_range("2020-01-20", periods=5, freq="s"),
+            "text": list("abcde"),
+            "flag": [True, False, True, False, True],
+        },
+        index=list("vwxyz"),
+    )
+    shared = SharedFrame(dataframe)
+    try:
+        assert shared.block_name is not None
+        assert list(shared.pickled.keys()) == [3]
+        pd.testing.assert_frame_equal(shared.to_frame(), dataframe)
+    finally:
+        shared.release()
+
+
+def test_shared_frame_without_shareable_columns():
+    dataframe = pd.DataFrame({"text": ["a", "b"]})
+    shared = SharedFrame(dataframe)
+    assert shared.block_name is None
+    pd.testing.assert_frame_equal(shared.to_frame(), dataframe)
+    shared.release()
+
+
+def test_process_pool_tool(ML_MOCK_PROCESS_TOOL, json_ml_analyse_time_series):
+    with ML_MOCK_PROCESS_TOOL as tool:
+        assert tool.process_pool is not None
+        tool.client.mock_a_message(tool.client, json.dumps(json_ml_analyse_time_series))
+        assert len(tool.results) == 1
+        result = tool.results[0]
+        assert (result["pid"] != os.getpid()).all()
+        assert (result["machine"] == "mach").all()
+        body = tool.out_messages[0].body_as_json_dict
+        assert body["results"]["columns"][-1]["name"] == "machine"
+
+
+def test_process_pool_spawns_workers():
+    runner = ProcessPoolRunner(workers=1, logger=logging.getLogger(__name__))
+    runner.start()
+    try:
+        # pylint: disable=protected-access
+        assert runner._executor._mp_context.get_start_method() == "spawn"
+    finally:
+        runner.stop()
@@ -0,0 +1,192 @@
+"""
+Tests the publish pipeline
+"""
+import asyncio
+import json
+import logging
+import threading
+from unittest.mock import Mock
+
+import paho.mqtt.client as mqtt
+import pytest
+
+from ml_wrapper import PublishFailed, PublishPipeline
+from ml_wrapper.misc import ConfigNotValid
+from tests.conftest import SimpleMock
+
+
+class FakeClient:
+    """Client handing out mids, which are acknowledged by the test"""
+
+    def __init__(self, rc=mqtt.MQTT_ERR_SUCCESS):
+        self.rc = rc
+        self.published = []
+        self.mid = 0
+        self.on_publish = None
+        # Acknowledges the messages before returning their mid, like a client without a thread
+        self.early = False
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.mid += 1
+        self.published.append((topic, payload, qos, retain))
+        info = mqtt.MQTTMessageInfo(self.mid)
+        info.rc = self.rc
+        if self.early:
+            self.acknowledge(self.mid)
+        return info
+
+    def acknowledge(self, mid):
+        # The arguments of the callback API version 2
+        # pylint falsly thinks on_publish is not callable
+        # pylint: disable=not-callable
+        self.on_publish(self, None, mid, 0, None)
+
+
+def _pipeline(client, **kwargs):
+    pipeline = PublishPipeline(client, logging.getLogger(__file__), **kwargs)
+    client.on_publish = pipeline.on_publish
+    return pipeline
+
+
+def test_publish_resolves_on_acknowledgement():
+    client = FakeClient()
+    pipeline = _pipeline(client)
+    future = pipeline.submit("kosmos/analyses/a", "{}", qos=2, retain=True)
+    assert not future.done()
+    assert len(pipeline) == 1
+    client.acknowledge(1)
+    assert future.result(timeout=1) == 1
+    assert len(pipeline) == 0
+    assert client.published == [("kosmos/analyses/a", "{}", 2, True)]
+    # An acknowledgement can arrive before the client returned the mid
+    client.early = True
+    assert pipeline.submit("kosmos/analyses/a", "{}").result(timeout=1) == 2
+    assert pipeline.published == 2
+    assert not pipeline._acknowledged
+
+
+def test_publish_drops_unknown_acknowledgements():
+    client = FakeClient()
+    clock = [0.0]
+    pipeline = _pipeline(client, timeout=10, clock=lambda: clock[0])
+    expired = pipeline.submit("t", "1", qos=1)
+    # Acknowledgements of messages published directly with the client are not kept
+    client.acknowledge(99)
+    assert not pipeline._acknowledged
+    # Below max_pending, messages expire on the next submit
+    clock[0] = 11
+    pending = pipeline.submit("t", "2", qos=1)
+    with pytest.raises(PublishFailed):
+        expired.result(timeout=1)
+    # A late acknowledgement doesn't mark a later message with a reused mid as published
+    client.acknowledge(1)
+    client.mid = 0
+    reused = pipeline.submit("t", "3", qos=1)
+    assert not reused.done()
+    assert not pipeline._acknowledged
+    # Messages expire on acknowledgements of other messages as well
+    clock[0] = 22
+    client.acknowledge(99)
+    with pytest.raises(PublishFailed):
+        pending.result(timeout=1)
+    assert reused.exception(timeout=1) is not None
+    assert len(pipeline) == 0
+
+
+def test_publish_backpressure_and_timeout():
+    client = FakeClient()
+    pipeline = _pipeline(client, max_pending=2, timeout=0.2)
+    first = pipeline.submit("t", "1")
+    pipeline.submit("t", "2")
+    blocked = {}
+
+    def publish_third():
+        blocked["future"] = pipeline.submit("t", "3")
+
+    thread = threading.Thread(target=publish_third)
+    thread.start()
+    thread.join(0.05)
+    assert thread.is_alive()
+    client.acknowledge(1)
+    thread.join(1)
+    assert first.result() == 1
+    assert not blocked["future"].done()
+    assert [payload for _, payload, _, _ in client.published] == ["1", "2", "3"]
+    # Without acknowledgements, the messages expire and a slot becomes free again
+    fourth = pipeline.submit("t", "4")
+    assert not fourth.done()
+    with pytest.raises(PublishFailed):
+        blocked["future"].result(timeout=1)
+    assert pipeline.failed >= 1
+
+
+def test_publish_failures():
+    pipeline = _pipeline(FakeClient(rc=mqtt.MQTT_ERR_QUEUE_SIZE))
+    with pytest.raises(PublishFailed):
+        pipeline.submit("t", "{}", qos=1).result(timeout=1)
+    # Messages of QoS 1 and 2 are kept until the connection is back
+    client = FakeClient(rc=mqtt.MQTT_ERR_NO_CONN)
+    pipeline = _pipeline(client)
+    with pytest.raises(PublishFailed):
+        pipeline.submit("t", "{}", qos=0).result(timeout=1)
+    kept = pipeline.submit("t", "{}", qos=1)
+    assert not kept.done()
+    pipeline.close()
+    with pytest.raises(PublishFailed):
+        kept.result(timeout=1)
+    with pytest.raises(PublishFailed):
+        pipeline.submit("t", "{}").result(timeout=1)
+    failing = FakeClient()
+    failing.publish = Mock(side_effect=ValueError("Invalid topic"))
+    with pytest.raises(PublishFailed):
+        _pipeline(failing).submit("t/#", "{}").result(timeout=1)
+
+
+def test_async_publish_waits_without_blocking_the_loop():
+    client = FakeClient()
+    pipeline = _pipeline(client, max_pending=1)
+
+    async def main():
+        first = await pipeline.publish("t", "1")
+        second = asyncio.ensure_future(pipeline.publish("t", "2"))
+        await asyncio.sleep(0.05)
+        assert not second.done()
+        client.acknowledge(1)
+        delivery = await asyncio.wait_for(second, 1)
+        return first, delivery
+
+    first, second = asyncio.run(main())
+    assert first.result() == 1
+    client.acknowledge(2)
+    assert second.result(timeout=1) == 2
+
+
+def test_wrapper_publishes_with_topic_options(
+    tool_patch, monkeypatch, json_ml_data_example
+):
+    monkeypatch.setenv("CONFIG_MESSAGING_RESULT_QOS", "1")
+    monkeypatch.setenv(
+        "CONFIG_MESSAGING_RESULT_TOPIC_QOS",
+        "kosmos/analyses/+/temporary=0, kosmos/analyses/#=2",
+    )
+    monkeypatch.setenv("CONFIG_MESSAGING_RESULT_RETAIN_TOPICS", "kosmos/analyses/#")
+    with SimpleMock(outgoing_message_is_temporary=True) as tool:
+        assert tool._publish_options("kosmos/analyses/contract/temporary") == (0, True)
+        assert tool._publish_options("kosmos/analyses/contract") == (2, True)
+        assert tool._publish_options("kosmos/status") == (1, False)
+        tool.client.mock_a_message(tool.client, json.dumps(json_ml_data_example))
+        assert tool.out_messages[0].delivery.result(timeout=1) is None
+        assert tool.publisher.published == 2
+
+
+@pytest.mark.parametrize(
+    "variable, value",
+    [
+        ("CONFIG_MESSAGING_RESULT_QOS", "3"),
+        ("CONFIG_MESSAGING_RESULT_TOPIC_QOS", "kosmos/analyses/#"),
+    ],
+)
+def test_wrapper_rejects_invalid_qos(tool_patch, monkeypatch, variable, value):
+    monkeypatch.setenv(variable, value)
+    with pytest.raises(ConfigNotValid):
+        SimpleMock()
@@ -0,0 +1,89 @@
+"""
+Tests the result cache of the ML Wrapper
+"""
+import json
+
+import pytest
+
+from ml_wrapper import ResultCache
+from tests.conftest import FftMock, WindowToolMock
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_result_cache_key():
+    body = {"b": [1, 2], "a": {"d": "x", "c": "y"}}
+    reordered = {"a": {"c": "y", "d": "x"}, "b": [1, 2]}
+    assert ResultCache.key(body, "url", "tag") == ResultCache.key(
+        reordered, "url", "tag"
+    )
+    assert ResultCache.key(body, "url", "tag") != ResultCache.key(body, "url", "other")
+    assert ResultCache.key(body) != ResultCache.key({**body, "b": [2, 1]})
+
+
+def test_result_cache_evicts_least_recently_used():
+    cache = ResultCache(max_entries=2)
+    cache.put("a", {"a": 1}, 10)
+    cache.put("b", {"b": 1}, 10)
+    assert cache.get("a") == {"a": 1}
+    cache.put("c", {"c": 1}, 10)
+    assert cache.get("b") is None
+    assert cache.get("a") == {"a": 1}
+    assert len(cache) == 2 and cache.nbytes == 20
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_result_cache_limits_bytes_and_age():
+    clock = _Clock()
+    cache = ResultCache(max_entries=10, ttl=5, max_bytes=100, clock=clock)
+    cache.put("large", {}, 101)
+    assert len(cache) == 0
+    for key in "abc":
+        cache.put(key, {key: 1}, 40)
+    assert cache.get("a") is None
+    assert cache.nbytes == 80
+    clock.now = 6
+    assert cache.get("b") is None
+    assert cache.nbytes == 40
+    with pytest.raises(AssertionError):
+        ResultCache(max_entries=0)
+
+
+@pytest.mark.parametrize("use_cache", [True, False])
+def test_wrapper_reuses_cached_results(
+    tool_patch, monkeypatch, json_ml_analyse_time_series, use_cache
+):
+    monkeypatch.setenv("CONFIG_WRAPPER_RESULT_CACHE_SIZE", "4")
+    with FftMock(outgoing_message_is_temporary=True) as tool:
+        monkeypatch.setattr(tool, "use_result_cache", lambda in_message: use_cache)
+        published = []
+        for _ in range(2):
+            tool.client.mock_a_message(tool.client, json_ml_analyse_time_series)
+            published.append(json.loads(tool.client.last_published)["body"])
+            # Changing the published message must not change the cached result
+            tool.out_messages[0].raw_body["results"]["columns"][0]["name"] = "changed"
+        assert len(tool.out_messages) == (1 if use_cache else 2)
+        assert tool.result_cache.hits == (1 if use_cache else 0)
+        assert published[0]["results"] == published[1]["results"]
+        assert published[0]["timestamp"] != published[1]["timestamp"]
+
+
+def test_wrapper_keys_windowed_messages_by_data(
+    tool_patch, monkeypatch, json_ml_data_example
+):
+    monkeypatch.setenv("CONFIG_WRAPPER_WINDOW_ROWS", "10")
+    monkeypatch.setenv("CONFIG_WRAPPER_RESULT_CACHE_SIZE", "4")
+    with WindowToolMock(outgoing_message_is_temporary=True) as tool:
+        monkeypatch.setattr(tool, "use_result_cache", lambda in_message: True)
+        # The window decodes the data on receipt, which must not change the key
+        for value in ["15", "16", "15"]:
+            json_ml_data_example["body"]["payload"]["body"]["data"][0] = [value]
+            tool.client.mock_a_message(tool.client, json.dumps(json_ml_data_example))
+        assert len(tool.window_lengths) == 2
+        assert tool.result_cache.hits == 1
@@ -0,0 +1,122 @@
+"""
+Tests the sliding window store of the ML Wrapper
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ml_wrapper import SensorWindow, WindowStore
+from tests.conftest import WindowToolMock
+
+
+def _frame(start: int, rows: int) -> pd.DataFrame:
+    index = np.arange(start, start + rows)
+    return pd.DataFrame(
+        {
+            "time": np.datetime64("2021-01-01T00:00:00", "ns")
+            + index * np.timedelta64(1, "s"),
+            "value": index.astype(float),
+            "name": index.astype(str).astype(object),
+        }
+    )
+
+
+def test_window_keeps_the_latest_rows():
+    window = SensorWindow(max_rows=50, capacity=8)
+    frames = []
+    start = 0
+    for rows in [3, 7, 1, 20, 30, 0, 49, 60, 13]:
+        frames.append(_frame(start, rows))
+        start += rows
+        window.append(frames[-1])
+        expected = pd.concat(frames, ignore_index=True).iloc[-50:]
+        pd.testing.assert_frame_equal(
+            window.view(), expected.reset_index(drop=True), check_index_type=False
+        )
+    assert window.capacity == 50
+
+
+def test_window_view_shares_memory():
+    window = SensorWindow(max_rows=10, capacity=4)
+    for start in range(0, 30, 3):
+        window.append(_frame(start, 3))
+    view = window.view()
+    # pylint: disable=protected-access
+    for name in view.columns:
+        assert np.shares_memory(view[name].to_numpy(), window._buffers[name])
+
+
+def test_window_evicts_by_time():
+    window = SensorWindow(seconds=10, capacity=4)
+    window.append(_frame(0, 5))
+    window.append(_frame(5, 20))
+    assert window.view()["value"].tolist() == list(map(float, range(14, 25)))
+    window.append(_frame(100, 1))
+    assert len(window) == 1
+    with pytest.raises(AssertionError):
+        SensorWindow(seconds=1).append(pd.DataFrame({"value": [1.0]}))
+
+
+def test_window_starts_over_with_new_columns():
+    store = WindowStore(max_rows=10)
+    store.append(("machine", "sensor"), _frame(0, 4))
+    view = store.append(("machine", "sensor"), pd.DataFrame({"value": [1, 2]}))
+    assert view.columns.tolist() == ["value"]
+    assert view["value"].tolist() == [1, 2]
+    assert len(store) == 1
+
+
+def test_wrapper_provides_the_window(tool_patch, monkeypatch, json_ml_data_example):
+    monkeypatch.setenv("CONFIG_WRAPPER_WINDOW_ROWS", "1000")
+    with WindowToolMock(outgoing_message_is_temporary=True) as tool:
+        for _ in range(3):
+            tool.client.mock_a_message(tool.client, json_ml_data_example)
+        rows = tool.window_lengths[0]
+        assert tool.window_lengths == [rows, 2 * rows, 3 * rows]
+        assert len(tool.window_store) == 1
+
+
+def test_store_returns_copies():
+    store = WindowStore(max_rows=4)
+    first = store.append("sensor", _frame(0, 2))
+    store.append("sensor", _frame(2, 4))
+    assert first["value"].tolist() == [0.0, 1.0]
+    view = store.append("sensor", _frame(6, 1), copy=False)
+    assert view["value"].tolist() == [3.0, 4.0, 5.0, 6.0]
+
+
+def test_wrapper_windows_cached_messages(tool_patch, monkeypatch, json_ml_data_example):
+    monkeypatch.setenv("CONFIG_WRAPPER_WINDOW_ROWS", "1000")
+    monkeypatch.setenv("CONFIG_WRAPPER_RESULT_CACHE_SIZE", "4")
+    with WindowToolMock(outgoing_message_is_temporary=True) as tool:
+        monkeypatch.setattr(tool, "use_result_cache", lambda in_message: True)
+        for _ in range(3):
+            tool.client.mock_a_message(tool.client, json_ml_data_example)
+        # Only the first message runs, the others are answered from the result cache
+        rows = tool.window_lengths[0]
+        assert tool.window_lengths == [rows]
+        body = json_ml_data_example["body"]
+        window = tool.window_store.get((body["machine"], body["sensor"]))
+        assert len(window) == 3 * rows
+
+
+def test_wrapper_updates_windows_off_the_mqtt_thread(
+    tool_patch, monkeypatch, json_ml_data_example
+):
+    monkeypatch.setenv("CONFIG_WRAPPER_WINDOW_ROWS", "1000")
+    with WindowToolMock(outgoing_message_is_temporary=True) as tool:
+        update = tool._update_sensor_state
+        threads = []
+
+        def update_sensor_state(in_message):
+            threads.append(threading.current_thread())
+            update(in_message)
+
+        monkeypatch.setattr(tool, "_update_sensor_state", update_sensor_state)
+        for _ in range(2):
+            tool.client.mock_a_message(tool.client, json_ml_data_example)
+        assert len(threads) == 2
+        assert threading.current_thread() not in threads
+        assert tool.window_lengths[1] == 2 * tool.window_lengths[0]
@@ -0,0 +1,89 @@
+"""
+Tests the content encodings of the payloads
+"""
+import gzip
+import json
+from unittest.mock import Mock
+
+import pytest
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+from ml_wrapper import PayloadEncoder, available_encodings, decode_payload
+from ml_wrapper.misc import ConfigNotValid
+from tests.conftest import SimpleMock
+
+
+@pytest.mark.parametrize("encoding", available_encodings())
+def test_payload_round_trip(encoding, json_ml_data_example):
+    payload = json.dumps(json_ml_data_example)
+    encoder = PayloadEncoder(encoding, threshold=16)
+    encoded = encoder.encode(payload)
+    assert isinstance(encoded, str) == (encoding == "identity")
+    assert json.loads(decode_payload(encoded)) == json_ml_data_example
+    assert json.loads(decode_payload(encoded, encoder.properties(encoded))) == (
+        json_ml_data_example
+    )
+    # Small payloads are not compressed
+    assert encoder.encode("{}") == "{}"
+
+
+def test_payload_properties():
+    encoder = PayloadEncoder("gzip")
+    properties = encoder.properties(encoder.encode("{}"))
+    assert properties.ContentType == "application/json"
+    assert properties.UserProperty == [("content-encoding", "gzip")]
+    assert not hasattr(encoder.properties("{}"), "UserProperty")
+    unknown = Properties(PacketTypes.PUBLISH)
+    unknown.UserProperty = ("content-encoding", "br")
+    with pytest.raises(ValueError):
+        decode_payload(b"{}", unknown)
+
+
+def test_decode_payload_limits_the_size():
+    payload = b"[" + b"0," * 10**6 + b"0]"
+    members = gzip.compress(payload[:10]) + gzip.compress(payload[10:])
+    assert decode_payload(members, max_size=len(payload)) == payload
+    with pytest.raises(ValueError, match="decompresses to more than"):
+        decode_payload(gzip.compress(payload), max_size=len(payload) - 1)
+    with pytest.raises(ValueError):
+        decode_payload(gzip.compress(payload)[:-100])
+
+
+def test_wrapper_rejects_decompression_bombs(tool_patch, monkeypatch):
+    monkeypatch.setenv("CONFIG_MESSAGING_MAX_DECOMPRESSED_SIZE", "1000")
+    with SimpleMock(outgoing_message_is_temporary=True) as tool:
+        with pytest.raises(ValueError):
+            tool.client.mock_a_message(tool.client, gzip.compress(b" " * 10**6))
+        assert not tool.out_messages
+
+
+def test_wrapper_publishes_and_reads_compressed_payloads(
+    tool_patch, monkeypatch, json_ml_data_example
+):
+    monkeypatch.setenv("CONFIG_MQTT_PROTOCOL", "5")
+    monkeypatch.setenv("CONFIG_MESSAGING_RESULT_ENCODING", "gzip")
+    monkeypatch.setenv("CONFIG_MESSAGING_RESULT_ENCODING_THRESHOLD", "0")
+    with SimpleMock(outgoing_message_is_temporary=True) as tool:
+        tool.client.publish = Mock(wraps=tool.client.publish)
+        tool.client.mock_a_message(
+            tool.client, gzip.compress(json.dumps(json_ml_data_example).encode())
+        )
+        assert len(tool.out_messages) == 1
+        _, kwargs = tool.client.publish.call_args
+        result = json.loads(decode_payload(kwargs["payload"], kwargs["properties"]))
+        assert result == json.loads(tool.out_messages[0].payload)
+        assert ("content-encoding", "gzip") in kwargs["properties"].UserProperty
+
+
+@pytest.mark.parametrize(
+    "variable, value",
+    [
+        ("CONFIG_MQTT_PROTOCOL", "4"),
+        ("CONFIG_MESSAGING_RESULT_ENCODING", "br"),
+    ],
+)
+def test_wrapper_rejects_invalid_encoding(tool_patch, monkeypatch, variable, value):
+    monkeypatch.setenv(variable, value)
+    with pytest.raises(ConfigNotValid):
+        SimpleMock()
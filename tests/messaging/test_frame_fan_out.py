@@ -0,0 +1,118 @@
+"""
+This module tests the parallel decoding and encoding of the frames of multiple time series
+"""
+import logging
+import random
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ml_wrapper import IncomingMessage, OutgoingMessage, ResultType
+from ml_wrapper.messaging.json_handling import (
+    FRAME_FAN_OUT,
+    FrameFanOut,
+    decode_data_frame,
+    decode_data_frames,
+    encode_data_frames,
+)
+from ml_wrapper.misc import ConfigNotValid
+from tests.conftest import SimpleMock
+
+
+def _frames(count: int) -> list:
+    return [
+        pd.DataFrame(
+            {
+                "time": pd.date_range("2021-01-01", periods=10 + index, freq="s"),
+                "value": np.random.rand(10 + index),
+                "label": [f"series {index}"] * (10 + index),
+            }
+        )
+        for index in range(count)
+    ]
+
+
+def _slow_square(value: int) -> int:
+    time.sleep(random.random() / 100)
+    return value**2
+
+
+@pytest.fixture
+def fan_out():
+    FRAME_FAN_OUT.configure(threshold=1, workers=3)
+    yield FRAME_FAN_OUT
+    FRAME_FAN_OUT.configure(threshold=0)
+    FRAME_FAN_OUT.shutdown()
+
+
+def test_fan_out_keeps_the_order():
+    fan_out = FrameFanOut(threshold=10, workers=4)
+    try:
+        items = list(range(40))
+        assert fan_out.map(_slow_square, items, cells=40) == [x**2 for x in items]
+        assert fan_out._executor is not None
+    finally:
+        fan_out.shutdown()
+
+
+def test_fan_out_below_threshold_runs_serially():
+    fan_out = FrameFanOut(threshold=100, workers=4)
+    assert fan_out.map(_slow_square, [1, 2, 3], cells=99) == [1, 4, 9]
+    assert fan_out._executor is None
+    disabled = FrameFanOut()
+    assert not disabled.is_enabled
+    assert disabled.map(_slow_square, [1, 2], cells=10**9) == [1, 4]
+    assert disabled._executor is None
+    with pytest.raises(AssertionError):
+        FrameFanOut(threshold=1, backend="gpu")
+
+
+@pytest.mark.parametrize("backend", ["thread", "process"])
+def test_fan_out_codec_equals_serial(fan_out, backend):
+    fan_out.configure(threshold=1, workers=2, backend=backend)
+    frames = _frames(6)
+    encoded = encode_data_frames(frames)
+    sections = [(columns, data.loads()) for columns, data in encoded]
+    decoded = decode_data_frames(sections)
+    assert fan_out._executor is not None
+    if backend == "process":
+        assert fan_out._executor._mp_context.get_start_method() == "spawn"
+    for section, frame in zip(sections, decoded):
+        pd.testing.assert_frame_equal(frame, decode_data_frame(*section))
+    assert [frame["label"][0] for frame in decoded] == [
+        f"series {index}" for index in range(6)
+    ]
+
+
+def test_multiple_time_series_message_fans_out(fan_out, mqtt_multiple_time_series):
+    serial = IncomingMessage(logger=logging.getLogger(__file__))
+    fan_out.configure(threshold=0)
+    serial.mqtt_message = mqtt_multiple_time_series
+    expected = serial.retrieved_data
+    fan_out.configure(threshold=1, workers=3)
+    in_message = IncomingMessage(logger=logging.getLogger(__file__))
+    in_message.mqtt_message = mqtt_multiple_time_series
+    assert len(in_message.retrieved_data) == len(expected)
+    for frame, expected_frame in zip(in_message.retrieved_data, expected):
+        pd.testing.assert_frame_equal(frame, expected_frame)
+    out_message = OutgoingMessage(
+        in_message,
+        from_="test",
+        model_url="url",
+        model_tag="tag",
+        is_temporary=True,
+        temporary_keyword="temporary",
+    )
+    out_message.set_results(
+        in_message.retrieved_data, result_type=ResultType.MULTIPLE_TIME_SERIES
+    )
+    results = out_message.body_as_json_dict["results"]
+    assert [result["columns"] for result in results] == in_message.columns
+
+
+def test_wrapper_rejects_unknown_codec_backend(tool_patch, monkeypatch):
+    monkeypatch.setenv("CONFIG_MESSAGING_PARALLEL_CODEC_BACKEND", "gpu")
+    with pytest.raises(ConfigNotValid):
+        SimpleMock()
@@ -1,11 +1,15 @@
 """
 Unittests for the Messaging/Information class
 """
+import json
+from unittest import mock
+
 import pytest
 import pandas as pd
 
 
 from ml_wrapper import ResultType
+from ml_wrapper.misc import JSON_CODEC
 
 from ml_wrapper.misc.exceptions import (
     NotInitialized,
@@ -66,6 +70,35 @@ def test_retrieve(
             assert "future" in new_incoming_message.column_meta[col["name"]]
 
 
+@pytest.mark.parametrize("message", ["sensor", "time_series", "multiple_time_series"])
+def test_retrieve_is_lazy(new_incoming_message, mqtt_fixtures, message):
+    new_incoming_message.mqtt_message = mqtt_fixtures[message]
+    body = new_incoming_message.payload["body"]
+    sections = body.get("results", body)
+    sections = sections if isinstance(sections, list) else [sections]
+    raw_columns = [section["data"] for section in sections]
+    assert new_incoming_message._retrieved_data is None
+    rows = [list(map(list, zip(*columns))) for columns in raw_columns]
+    rows = rows if message == "multiple_time_series" else rows[0]
+    assert new_incoming_message.data == rows
+    frames = new_incoming_message.retrieved_data
+    assert new_incoming_message.retrieved_data is frames
+    assert [section["data"] for section in sections] == raw_columns
+    assert new_incoming_message.data == rows
+
+
+@pytest.mark.parametrize("message", ["sensor", "time_series"])
+def test_data_after_retrieved_data(new_incoming_message, mqtt_fixtures, message):
+    new_incoming_message.mqtt_message = mqtt_fixtures[message]
+    body = new_incoming_message.payload["body"]
+    section = body.get("results", body)
+    rows = [list(row) for row in zip(*section["data"])]
+    frame = new_incoming_message.retrieved_data
+    # The tool may change the frame, which must not show up as data of the message
+    frame["added"] = 1.0
+    assert new_incoming_message.data == rows
+
+
 def test_set_topic(new_incoming_message):
     with pytest.raises(InvalidTopic):
         new_incoming_message.topic = "/kosmos/analytics/abce.def-ghi.jkl.omn"
@@ -122,3 +155,31 @@ def test_set_results(
         out.set_results(
             [pd.DataFrame(), pd.DataFrame()], ResultType.MULTIPLE_TIME_SERIES
         )
+
+
+def test_outgoing_payload_is_serialised_once(
+    new_incoming_message, new_outgoing_message_by_incoming_message, mqtt_time_series
+):
+    new_incoming_message.mqtt_message = mqtt_time_series
+    out = new_outgoing_message_by_incoming_message(new_incoming_message)
+    with mock.patch.object(JSON_CODEC, "dumps", wraps=JSON_CODEC.dumps) as dumps:
+        out.set_results(pd.DataFrame({"test": [1, 2, 3]}), ResultType.TIME_SERIES)
+        assert dumps.call_count == 0
+        payload = out.payload
+        assert out.payload is payload
+        assert dumps.call_count == 1
+    assert json.loads(payload) == out.payload_as_json_dict
+    assert json.loads(payload)["body"] == out.body_as_json_dict
+    body = out.body_as_json_dict
+    body["results"]["data"] = [["4", "5", "6"]]
+    # The dictionary is a copy, which only changes the message once it is set
+    assert out.payload is payload
+    assert out.body_as_json_dict["results"]["data"] != body["results"]["data"]
+    out.body = body
+    assert out.payload is not payload
+    assert json.loads(out.payload)["body"]["results"]["data"] == [["4", "5", "6"]]
+    out.body = json.dumps(body)
+    assert out.body == json.dumps(body)
+    del out.body
+    with pytest.raises(NotInitialized):
+        out.payload  # pylint: disable=pointless-statement
@@ -0,0 +1,134 @@
+"""
+Tests the compiled validation backend
+"""
+import pytest
+
+from ml_wrapper import (
+    ANALYSES_FORMAL,
+    DATA_FORMAL,
+    JSON_ANALYSE_MULTIPLE_TIME_SERIES,
+    JSON_ANALYSE_TEXT,
+    JSON_ANALYSE_TIME_SERIES,
+    JSON_DATA_EXAMPLE,
+    JSON_ML_ANALYSE_TEXT,
+    JSON_ML_DATA_EXAMPLE,
+    TRIGGER_FORMAL,
+)
+from ml_wrapper.bench.validation import benchmark_validation
+from ml_wrapper.messaging import (
+    CompiledSchema,
+    NonSchemaConformJsonPayload,
+    REFERENCED_SCHEMAS,
+    SchemaNotCompilable,
+    ValidationError,
+    ValidatorRegistry,
+    VALIDATOR_REGISTRY,
+    validate_trigger,
+)
+
+EXAMPLES = [
+    JSON_ANALYSE_MULTIPLE_TIME_SERIES,
+    JSON_ANALYSE_TEXT,
+    JSON_ANALYSE_TIME_SERIES,
+    JSON_DATA_EXAMPLE,
+    JSON_ML_ANALYSE_TEXT,
+    JSON_ML_DATA_EXAMPLE,
+]
+
+
+def _is_valid(validate, json_object):
+    try:
+        validate(json_object)
+    except ValidationError:
+        return False
+    return True
+
+
+@pytest.mark.parametrize("schema", [TRIGGER_FORMAL, ANALYSES_FORMAL, DATA_FORMAL])
+@pytest.mark.parametrize("example", EXAMPLES)
+def test_compiled_schema_agrees_with_jsonschema(schema, example):
+    registry = ValidatorRegistry(backend="jsonschema")
+    compiled = CompiledSchema(schema, store=REFERENCED_SCHEMAS)
+    assert _is_valid(compiled, example) == _is_valid(
+        lambda json_object: registry.validate(json_object, schema), example
+    )
+
+
+def test_compiled_schema_errors(json_analyse_time_series):
+    compiled = CompiledSchema(ANALYSES_FORMAL, store=REFERENCED_SCHEMAS)
+    compiled(json_analyse_time_series)
+    json_analyse_time_series["body"]["results"]["data"][0][0] = 1
+    with pytest.raises(ValidationError):
+        compiled(json_analyse_time_series)
+    json_analyse_time_series["body"]["results"]["data"][0][0] = "1"
+    json_analyse_time_series["body"]["unexpected"] = "field"
+    with pytest.raises(ValidationError, match="Additional properties"):
+        compiled(json_analyse_time_series)
+    del json_analyse_time_series["body"]["unexpected"]
+    del json_analyse_time_series["body"]["timestamp"]
+    with pytest.raises(ValidationError, match="'timestamp' is a required property"):
+        compiled(json_analyse_time_series)
+
+
+def test_compiled_schema_keywords():
+    compiled = CompiledSchema(
+        {
+            "type": "object",
+            "properties": {
+                "number": {"type": "number", "minimum": 0, "exclusiveMaximum": 10},
+                "text": {"type": "string", "pattern": "^a", "maxLength": 3},
+                "flag": {"enum": [True, 1.5]},
+                "anything": {"anyOf": [{"type": "null"}, {"const": "x"}]},
+                "never": {"not": {"type": "string"}},
+            },
+            "additionalProperties": {"type": "integer"},
+        }
+    )
+    compiled({"number": 5, "text": "ab", "flag": True, "anything": None, "more": 2})
+    for invalid in [
+        {"number": True},
+        {"number": 10},
+        {"number": -1},
+        {"text": "ba"},
+        {"text": "aaaa"},
+        {"flag": 1},
+        {"anything": "y"},
+        {"never": "text"},
+        {"more": 1.5},
+    ]:
+        with pytest.raises(ValidationError):
+            compiled(invalid)
+
+
+def test_uncompilable_schema_falls_back():
+    schema = {"type": "object", "patternProperties": {"^a": {"type": "string"}}}
+    with pytest.raises(SchemaNotCompilable):
+        CompiledSchema(schema)
+    registry = ValidatorRegistry(backend="compiled")
+    registry.register("pattern", schema)
+    registry.validate({"a": "text"}, schema)
+    with pytest.raises(ValidationError):
+        registry.validate({"a": 1}, schema)
+    assert not registry.statistics()["pattern"]["compiled"]
+
+
+def test_compiled_backend_keeps_error_types(json_ml_analyse_text):
+    backend = VALIDATOR_REGISTRY.backend
+    VALIDATOR_REGISTRY.backend = "compiled"
+    try:
+        VALIDATOR_REGISTRY.warm_up()
+        assert VALIDATOR_REGISTRY.statistics()["trigger"]["compiled"]
+        validate_trigger(json_ml_analyse_text)
+        json_ml_analyse_text["body"]["payload"]["body"] = "corrupt"
+        with pytest.raises(NonSchemaConformJsonPayload):
+            validate_trigger(json_ml_analyse_text)
+    finally:
+        VALIDATOR_REGISTRY.backend = backend
+    with pytest.raises(AssertionError):
+        VALIDATOR_REGISTRY.backend = "unknown"
+
+
+def test_benchmark_validation():
+    results = benchmark_validation(max_cells=100, repeat=1)
+    assert {result["backend"] for result in results} == {"jsonschema", "compiled"}
+    assert {result["cells"] for result in results} == {10, 100}
@@ -0,0 +1,71 @@
+"""
+This module tests the streaming decoder of incoming payloads
+"""
+import json
+import logging
+from json.decoder import JSONDecodeError
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ml_wrapper import IncomingMessage
+from ml_wrapper.messaging.json_handling import insert_columns, stream_decode
+from ml_wrapper.misc import NonSchemaConformJsonPayload
+
+
+@pytest.mark.parametrize(
+    "message",
+    ["text", "sensor", "sensor_axistest", "time_series", "multiple_time_series"],
+)
+def test_streamed_retrieve_equals_parsed(mqtt_fixtures, message):
+    parsed = IncomingMessage(logger=logging.getLogger(__file__))
+    parsed.mqtt_message = mqtt_fixtures[message]
+    streamed = IncomingMessage(logger=logging.getLogger(__file__), stream_threshold=1)
+    streamed.mqtt_message = mqtt_fixtures[message]
+    assert streamed.columns == parsed.columns
+    assert streamed.analyses_message_type == parsed.analyses_message_type
+    expected, retrieved = parsed.retrieved_data, streamed.retrieved_data
+    if isinstance(expected, dict):
+        assert retrieved == expected
+    else:
+        for expected_frame, frame in zip(
+            expected if isinstance(expected, list) else [expected],
+            retrieved if isinstance(retrieved, list) else [retrieved],
+        ):
+            pd.testing.assert_frame_equal(frame, expected_frame)
+    assert streamed.data == parsed.data
+
+
+def test_stream_decode_parses_known_columns(json_ml_data_example):
+    text = json.dumps(json_ml_data_example, indent=2).encode("utf-8")
+    payload, columns = stream_decode(text)
+    path = ("body", "payload", "body")
+    assert list(columns) == [path]
+    assert all(isinstance(values, np.ndarray) for values in columns[path])
+    assert payload["body"]["payload"]["body"]["data"] == [[""], [""]]
+    insert_columns(payload, columns)
+    assert payload["body"]["payload"]["body"]["data"] is columns[path]
+    assert payload["body"]["contract"] == json_ml_data_example["body"]["contract"]
+
+
+def test_stream_decode_data_before_columns(json_ml_analyse_time_series):
+    results = json_ml_analyse_time_series["body"]["payload"]["body"]["results"]
+    results["data"] = results.pop("data")
+    results["columns"] = results.pop("columns")
+    _, columns = stream_decode(json.dumps(json_ml_analyse_time_series))
+    streamed = columns[("body", "payload", "body", "results")]
+    assert streamed == results["data"]
+
+
+def test_stream_decode_checks_the_data(json_ml_data_example):
+    with pytest.raises(JSONDecodeError):
+        stream_decode(json.dumps(json_ml_data_example)[:-1])
+    with pytest.raises(JSONDecodeError):
+        stream_decode(json.dumps(json_ml_data_example) + "{}")
+    json_ml_data_example["body"]["payload"]["body"]["data"][0][0] = 15
+    with pytest.raises(NonSchemaConformJsonPayload):
+        stream_decode(json.dumps(json_ml_data_example))
+    json_ml_data_example["body"]["payload"]["body"]["data"] = ["15"]
+    with pytest.raises(NonSchemaConformJsonPayload):
+        stream_decode(json.dumps(json_ml_data_example))
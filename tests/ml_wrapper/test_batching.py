@@ -0,0 +1,37 @@
+"""
+Tests the micro batching of the ML Wrapper
+"""
+import json
+
+
+def test_batch_tool(ML_MOCK_BATCH_TOOL, mqtt_time_series, mqtt_sensor):
+    with ML_MOCK_BATCH_TOOL as tool:
+        assert tool.dispatcher.is_batching
+        futures = [
+            tool._react_to_message(None, None, message)
+            for message in [mqtt_time_series] * 4 + [mqtt_sensor]
+        ]
+        out_messages = [future.result(timeout=10) for future in futures]
+        assert sorted(tool.batch_sizes) == [1, 4]
+        assert len(tool.out_messages) == 5
+        for out_message, batch_size in zip(out_messages, [4, 4, 4, 4, 1]):
+            body = out_message.body_as_json_dict
+            assert body["results"]["columns"][-1]["name"] == "batch_size"
+            assert body["results"]["data"][-1][0] == str(batch_size)
+        assert json.loads(tool.client.last_published)["body"]["results"]
+
+
+def test_batch_with_wrong_number_of_results(
+    ML_MOCK_BATCH_TOOL, mqtt_time_series, monkeypatch
+):
+    async def run_batch(out_messages):
+        return []
+
+    with ML_MOCK_BATCH_TOOL as tool:
+        monkeypatch.setattr(tool, "run_batch", run_batch)
+        monkeypatch.setattr(tool, "raise_exceptions", False)
+        futures = [
+            tool._react_to_message(None, None, mqtt_time_series) for _ in range(2)
+        ]
+        assert [future.result(timeout=10) for future in futures] == [None, None]
+        assert len(tool.out_messages) == 0
@@ -0,0 +1,18 @@
+"""
+Tests the pipeline benchmark
+"""
+from ml_wrapper.bench.pipeline import SCENARIOS, benchmark_pipeline
+
+
+def test_benchmark_pipeline(tool_patch):
+    report = benchmark_pipeline(rows=10, columns=2, series=3, messages=2, warm_up=1)
+    assert report["format"] == 1
+    assert report["environment"]["pandas"]
+    assert [result["scenario"] for result in report["scenarios"]] == list(SCENARIOS)
+    for result in report["scenarios"]:
+        assert result["failed"] == 0
+        assert result["throughput_per_s"] > 0
+        assert result["latency_ms"]["p50"] <= result["latency_ms"]["p99"]
+        assert {"parse", "validate", "run", "publish"} <= set(result["stages_ms"])
+        assert result["peak_rss_mb"] > 0
+    assert report["scenarios"][2]["series"] == 3
@@ -0,0 +1,37 @@
+"""
+This module tests the model lifecycle of loading and warming up the model at start up
+"""
+import json
+
+import numpy as np
+
+from tests.conftest import LifecycleToolMock
+
+
+def test_model_is_loaded_without_warm_up(tool_patch, json_ml_data_example):
+    with LifecycleToolMock(outgoing_message_is_temporary=True) as tool:
+        assert tool.events == ["load"]
+        assert tool.artifact_cache is None
+        tool.client.mock_a_message(tool.client, json.dumps(json_ml_data_example))
+    assert tool.events == ["load", ("sensor_update", False)]
+
+
+def test_model_warm_up_before_alive(
+    tool_patch, monkeypatch, tmp_path, json_ml_data_example
+):
+    monkeypatch.setenv("CONFIG_WRAPPER_MODEL_WARM_UP", "True")
+    monkeypatch.setenv("CONFIG_WRAPPER_ARTIFACT_CACHE_DIR", str(tmp_path))
+    with LifecycleToolMock(outgoing_message_is_temporary=True) as tool:
+        # Every example payload ran before the tool subscribed and reported alive
+        assert tool.events[0] == "load"
+        assert len(tool.events) == 5
+        assert all(before_alive for _, before_alive in tool.events[1:])
+        assert len(tool.out_messages) == 4
+        # Nothing but the state has been published
+        assert json.loads(tool.client.last_published)["body"]["status"] == "alive"
+        assert isinstance(tool.weights, np.memmap)
+        assert (tmp_path / "weights.npy").exists()
+        assert tool.window_store is None
+        tool.client.mock_a_message(tool.client, json.dumps(json_ml_data_example))
+        assert "results" in json.loads(tool.client.last_published)["body"]
+    assert tool.events[-1] == ("sensor_update", False)
@@ -0,0 +1,72 @@
+"""
+Tests the prometheus metrics of the stages of a message
+"""
+import json
+
+from prometheus_client import REGISTRY
+
+from ml_wrapper import StageTimer
+from tests.conftest import SimpleMock
+
+
+def _sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_stage_timer():
+    now = [0.0]
+    timer = StageTimer(clock=lambda: now[0])
+    for seconds in (1.0, 2.0):
+        with timer.stage("run"):
+            now[0] += seconds
+    timer.add("publish", 0.5)
+    assert timer.durations == {"run": 3.0, "publish": 0.5}
+    before = _sample(
+        "end_to_end_duration_seconds_sum", message_type="test", result_type="text"
+    )
+    timer.observe("test", "text", completed=True)
+    assert not timer.durations
+    assert (
+        _sample(
+            "stage_duration_seconds_sum",
+            stage="run",
+            message_type="test",
+            result_type="text",
+        )
+        >= 3.0
+    )
+    assert (
+        _sample(
+            "end_to_end_duration_seconds_sum", message_type="test", result_type="text"
+        )
+        - before
+        == 3.0
+    )
+
+
+def test_wrapper_reports_the_stages(tool_patch, json_ml_data_example):
+    labels = {"message_type": "sensor_update", "result_type": "time_series"}
+    stages = ("parse", "validate", "retrieve", "run", "resolve_result_data", "publish")
+    before = {
+        stage: _sample("stage_duration_seconds_count", stage=stage, **labels)
+        for stage in stages
+    }
+    end_to_end = _sample("end_to_end_duration_seconds_count", **labels)
+    sizes = {
+        direction: _sample("payload_size_bytes_count", direction=direction)
+        for direction in ("in", "out")
+    }
+    waits = _sample("queue_wait_seconds_count")
+    with SimpleMock(outgoing_message_is_temporary=True) as tool:
+        tool.client.mock_a_message(tool.client, json.dumps(json_ml_data_example))
+        assert len(tool.out_messages) == 1
+    for stage in stages:
+        assert (
+            _sample("stage_duration_seconds_count", stage=stage, **labels)
+            == before[stage] + 1
+        )
+    assert _sample("end_to_end_duration_seconds_count", **labels) == end_to_end + 1
+    for direction, count in sizes.items():
+        assert _sample("payload_size_bytes_count", direction=direction) == count + 1
+    assert _sample("queue_wait_seconds_count") == waits + 1
+    assert _sample("inflight_runs") == 0
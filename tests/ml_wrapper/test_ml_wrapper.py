@@ -25,7 +25,7 @@ def test_react_to_message(ML_MOCK_FFT, mqtt_time_series):
     with ML_MOCK_FFT as ml_mock_fft:
         print(id(ml_mock_fft))
         print(id(ml_mock_fft.async_loop))
-        ml_mock_fft._react_to_message(None, None, mqtt_time_series)
+        ml_mock_fft._react_to_message(None, None, mqtt_time_series).result()
 
 
 def test_instantiate_2(ML_MOCK_FFT):
@@ -39,7 +39,7 @@ def test_react_to_message_2(ML_MOCK_FFT, mqtt_time_series):
     with ML_MOCK_FFT as ml_mock_fft:
         print(id(ml_mock_fft))
         print(id(ml_mock_fft.async_loop))
-        ml_mock_fft._react_to_message(None, None, mqtt_time_series)
+        ml_mock_fft._react_to_message(None, None, mqtt_time_series).result()
 
 
 @pytest.mark.asyncio
@@ -115,7 +115,7 @@ def test_wrong_topic(ML_MOCK_BAD_TOPIC_TOOL, mqtt_time_series, caplog):
             ml_mock_bad_topic_tool._config.get("base_result_topic")
             == "this/isnotcorrect"
         )
-        ml_mock_bad_topic_tool._react_to_message(None, None, mqtt_time_series)
+        ml_mock_bad_topic_tool._react_to_message(None, None, mqtt_time_series).result()
         assert any(
             "undefined topic" in msg and "consider" in msg for msg in caplog.messages
         )
@@ -176,7 +176,7 @@ def test_outgoing_message_is_temporary(
 def test_wrong_resolve_function(ML_MOCK_WRONG_RESOLVE, mqtt_time_series, caplog):
     with pytest.raises(NotInitialized):
         with ML_MOCK_WRONG_RESOLVE as ml_tool:
-            ml_tool._react_to_message(None, None, mqtt_time_series)
+            ml_tool._react_to_message(None, None, mqtt_time_series).result()
     assert any(
         "You need to specify" in rec.message
         for rec in caplog.records
@@ -0,0 +1,105 @@
+"""
+Tests the in-process broker, the load generator and the soak runner
+"""
+import json
+
+from ml_wrapper.bench import sensor_update_payload
+from ml_wrapper.bench.broker import InProcessBroker, InProcessClient
+from ml_wrapper.bench.soak import LoadGenerator, soak
+
+
+def _client(broker, on_message=None):
+    client = InProcessClient(broker)
+    client.connect()
+    client.on_message = on_message
+    return client
+
+
+def test_broker_routes_by_subscription():
+    broker = InProcessBroker()
+    received = []
+    subscriber = _client(
+        broker, lambda client, userdata, message: received.append(message)
+    )
+    subscriber.subscribe("kosmos/analyses/#", 0)
+    subscriber.subscribe("kosmos/+/model/tag", 0)
+    subscriber.loop_start()
+    publisher = _client(broker)
+    acknowledged = []
+    publisher.on_publish = lambda client, userdata, mid: acknowledged.append(mid)
+    info = publisher.publish("kosmos/analyses/contract/temporary", "result")
+    publisher.publish("kosmos/analytics/model/tag", b"trigger")
+    publisher.publish("kosmos/state/model", "ignored")
+    subscriber.loop_stop()
+    assert [message.topic for message in received] == [
+        "kosmos/analyses/contract/temporary",
+        "kosmos/analytics/model/tag",
+    ]
+    assert received[0].payload == b"result"
+    assert acknowledged == [info.mid, info.mid + 1, info.mid + 2]
+    assert broker.routed == 3
+
+
+def test_broker_retains_and_drops():
+    broker = InProcessBroker(max_queued=1)
+    publisher = _client(broker)
+    publisher.publish("kosmos/state", "alive", retain=True)
+    subscriber = _client(broker)
+    subscriber.subscribe("kosmos/#", 0)
+    assert subscriber.queued == 1
+    publisher.publish("kosmos/state", "running")
+    assert broker.dropped == 1
+    subscriber.disconnect()
+    publisher.publish("kosmos/state", "gone")
+    assert broker.dropped == 1
+    publisher.disconnect()
+    assert publisher.publish("kosmos/state", "offline").rc != 0
+
+
+def test_load_generator_measures_results():
+    broker = InProcessBroker()
+
+    def echo(client, userdata, message):
+        contract = json.loads(message.payload)["body"]["contract"]
+        # Every second trigger gets no result
+        if int(contract.split("-")[1]) % 2:
+            client.publish(f"kosmos/analyses/{contract}/temporary", "{}")
+
+    tool = _client(broker, echo)
+    tool.subscribe("kosmos/analytics/model/tag", 0)
+    tool.loop_start()
+    client = _client(broker)
+    client.loop_start()
+    generator = LoadGenerator(
+        client,
+        "kosmos/analytics/model/tag",
+        sensor_update_payload(2),
+        rate=100,
+        jitter=0.5,
+        burst_size=5,
+        burst_every=0.1,
+        result_timeout=0.2,
+        seed=1,
+    )
+    generator.start()
+    snapshots = []
+    result = generator.run(0.3, report_interval=0.1, report=snapshots.append)
+    tool.loop_stop()
+    client.loop_stop()
+    assert snapshots
+    assert result["sent"] == result["received"] + result["dropped"]
+    assert result["received"] == (result["sent"] + 1) // 2
+    assert result["pending"] == 0
+    assert result["unexpected"] == 0
+    assert result["lag_ms_overall"]["max"] >= result["lag_ms_overall"]["mean"] > 0
+    assert len(result["rss_mb"]) == len(snapshots) + 1
+
+
+def test_soak(tool_patch):
+    report = soak(duration=1.0, rate=10, rows=10, report_interval=0.5)
+    assert report["tool"] == "EchoTool"
+    assert report["broker_dropped"] == 0
+    result = report["result"]
+    assert result["sent"] >= 5
+    assert result["received"] == result["sent"]
+    assert result["dropped"] == 0
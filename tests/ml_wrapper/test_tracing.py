@@ -0,0 +1,92 @@
+"""
+Tests the tracing of the messages
+"""
+import json
+from unittest.mock import Mock
+
+import pytest
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+from ml_wrapper import (
+    FileSpanExporter,
+    Span,
+    SpanContext,
+    generate_mqtt_message_mock,
+)
+from ml_wrapper.misc import ConfigNotValid
+from tests.conftest import SimpleMock
+
+
+def test_traceparent():
+    context = SpanContext("4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7")
+    assert context.traceparent == (
+        "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+    )
+    assert SpanContext.from_traceparent(context.traceparent) == context
+    for invalid in ("", "00-123-456-01", "00-" + "0" * 32 + "-00f067aa0ba902b7-01"):
+        assert SpanContext.from_traceparent(invalid) is None
+    properties = Properties(PacketTypes.PUBLISH)
+    properties.UserProperty = ("traceparent", context.traceparent)
+    assert SpanContext.from_properties(properties) == context
+    assert SpanContext.from_properties(None) is None
+
+
+def test_file_exporter(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    exporter = FileSpanExporter(str(path), service_name="model/tag")
+    span = Span("run", "a" * 32, "b" * 16, "c" * 16, 1, 2, {"machine": None, "x": 1})
+    exporter.export([span])
+    exporter.export([span._replace(parent_id=None, ok=False)])
+    exporter.shutdown()
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(lines) == 2
+    otlp = lines[0]["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+    assert otlp["parentSpanId"] == "c" * 16
+    assert otlp["attributes"] == [{"key": "x", "value": {"stringValue": "1"}}]
+    assert otlp["startTimeUnixNano"] == "1"
+    second = lines[1]["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+    assert "parentSpanId" not in second
+    assert second["status"] == {"code": 2}
+
+
+def test_wrapper_continues_the_trace(tool_patch, monkeypatch, json_ml_data_example):
+    monkeypatch.setenv("CONFIG_WRAPPER_TRACE_EXPORTER", "memory")
+    monkeypatch.setenv("CONFIG_MQTT_PROTOCOL", "5")
+    parent = SpanContext("4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7")
+    message = generate_mqtt_message_mock(message=json.dumps(json_ml_data_example))
+    message.properties = Properties(PacketTypes.PUBLISH)
+    message.properties.UserProperty = ("traceparent", parent.traceparent)
+    with SimpleMock(outgoing_message_is_temporary=True) as tool:
+        tool.client.publish = Mock(wraps=tool.client.publish)
+        tool._react_to_message(tool.client, None, message).result(timeout=10)
+        spans = tool.tracer.exporter.spans
+        root = spans[0]
+        assert root.name == "handle_message"
+        assert root.ok
+        assert root.trace_id == parent.trace_id
+        assert root.parent_id == parent.span_id
+        assert root.attributes["message.type"] == "sensor_update"
+        stages = {span.name: span for span in spans[1:]}
+        assert {"parse", "validate", "retrieve", "run", "publish"} <= set(stages)
+        for span in spans[1:]:
+            assert span.trace_id == root.trace_id
+            assert span.parent_id == root.span_id
+            assert root.start_ns <= span.start_ns <= span.end_ns <= root.end_ns
+        assert stages["run"].end_ns - stages["run"].start_ns >= 1e9
+        # The next tool continues the trace
+        _, kwargs = tool.client.publish.call_args
+        assert SpanContext.from_properties(kwargs["properties"]) == SpanContext(
+            root.trace_id, root.span_id
+        )
+        # A message without a traceparent starts a new trace
+        tool.tracer.exporter.clear()
+        tool.client.mock_a_message(tool.client, json.dumps(json_ml_data_example))
+        assert tool.tracer.exporter.spans[0].trace_id != parent.trace_id
+        assert tool.tracer.exporter.spans[0].parent_id is None
+
+
+def test_wrapper_rejects_invalid_exporter(tool_patch, monkeypatch):
+    monkeypatch.setenv("CONFIG_WRAPPER_TRACE_EXPORTER", "jaeger")
+    with pytest.raises(ConfigNotValid):
+        SimpleMock()
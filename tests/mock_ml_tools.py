@@ -4,12 +4,20 @@ This module implements a basic ML Wrapper Mock
 # pylint: disable=wrong-import-position
 from typing import Union, List
 import logging
+import os
 
 import asyncio
+import numpy as np
 import pandas as pd
 
 
-from ml_wrapper import MLWrapper, OutgoingMessage
+from ml_wrapper import (
+    MLWrapper,
+    OutgoingMessage,
+    ProcessMessage,
+    RunningMax,
+    RunningMean,
+)
 
 
 class FFT(MLWrapper):
@@ -126,3 +134,102 @@ class WrongResolve(FFT):
         out_message: OutgoingMessage,
     ) -> OutgoingMessage:
         return out_message
+
+
+class ProcessTool(MLWrapper):
+    """Mock for a CPU bound tool running in the process pool"""
+
+    async def run(
+        self, out_message: OutgoingMessage
+    ) -> Union[pd.DataFrame, List[pd.DataFrame], dict]:
+        """Run method implementation, which is replaced by the process pool"""
+        return "Not used"
+
+    @staticmethod
+    def run_sync(
+        message: ProcessMessage,
+    ) -> Union[pd.DataFrame, List[pd.DataFrame], dict]:
+        """Run method implementation in the worker process"""
+        dataframe = message.retrieved_data
+        dataframe["pid"] = os.getpid()
+        dataframe["machine"] = message.machine
+        return dataframe
+
+
+class BatchTool(MLWrapper):
+    """Mock for a tool running on batches of messages"""
+
+    def __init__(self, *args, **kwargs):
+        """Constructor"""
+        self.batch_sizes = []
+        super().__init__(*args, **kwargs)
+
+    async def run(
+        self, out_message: OutgoingMessage
+    ) -> Union[pd.DataFrame, List[pd.DataFrame], dict]:
+        """Run method implementation, which is replaced by run_batch"""
+        return "Not used"
+
+    async def run_batch(
+        self, out_messages: List[OutgoingMessage]
+    ) -> List[Union[pd.DataFrame, List[pd.DataFrame], dict]]:
+        """Runs once for all messages of the batch"""
+        self.batch_sizes.append(len(out_messages))
+        frames = [out_message.in_message.retrieved_data for out_message in out_messages]
+        batch = pd.concat(frames, keys=range(len(frames)))
+        batch["batch_size"] = len(frames)
+        return [batch.loc[key] for key in range(len(frames))]
+
+
+class WindowTool(MLWrapper):
+    """Mock for a tool running on the sliding window and the features of a sensor"""
+
+    aggregators = {
+        "mean": RunningMean("value", window=10),
+        "max": RunningMax("value", window=10),
+    }
+
+    def __init__(self, *args, **kwargs):
+        """Constructor"""
+        self.window_lengths = []
+        self.features = []
+        super().__init__(*args, **kwargs)
+
+    async def run(
+        self, out_message: OutgoingMessage
+    ) -> Union[pd.DataFrame, List[pd.DataFrame], dict]:
+        """Run method implementation returning the latest row of the window"""
+        window = out_message.in_message.window
+        self.window_lengths.append(len(window) if window is not None else None)
+        self.features.append(out_message.in_message.features)
+        if window is None:
+            return out_message.in_message.retrieved_data
+        return window.iloc[-1:].copy()
+
+
+class LifecycleTool(MLWrapper):
+    """Mock for a tool loading its model from the artifact cache"""
+
+    def __init__(self, *args, **kwargs):
+        """Constructor"""
+        self.events = []
+        self.weights = None
+        super().__init__(*args, **kwargs)
+
+    async def load_model(self) -> None:
+        """Loads the weights of the model"""
+        self.events.append("load")
+        if self.artifact_cache is not None:
+            self.weights = self.artifact_cache.get(
+                "weights", build=lambda: np.arange(4, dtype=np.float64)
+            )
+
+    async def run(
+        self, out_message: OutgoingMessage
+    ) -> Union[pd.DataFrame, List[pd.DataFrame], dict]:
+        """Run method implementation recording the message type and the state"""
+        self.events.append(
+            (out_message.in_message.message_type.value, self.state is None)
+        )
+        weights = self.weights if self.weights is not None else np.zeros(4)
+        return pd.DataFrame({"weights": weights})
@@ -1,16 +1,25 @@
 """
 This file provides tests for the helper file
 """
+import datetime
+import json
+
+import numpy as np
 import pandas
 import pytest
 from ml_wrapper import MessageType, ResultType, InvalidTopic
-from ml_wrapper.misc import topic_splitter, find_result_type
+from ml_wrapper.misc import JsonCodec, topic_splitter, find_result_type
 
 from ml_wrapper.messaging import (
     NonSchemaConformJsonPayload,
+    ValidationError,
+    ValidatorRegistry,
+    VALIDATOR_REGISTRY,
     validate_formal,
+    validate_formal_single,
     validate_trigger,
 )
+from ml_wrapper.messaging.json_handling.json_validator import MAX_UNREGISTERED_SCHEMAS
 
 # ----
 # Tests for the helper module
@@ -83,3 +92,100 @@ def test_validate_trigger(
     json_ml_analyse_text["body"]["payload"]["body"] = "corrupt"
     with pytest.raises(NonSchemaConformJsonPayload):
         validate_trigger(json_ml_analyse_text)
+
+
+def test_validator_registry_reuses_validators(json_ml_data_example):
+    before = VALIDATOR_REGISTRY.statistics()["trigger"]
+    validate_trigger(json_ml_data_example)
+    validate_trigger(json_ml_data_example)
+    after = VALIDATOR_REGISTRY.statistics()["trigger"]
+    assert after["hits"] == before["hits"] + 2
+    assert after["validations"] == before["validations"] + 2
+    assert after["seconds"] > before["seconds"]
+
+
+def test_validator_registry_user_schema():
+    registry = ValidatorRegistry()
+    schema = {"type": "object", "required": ["value"]}
+    registry.register("user", schema)
+    registry.warm_up()
+    registry.validate({"value": 1}, schema)
+    with pytest.raises(ValidationError):
+        registry.validate({}, schema)
+    assert registry.statistics()["user"]["validations"] == 2
+    unregistered = {"type": "string"}
+    validate_formal_single('"text"', against=unregistered)
+    validate_formal_single('"text"', against=unregistered)
+    assert any(
+        name.startswith("schema-") and stats["hits"] == 1
+        for name, stats in VALIDATOR_REGISTRY.statistics().items()
+    )
+
+
+def test_validator_registry_bounds_unregistered_schemas():
+    registry = ValidatorRegistry()
+    registered = len(registry.statistics())
+    for maximum in range(2 * MAX_UNREGISTERED_SCHEMAS):
+        registry.validate(1, {"type": "integer", "maximum": maximum + 1})
+    assert len(registry.statistics()) == registered + MAX_UNREGISTERED_SCHEMAS
+    schema = {"type": "integer", "maximum": 0}
+    with pytest.raises(ValidationError):
+        registry.validate(1, schema)
+    # A schema with the same content reuses the validator, a changed schema gets its own
+    registry.validate(0, {"type": "integer", "maximum": 0})
+    schema["maximum"] = 5
+    registry.validate(1, schema)
+    hits = [
+        stats["hits"]
+        for name, stats in registry.statistics().items()
+        if name.startswith("schema-")
+    ]
+    assert sorted(hits)[-1] == 1
+
+
+# ----
+# Tests for the json codec
+# ----
+
+
+@pytest.mark.parametrize("backend", ["json", "orjson"])
+def test_json_codec(backend):
+    pytest.importorskip(backend)
+    codec = JsonCodec(backend)
+    assert codec.backend == backend
+    value = {
+        "array": np.arange(3),
+        "float": np.float64(0.5),
+        "time": datetime.datetime(2020, 1, 20, 10, 10),
+        "timestamp": pandas.Timestamp("2020-01-20T10:10:00Z"),
+        "text": "ü",
+    }
+    serialised = codec.dumps(value)
+    assert isinstance(serialised, str)
+    assert codec.dumps_bytes(value) == serialised.encode("utf-8")
+    assert codec.loads(serialised) == {
+        "array": [0, 1, 2],
+        "float": 0.5,
+        "time": "2020-01-20T10:10:00",
+        "timestamp": "2020-01-20T10:10:00+00:00",
+        "text": "ü",
+    }
+    assert codec.loads(serialised.encode("utf-8")) == codec.loads(serialised)
+    assert codec.dumps({"a": object()}, default=lambda _: "default") == (
+        '{"a":"default"}'
+    )
+    assert codec.dumps({"b": {"d": 1, "c": 2}, "a": 3}, sort_keys=True) == (
+        '{"a":3,"b":{"c":2,"d":1}}'
+    )
+    with pytest.raises(TypeError):
+        codec.dumps({"a": object()})
+    with pytest.raises(json.JSONDecodeError):
+        codec.loads("{")
+    with pytest.raises(TypeError):
+        codec.loads({})
+
+
+def test_json_codec_backends():
+    assert JsonCodec().backend in ("json", "orjson")
+    with pytest.raises(AssertionError):
+        JsonCodec("ujson")